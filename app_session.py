@@ -0,0 +1,151 @@
+"""
+Long-lived HP Smart session: attach instead of relaunching.
+
+Every run used to start with {VK_LWIN}HP Smart{ENTER} and a wait of up to
+30s for the main window, even when HP Smart was already open. AppSession
+attaches to a running HP Smart, reuses an HP account window that still shows
+the signup form, and only launches the app or walks the account flyout when
+it has to. reset() returns the app to its home state between flows (leftover
+HP account windows closed, cached handles dropped), so a batch keeps one
+warm app for all of its accounts.
+
+Each phase is timed and startup_summary() is logged next to the wait
+summary; with psutil installed it also covers the interpreter start and the
+imports before it. HP_SMART_SESSION=relaunch restores the old behaviour of
+launching and opening the form on every run.
+"""
+import os
+import threading
+import time
+
+from flows import FLOWS, run_flow
+from locator import HP_ACCOUNT_TITLE, HP_SMART_TITLE, LOCATOR
+from step_log import log_step
+from ui_backend import Desktop, keyboard
+from waits import control_exists, wait_until, window_exists
+
+
+# The first control the signup flow fills; an account window showing it is reused
+SIGNUP_PAGE = next(s.target for s in FLOWS["signup_form"].steps if s.target is not None)
+MAX_CLOSE = 10
+
+
+def process_started():
+    """Wall-clock start of this process, or None without psutil."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process(os.getpid()).create_time()
+
+
+class AppSession:
+    """Attach to (or launch) HP Smart once and keep it warm across flows."""
+
+    def __init__(self, relaunch=False, launch_timeout=30, clock=time.perf_counter):
+        self.relaunch = relaunch
+        self.launch_timeout = launch_timeout
+        self.clock = clock
+        self.timings = {}
+        self.stats = {"attached": 0, "launched": 0, "warm": 0, "opened": 0, "closed": 0}
+        self.ready_after = None  # seconds from process start to the first ready form
+        self._lock = threading.Lock()
+
+    def _timed(self, phase, started):
+        elapsed = self.clock() - started
+        with self._lock:
+            self.timings.setdefault(phase, []).append(elapsed)
+        return elapsed
+
+    def start(self):
+        """Desktop with HP Smart running (attached if it already was), or None if it never started."""
+        started = self.clock()
+        desktop = Desktop(backend="uia")
+        if not self.relaunch and window_exists(desktop, HP_SMART_TITLE)():
+            self.stats["attached"] += 1
+            log_step(f"Attached to running HP Smart ({self._timed('attach', started):.2f}s).")
+            return desktop
+
+        keyboard.send_keys("{VK_LWIN}HP Smart{ENTER}")
+        log_step("Sent keys to launch HP Smart app.")
+        if not wait_until(window_exists(desktop, HP_SMART_TITLE), timeout=self.launch_timeout,
+                          name="hp_smart_started"):
+            log_step("HP Smart did not start.", "FAIL")
+            return None
+        self.stats["launched"] += 1
+        log_step(f"Launched HP Smart ({self._timed('launch', started):.2f}s).")
+        return desktop
+
+    def open_signup(self, desktop):
+        """Show an HP account signup form: the open one if there is one, else via the flyout."""
+        started = self.clock()
+        account = desktop.window(title_re=HP_ACCOUNT_TITLE)
+        if not self.relaunch and control_exists(account.child_window(**SIGNUP_PAGE.criteria()))():
+            self.stats["warm"] += 1
+            log_step(f"Reusing the open signup form ({self._timed('warm_form', started):.2f}s).")
+        else:
+            self.reset(desktop)
+            if not run_flow(FLOWS["open_create_account"], desktop):
+                return False
+            self.stats["opened"] += 1
+            self._timed("open_form", started)
+        self._mark_ready()
+        return True
+
+    def reset(self, desktop=None):
+        """Close leftover HP account windows; HP Smart itself stays open. Returns how many closed."""
+        desktop = desktop or Desktop(backend="uia")
+        account = desktop.window(title_re=HP_ACCOUNT_TITLE)
+        closed = 0
+        while closed < MAX_CLOSE and account.exists(timeout=0):
+            account.close()
+            closed += 1
+        if closed:
+            self.stats["closed"] += closed
+            LOCATOR.invalidate()
+            log_step(f"Closed {closed} leftover HP account window(s).", "INFO")
+        return closed
+
+    def _mark_ready(self):
+        if self.ready_after is None:
+            born = process_started()
+            if born is not None:
+                self.ready_after = time.time() - born
+
+    def summary(self):
+        """One-line startup summary, suitable for log_step()."""
+        with self._lock:
+            timings = {phase: list(times) for phase, times in self.timings.items()}
+        parts = [f"{phase} {sum(times) / len(times):.2f}s x{len(times)}" for phase, times in timings.items()]
+        ready = "n/a" if self.ready_after is None else f"{self.ready_after:.2f}s"
+        return (f"Startup: process to first form {ready} | {' | '.join(parts) or 'none'} | "
+                f"attached {self.stats['attached']} | launched {self.stats['launched']} | "
+                f"windows closed {self.stats['closed']}")
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE SESSION
+# -------------------------------------------------------------
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    """The process-wide AppSession (HP_SMART_SESSION=relaunch to always launch)."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = AppSession(relaunch=os.environ.get("HP_SMART_SESSION", "attach") == "relaunch")
+        return _SESSION
+
+
+def set_session(session):
+    """Install `session` (None: a fresh one on next use); returns the previous one."""
+    global _SESSION
+    with _SESSION_LOCK:
+        previous, _SESSION = _SESSION, session
+    return previous
+
+
+def startup_summary():
+    return get_session().summary()
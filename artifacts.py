@@ -0,0 +1,262 @@
+"""
+Failure artifacts: what the UI looked like when a step failed.
+
+Dumping the control tree on every step (print_control_identifiers) is far
+too slow to leave on, so a failed run used to leave nothing but the
+exception text. FailureCapture keeps a bounded ring buffer of what is cheap
+to keep: the latest step-log events, breadcrumbs from remember() and, through
+the locator, the control indexes the flows already built. When a step event
+ends in FAIL it freezes the failing run's part of that buffer and reads the
+UI right there, before a retry or the app session reset can change it; a
+background thread only encodes the data and writes it as one compressed zip:
+
+  events.json       the run's ring buffer entries up to the failure
+  locator.json      cached control indexes (no UI calls)
+  ui_tree.json      a fresh capture of the HP Smart / HP account windows
+  screenshot.png    the desktop, when Pillow's ImageGrab works here
+  driver<N>.html/.png  page source and screenshot of Selenium sessions in use
+
+Happy runs pay one deque append per event. ARTIFACTS_MAX_PER_RUN caps the
+captures per run, ARTIFACTS_MAX_MB the directory size and ARTIFACTS_KEEP_DAYS
+how long zips are kept; the oldest go first. ARTIFACTS_DIR (default
+artifacts/) moves them and ARTIFACTS=0 turns the capture off.
+"""
+import atexit
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from step_log import add_listener, get_recorder, remove_listener
+
+
+RING_SIZE = 256
+MIN_GAP = 2.0  # seconds; one failure fails several nested steps
+
+_SAFE = re.compile(r"[^\w.-]+")
+
+
+# -------------------------------------------------------------
+#  SOURCES (run on the failing thread, only after a failure; values
+#  that are not str/bytes are encoded on the writer thread)
+# -------------------------------------------------------------
+_DRIVERS = []
+_DRIVERS_LOCK = threading.Lock()
+
+
+@contextmanager
+def watch_driver(driver):
+    """Include `driver`'s page source and screenshot in artifacts while the block runs."""
+    with _DRIVERS_LOCK:
+        _DRIVERS.append(driver)
+    try:
+        yield driver
+    finally:
+        with _DRIVERS_LOCK:
+            _DRIVERS.remove(driver)
+
+
+def locator_source():
+    from locator import LOCATOR
+    return {"locator.json": LOCATOR.snapshot()}
+
+
+def ui_tree_source():
+    import ui_snapshot
+    return {"ui_tree.json": ui_snapshot.capture()}
+
+
+def screenshot_source():
+    try:
+        from PIL import ImageGrab
+    except ImportError:
+        return {}
+    return {"screenshot.png": ImageGrab.grab()}
+
+
+def driver_source():
+    with _DRIVERS_LOCK:
+        drivers = list(_DRIVERS)
+    files = {}
+    for i, driver in enumerate(drivers):
+        files[f"driver{i}.html"] = f"<!-- {driver.current_url} -->\n{driver.page_source}"
+        files[f"driver{i}.png"] = driver.get_screenshot_as_png()
+    return files
+
+
+DEFAULT_SOURCES = {"locator": locator_source, "ui_tree": ui_tree_source,
+                   "screenshot": screenshot_source, "drivers": driver_source}
+
+
+# -------------------------------------------------------------
+#  CAPTURE
+# -------------------------------------------------------------
+class FailureCapture:
+    """Ring buffer of recent events, dumped to a zip on a FAIL event."""
+
+    def __init__(self, directory="artifacts", ring_size=RING_SIZE, max_bytes=100 * 2**20, keep_days=7,
+                 max_per_run=3, sources=None, min_gap=MIN_GAP, clock=time.time):
+        self.directory = os.path.abspath(directory)
+        self.ring = deque(maxlen=ring_size)
+        self.max_bytes = max_bytes
+        self.keep_days = keep_days
+        self.max_per_run = max_per_run
+        self.sources = dict(DEFAULT_SOURCES if sources is None else sources)
+        self.min_gap = min_gap
+        self.clock = clock
+        self.written = []
+        self._per_run = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifacts")
+
+    def remember(self, kind, **data):
+        """Keep a breadcrumb (a URL, a window title) for the current run's next failure dump."""
+        self.ring.append(dict(data, kind=kind, ts=round(self.clock(), 6),
+                              run=get_recorder().current_run_id()))
+
+    def on_event(self, event):
+        """step_log listener."""
+        self.ring.append(event)
+        if event.get("status") == "FAIL":
+            self.capture(event)
+
+    def _due(self, run, now):
+        with self._lock:
+            if self._per_run.get(run, 0) >= self.max_per_run or now - self._last.get(run, -1e9) < self.min_gap:
+                return False
+            self._per_run[run] = self._per_run.get(run, 0) + 1
+            self._last[run] = now
+            return True
+
+    def capture(self, event):
+        """Freeze `event`'s run and the UI now; encode and write the artifacts in the background."""
+        now = self.clock()
+        run = event.get("run")
+        if not self._due(run, now):
+            return None
+        events = [e for e in list(self.ring) if e.get("run") == run]
+        files, report = self._collect()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        name = _SAFE.sub("_", f"{stamp}_{run}_{event.get('step') or 'log'}")[:120] + ".zip"
+        future = self._executor.submit(self._write, name, event, events, files, report)
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()] + [future]
+        return future
+
+    def _collect(self):
+        files, report = {}, {}
+        for source_name, source in self.sources.items():
+            started = time.perf_counter()
+            entry = report[source_name] = {}
+            try:
+                produced = source()
+                files.update(produced)
+                entry["files"] = sorted(produced)
+            except Exception as e:
+                entry["error"] = f"{type(e).__name__}: {e}"
+            entry["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return files, report
+
+    def _write(self, name, event, events, files, report):
+        import zipfile
+        files = {filename: _encode(data) for filename, data in files.items()}
+        files["events.json"] = json.dumps(events, indent=1)
+        files["failure.json"] = json.dumps({"event": event, "sources": report}, indent=1)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp = path + ".tmp"
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for filename, data in files.items():
+                # PNGs are compressed already
+                kind = zipfile.ZIP_STORED if filename.endswith(".png") else zipfile.ZIP_DEFLATED
+                zf.writestr(filename, data, compress_type=kind)
+        os.replace(tmp, path)
+        self.written.append(path)
+        self.prune()
+        return path
+
+    def prune(self):
+        """Delete zips past keep_days, then the oldest until the directory fits in max_bytes."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".zip")]
+        except FileNotFoundError:
+            return []
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        cutoff = self.clock() - self.keep_days * 86400
+        total = sum(e.stat().st_size for e in entries)
+        removed = []
+        for e in entries:
+            if e.stat().st_mtime >= cutoff and total <= self.max_bytes:
+                break
+            total -= e.stat().st_size
+            os.remove(e.path)
+            removed.append(e.path)
+        return removed
+
+    def flush(self, timeout=None):
+        """Wait for pending dumps; return the paths written so far."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result(timeout=timeout)
+        return list(self.written)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _encode(data):
+    if isinstance(data, (str, bytes)):
+        return data
+    if hasattr(data, "save"):  # a PIL image
+        buf = io.BytesIO()
+        data.save(buf, format="PNG")
+        return buf.getvalue()
+    return json.dumps(data, indent=1)
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE CAPTURE
+# -------------------------------------------------------------
+_CAPTURE = None
+_CAPTURE_LOCK = threading.Lock()
+
+
+def install():
+    """Start capturing failures of this process (configured from ARTIFACTS_*); idempotent."""
+    global _CAPTURE
+    with _CAPTURE_LOCK:
+        if _CAPTURE is None and os.environ.get("ARTIFACTS", "1") != "0":
+            _CAPTURE = FailureCapture(
+                directory=os.environ.get("ARTIFACTS_DIR", "artifacts"),
+                max_bytes=float(os.environ.get("ARTIFACTS_MAX_MB", "100")) * 2**20,
+                keep_days=float(os.environ.get("ARTIFACTS_KEEP_DAYS", "7")),
+                max_per_run=int(os.environ.get("ARTIFACTS_MAX_PER_RUN", "3")),
+            )
+            add_listener(_CAPTURE.on_event)
+            atexit.register(_CAPTURE.close)
+        return _CAPTURE
+
+
+def uninstall():
+    global _CAPTURE
+    with _CAPTURE_LOCK:
+        capture, _CAPTURE = _CAPTURE, None
+    if capture is not None:
+        remove_listener(capture.on_event)
+        capture.close()
+    return capture
+
+
+def remember(kind, **data):
+    """Breadcrumb for the installed capture; a no-op when none is installed."""
+    if _CAPTURE is not None:
+        _CAPTURE.remember(kind, **data)
@@ -0,0 +1,313 @@
+"""
+Batch signup runner.
+
+Creates N accounts with a pool of worker threads. Identity generation and
+OTP fetching run fully in parallel; the desktop-UI stages (filling the
+signup form and entering the OTP) hold UI_LOCK because HP Smart has a
+single foreground window. Stages with `ui_exclusive` set keep UI_LOCK from
+form submission until the OTP is entered, because the HP account page of
+one signup occupies that window until it is verified. Every finished
+account is appended to a JSONL results file as soon as it completes. With
+--ledger, each completed stage is also recorded in a SQLite ledger
+(ledger.py), and --resume picks up the accounts a crashed or failed run
+left half-finished. --preflight checks the flows' selectors against a UI
+snapshot (ui_snapshot.py) before anything runs.
+
+    python batch_runner.py -n 100 -c 8 -o batch_results.jsonl
+    python batch_runner.py -n 1000 -c 64 --stub    # stubbed UI + mail backends
+    python batch_runner.py -n 0 --ledger batch.sqlite --resume   # finish interrupted accounts
+    python batch_runner.py -n 1000 -c 8 --preflight hp_smart.json  # abort on broken selectors
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import artifacts
+from identity import DEFAULT_PASSWORD, next_identity
+from ledger import Ledger, reached
+from pipeline import start_otp_watch
+from resilience import pause_while_open, retry_stage
+from step_log import get_recorder
+
+
+UI_LOCK = threading.Lock()
+
+
+# -------------------------------------------------------------
+#  STAGES
+# -------------------------------------------------------------
+class DesktopSignupStages:
+    """Real stages, backed by the functions in test_otpfinal.py."""
+
+    # One HP account page per desktop: submit and verify cannot interleave
+    ui_exclusive = True
+
+    def __init__(self, max_wait=90, poll_interval=3):
+        import test_otpfinal
+        self.flow = test_otpfinal
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+
+    def new_identity(self):
+        return next_identity().as_dict()
+
+    def submit_form(self, identity):
+        desktop = retry_stage("launch_hp_smart", self.flow.launch_hp_smart)
+        if not desktop:
+            return False
+        return self.flow.submit_account_form(
+            desktop, identity["first_name"], identity["last_name"], identity["email"], identity["password"]
+        )
+
+    def fetch_otp(self, identity):
+        return self.flow.fetch_otp_from_mailsac(
+            identity["mailbox"], max_wait=self.max_wait, poll_interval=self.poll_interval
+        )
+
+    def verify(self, identity, otp):
+        return self.flow.complete_web_verification_in_app(otp)
+
+
+class StubSignupStages:
+    """
+    Stand-in stages with fixed latencies, for measuring runner throughput
+    without HP Smart or a mail service.
+    """
+
+    ui_exclusive = False
+
+    def __init__(self, ui_latency=0.05, mail_latency=0.5, fail_every=0):
+        self.ui_latency = ui_latency
+        self.mail_latency = mail_latency
+        self.fail_every = fail_every
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def new_identity(self):
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        mailbox = f"stub.user.{n:06d}test"
+        return {"first_name": "Stub", "last_name": f"User{n}", "email": f"{mailbox}@mailsac.com",
+                "mailbox": mailbox, "password": DEFAULT_PASSWORD}
+
+    def submit_form(self, identity):
+        time.sleep(self.ui_latency)
+        return True
+
+    def fetch_otp(self, identity):
+        time.sleep(self.mail_latency)
+        n = int(identity["mailbox"].split(".")[-1][:6])
+        if self.fail_every and n % self.fail_every == 0:
+            return None
+        return f"{n % 1000000:06d}"
+
+    def verify(self, identity, otp):
+        time.sleep(self.ui_latency)
+        return True
+
+
+# -------------------------------------------------------------
+#  RESULTS
+# -------------------------------------------------------------
+class JsonlWriter:
+    """Append-only JSONL writer shared by all workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True) + "\n"
+        with self._lock:
+            self._fh.write(line)
+            self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+# -------------------------------------------------------------
+#  RUNNER
+# -------------------------------------------------------------
+@contextmanager
+def _hold(lock, timings):
+    t = time.monotonic()
+    with lock:
+        timings["ui_wait"] = timings.get("ui_wait", 0.0) + time.monotonic() - t
+        yield
+
+
+def run_account(index, stages, ui_lock=UI_LOCK, ledger=None, resume=None):
+    """
+    Run one signup end to end and return its result record.
+
+    The mailbox watch starts before the UI stage, so OTP polling overlaps
+    with waiting for UI_LOCK and filling the form; `fetch_otp` in the
+    timings is only the time spent blocked on it afterwards.
+
+    With a `ledger`, every completed stage is recorded. `resume` is a
+    Ledger.resumable() row: its identity is reused and the stages it already
+    completed are skipped.
+    """
+    started = time.monotonic()
+    timings = {}
+    run_id = get_recorder().start_run(worker_id=threading.current_thread().name)
+    result = {"index": index, "run_id": run_id, "status": "FAIL", "stage": "identity"}
+    exclusive = getattr(stages, "ui_exclusive", False)
+    identity = done = otp = otp_future = None
+
+    def ui_stage():
+        return nullcontext() if exclusive else _hold(ui_lock, timings)
+
+    def completed(stage, **fields):
+        if ledger is not None:
+            ledger.advance(identity["mailbox"], stage, **fields)
+
+    try:
+        if resume is None:
+            identity = stages.new_identity()
+        else:
+            identity, done, otp = resume["identity"], resume["stage"], resume["otp"]
+            result.update(stage=done, resumed_from=done)
+        result.update(email=identity["email"], mailbox=identity["mailbox"])
+        if ledger is not None:
+            ledger.begin(identity, run_id)
+        if not otp:
+            otp_future = start_otp_watch(lambda _mailbox: stages.fetch_otp(identity), identity["mailbox"])
+
+        with _hold(ui_lock, timings) if exclusive else nullcontext():
+            if not reached(done, "submit_form"):
+                with ui_stage():
+                    t = time.monotonic()
+                    submitted = stages.submit_form(identity)
+                    timings["submit_form"] = time.monotonic() - t
+                result["stage"] = "submit_form"
+                if not submitted:
+                    return result
+                completed("submit_form")
+
+            if not otp:
+                t = time.monotonic()
+                otp = otp_future.result()
+                timings["fetch_otp"] = time.monotonic() - t
+                result["stage"] = "fetch_otp"
+                if not otp:
+                    return result
+                completed("fetch_otp", otp=otp)
+
+            with ui_stage():
+                t = time.monotonic()
+                verified = stages.verify(identity, otp)
+                timings["verify"] = time.monotonic() - t
+            result["stage"] = "verify"
+            if verified:
+                result["status"] = "PASS"
+                completed("verify")
+            return result
+
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    finally:
+        if otp_future is not None:
+            otp_future.cancel()  # a no-op once the OTP arrived; stops the poll otherwise
+        result["elapsed"] = round(time.monotonic() - started, 4)
+        result["timings"] = {k: round(v, 4) for k, v in timings.items()}
+        if ledger is not None and identity is not None:
+            ledger.finish(identity["mailbox"], result["status"], result.get("error"))
+
+
+def run_batch(count, concurrency=4, output="batch_results.jsonl", stages=None, ui_lock=UI_LOCK,
+              ledger=None, resume=False):
+    """
+    Create `count` accounts with `concurrency` workers, streaming results to
+    `output`. Returns a summary dict with pass/fail counts and throughput.
+
+    With `ledger` and `resume`, the ledger's unfinished accounts are picked
+    up first and `count` new accounts follow.
+    """
+    stages = stages or DesktopSignupStages()
+    writer = JsonlWriter(output)
+    passed = failed = 0
+    started = time.monotonic()
+    pending = ledger.resumable() if ledger is not None and resume else []
+    jobs = list(enumerate(pending))
+    jobs += [(len(pending) + n, None) for n in range(count)]
+
+    def work(job):
+        index, row = job
+        pause_while_open()  # CIRCUIT_ON_OPEN=pause: hold new accounts while a dependency is down
+        record = run_account(index, stages, ui_lock, ledger, row)
+        writer.write(record)
+        return record
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for record in pool.map(work, jobs):
+                if record["status"] == "PASS":
+                    passed += 1
+                else:
+                    failed += 1
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    return {
+        "count": len(jobs),
+        "resumed": len(pending),
+        "concurrency": concurrency,
+        "passed": passed,
+        "failed": failed,
+        "elapsed": round(elapsed, 3),
+        "accounts_per_min": round(len(jobs) / elapsed * 60, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create HP accounts in bulk.")
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of accounts")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="worker threads")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL results file")
+    parser.add_argument("--max-wait", type=int, default=90, help="OTP wait per mailbox (s)")
+    parser.add_argument("--stub", action="store_true", help="use stubbed UI and mail backends")
+    parser.add_argument("--stub-ui-latency", type=float, default=0.05)
+    parser.add_argument("--stub-mail-latency", type=float, default=0.5)
+    parser.add_argument("--ledger", help="SQLite ledger recording each account's completed stages")
+    parser.add_argument("--resume", action="store_true",
+                        help="finish the ledger's unfinished accounts before creating new ones")
+    parser.add_argument("--preflight", metavar="SNAPSHOT",
+                        help="UI snapshot to check the flows' selectors against before starting")
+    args = parser.parse_args(argv)
+    if args.resume and not args.ledger:
+        parser.error("--resume needs --ledger")
+    if args.preflight:
+        from ui_snapshot import preflight
+        broken = preflight(args.preflight)
+        if broken:
+            parser.exit(1, "Selectors not found in the UI snapshot:\n  " + "\n  ".join(broken) + "\n")
+
+    artifacts.install()
+    if args.stub:
+        stages = StubSignupStages(args.stub_ui_latency, args.stub_mail_latency)
+    else:
+        stages = DesktopSignupStages(max_wait=args.max_wait)
+
+    ledger = Ledger(args.ledger) if args.ledger else None
+    try:
+        summary = run_batch(args.count, args.concurrency, args.output, stages,
+                            ledger=ledger, resume=args.resume)
+    finally:
+        if ledger is not None:
+            ledger.close()
+    print(json.dumps(summary))
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Orchestration benchmark: the signup and sign-in flows on the simulated
+HP Smart (sim_ui.py) and its in-memory mail server.
+
+With the sim's latencies at zero (the default) every number is pure
+orchestration overhead: flow execution, waits, locator lookups, OTP
+polling, the batch runner's locking and the step log. Measures
+
+  signup / sign_in   end-to-end and per-stage latency (ms) per account
+  throughput         batch runner accounts/min at each concurrency
+  memory             tracemalloc peak during a signup batch
+
+Results are written as JSON. With --baseline the run is compared to an
+earlier result and exits non-zero when a p50 latency, a throughput or the
+memory peak regressed by more than --tolerance, or more accounts failed.
+
+    python bench_flows.py [--iterations 50] [--concurrency 1,8,64] [--count 256]
+                          [--latency page_load=0.01] [--output bench_flows.json]
+                          [--baseline bench_baseline.json] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import step_log
+import ui_backend
+from batch_runner import DesktopSignupStages, run_account, run_batch
+from locator import HP_ACCOUNT_TITLE, LOCATOR
+from sim_ui import SimApp, SimConfig
+from waits import wait_until, window_exists
+
+
+# Compared against the baseline; (key suffix, higher is better)
+REGRESSION_KEYS = (("p50_ms", False), ("accounts_per_min", True), ("peak_kib", False))
+
+
+# -------------------------------------------------------------
+#  ENVIRONMENT
+# -------------------------------------------------------------
+@contextmanager
+def simulated(config, workdir):
+    """Run the scripts against a fresh SimApp, logging into `workdir`."""
+    saved = {k: os.environ.get(k) for k in ("HP_SMART_BACKEND", "OTP_PROVIDER", "MAILSAC_API_KEY")}
+    os.environ["HP_SMART_BACKEND"] = "sim"
+    os.environ.pop("OTP_PROVIDER", None)
+    os.environ.pop("MAILSAC_API_KEY", None)
+    app = SimApp(config)
+    previous_backend = ui_backend.set_backend(ui_backend.SimBackend(app))
+    previous_recorder = step_log.set_recorder(
+        step_log.StepRecorder(os.path.join(workdir, "steps.ndjson"), echo=False))
+    LOCATOR.invalidate()
+    try:
+        yield app
+    finally:
+        step_log.get_recorder().flush_all()
+        step_log.set_recorder(previous_recorder)
+        ui_backend.set_backend(previous_backend)
+        LOCATOR.invalidate()
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def summarize(samples):
+    """Latency summary in milliseconds."""
+    ms = sorted(s * 1000 for s in samples)
+    if not ms:
+        return {"n": 0}
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    return {"n": len(ms), "mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(p95, 3), "max_ms": round(ms[-1], 3)}
+
+
+# -------------------------------------------------------------
+#  BENCHMARKS
+# -------------------------------------------------------------
+def bench_signup(iterations, config, workdir):
+    """One signup at a time through the batch runner's desktop stages."""
+    e2e, stages_ms, failed = [], {}, 0
+    with simulated(config, workdir):
+        stages = DesktopSignupStages(max_wait=30, poll_interval=0.01)
+        for i in range(iterations):
+            record = run_account(i, stages)
+            failed += record["status"] != "PASS"
+            e2e.append(record["elapsed"])
+            for stage, seconds in record["timings"].items():
+                stages_ms.setdefault(stage, []).append(seconds)
+    return {"e2e": summarize(e2e), "stages": {k: summarize(v) for k, v in stages_ms.items()},
+            "failed": failed}
+
+
+def bench_sign_in(iterations, config, workdir):
+    """Launch, sign in, Scan and Return Home; each iteration on a fresh app."""
+    import new_test
+
+    e2e, stages_ms, failed = [], {}, 0
+    email, password = "bench@mailsac.com", "Bench@123"
+    for _ in range(iterations):
+        with simulated(config, workdir):
+            timings = {}
+            started = time.perf_counter()
+
+            def timed(name, fn, *args):
+                t = time.perf_counter()
+                result = fn(*args)
+                timings[name] = time.perf_counter() - t
+                return result
+
+            desktop = timed("launch_hp_smart", new_test.launch_hp_smart)
+            ok = bool(desktop) and timed("sign_in_browser_opened", wait_until,
+                                         window_exists(desktop, HP_ACCOUNT_TITLE), 30)
+            ok = ok and timed("sign_in_hp_account", new_test.sign_in_hp_account, desktop, email, password)
+            ok = ok and timed("click_scan_button", new_test.click_scan_button, desktop)
+            ok = ok and timed("click_return_home_button", new_test.click_return_home_button, desktop)
+            e2e.append(time.perf_counter() - started)
+            failed += not ok
+            for stage, seconds in timings.items():
+                stages_ms.setdefault(stage, []).append(seconds)
+    return {"e2e": summarize(e2e), "stages": {k: summarize(v) for k, v in stages_ms.items()},
+            "failed": failed}
+
+
+def bench_throughput(concurrency, count, config, workdir):
+    with simulated(config, workdir):
+        summary = run_batch(count, concurrency, os.path.join(workdir, f"batch_c{concurrency}.jsonl"),
+                            DesktopSignupStages(max_wait=30, poll_interval=0.01))
+    return {"count": count, "failed": summary["failed"], "elapsed_s": summary["elapsed"],
+            "accounts_per_min": summary["accounts_per_min"]}
+
+
+def bench_memory(count, concurrency, config, workdir):
+    """tracemalloc peak (KiB) while a signup batch runs."""
+    tracemalloc.start()
+    try:
+        bench_throughput(concurrency, count, config, workdir)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"count": count, "concurrency": concurrency, "peak_kib": round(peak / 1024, 1)}
+
+
+def run(iterations=50, concurrency=(1, 8, 64), count=256, latencies=None, seed=1):
+    config = SimConfig(latencies=latencies, seed=seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        return {
+            "config": {"iterations": iterations, "count": count, "latencies": config.latencies},
+            "signup": bench_signup(iterations, config, workdir),
+            "sign_in": bench_sign_in(iterations, config, workdir),
+            "throughput": {f"c{c}": bench_throughput(c, count, config, workdir) for c in concurrency},
+            "memory": bench_memory(count, max(concurrency), config, workdir),
+        }
+
+
+# -------------------------------------------------------------
+#  BASELINE
+# -------------------------------------------------------------
+def flatten(result, prefix=""):
+    """{"signup.e2e.p50_ms": 1.2, ...} for every numeric leaf."""
+    flat = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(result, baseline, tolerance=0.3):
+    """Regression messages for metrics that got worse than `baseline` by more than `tolerance`."""
+    current, previous = flatten(result), flatten(baseline)
+    regressions = []
+    for name, old in sorted(previous.items()):
+        new = current.get(name)
+        if new is None or name.startswith("config."):
+            continue
+        if name.endswith(".failed") and new > old:
+            regressions.append(f"{name}: {old} -> {new} failed accounts")
+        if not old:
+            continue
+        for suffix, higher_is_better in REGRESSION_KEYS:
+            if not name.endswith(suffix):
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=50, help="accounts per latency benchmark")
+    parser.add_argument("--concurrency", default="1,8,64", help="comma-separated worker counts")
+    parser.add_argument("--count", type=int, default=256, help="accounts per throughput run")
+    parser.add_argument("--latency", help="sim latencies, e.g. page_load=0.01,mail_delivery=0.05")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_flows.json")
+    parser.add_argument("--baseline", help="earlier result to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the result to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    concurrency = tuple(int(c) for c in args.concurrency.split(","))
+    latencies = {}
+    for pair in filter(None, (args.latency or "").split(",")):
+        key, _, value = pair.partition("=")
+        latencies[key.strip()] = float(value)
+    result = run(args.iterations, concurrency, args.count, latencies, args.seed)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(result, fh, indent=2)
+    print(json.dumps(result, indent=2))
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(result, json.load(fh), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
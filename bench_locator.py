@@ -0,0 +1,140 @@
+"""
+Locator benchmark against a synthetic 10k-node control tree.
+
+Each descendants() walk sleeps `cost` seconds per node to stand in for the
+cross-process UIA calls, and every property read is counted. Compares the
+old fallback (walk descendants() and read window_text() of each button)
+with Locator's one-pass index and dictionary lookups.
+
+    python bench_locator.py [--nodes 10000] [--lookups 50] [--cost 0.00002]
+"""
+import argparse
+import json
+import time
+
+from locator import Locator
+
+
+class FakeElementInfo:
+    def __init__(self, owner):
+        self._owner = owner
+
+    @property
+    def automation_id(self):
+        self._owner.tree.reads += 1
+        return self._owner.auto_id
+
+    @property
+    def name(self):
+        self._owner.tree.reads += 1
+        return self._owner.title
+
+    @property
+    def control_type(self):
+        self._owner.tree.reads += 1
+        return self._owner.ctype
+
+
+class FakeControl:
+    def __init__(self, tree, auto_id, title, ctype):
+        self.tree = tree
+        self.auto_id = auto_id
+        self.title = title
+        self.ctype = ctype
+        self.alive = True
+        self.element_info = FakeElementInfo(self)
+
+    def window_text(self):
+        self.tree.reads += 1
+        return self.title
+
+    def is_visible(self):
+        if not self.alive:
+            raise RuntimeError("element not available")
+        return True
+
+
+class FakeTree:
+    """A flat window of `size` controls; every property read is counted."""
+
+    def __init__(self, size, cost=0.0):
+        self.cost = cost
+        self.reads = 0
+        self.walks = 0
+        types = ("Button", "Edit", "Text", "Pane", "Hyperlink")
+        self.controls = [
+            FakeControl(self, f"ctl_{i}", f"Control {i}", types[i % len(types)])
+            for i in range(size)
+        ]
+        # Targets the flows look for live near the end of the tree
+        self.controls[-3].title, self.controls[-3].ctype = "Scan", "Button"
+        self.controls[-2].title, self.controls[-2].ctype = "Return Home", "Button"
+        self.controls[-1].title, self.controls[-1].ctype = "Sign in to HP", "Button"
+
+    def descendants(self, control_type=None):
+        self.walks += 1
+        if self.cost:
+            time.sleep(self.cost * len(self.controls))
+        if control_type is None:
+            return list(self.controls)
+        return [c for c in self.controls if c.ctype == control_type]
+
+
+def naive_find_text(window, text, control_type):
+    """The pre-locator fallback from new_test.py."""
+    for b in window.descendants(control_type=control_type):
+        if text in b.window_text().strip():
+            return b
+    return None
+
+
+def run(nodes=10000, lookups=50, cost=0.00002):
+    targets = ["Scan", "Return Home", "Sign in"]
+
+    tree = FakeTree(nodes, cost)
+    start = time.perf_counter()
+    for i in range(lookups):
+        assert naive_find_text(tree, targets[i % 3], "Button") is not None
+    naive = time.perf_counter() - start
+    naive_reads, naive_walks = tree.reads, tree.walks
+
+    tree = FakeTree(nodes, cost)
+    locator = Locator(index_ttl=None)
+    start = time.perf_counter()
+    locator.index(tree)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(lookups):
+        assert locator.find_text(tree, targets[i % 3], control_type="Button") is not None
+    indexed = time.perf_counter() - start
+
+    return {
+        "nodes": nodes,
+        "lookups": lookups,
+        "property_cost_s": cost,
+        "naive_total_s": round(naive, 4),
+        "naive_per_lookup_ms": round(naive / lookups * 1000, 3),
+        "naive_walks": naive_walks,
+        "naive_property_reads": naive_reads,
+        "index_build_s": round(build, 4),
+        "indexed_per_lookup_ms": round(indexed / lookups * 1000, 4),
+        "indexed_walks": tree.walks,
+        "indexed_property_reads": tree.reads,
+        "speedup_total": round(naive / (build + indexed), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--cost", type=float, default=0.00002,
+                        help="simulated seconds per control in a descendants() walk")
+    args = parser.parse_args(argv)
+    result = run(args.nodes, args.lookups, args.cost)
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+OTP extraction benchmark over a stored corpus of raw messages (mbox).
+
+The corpus mixes HP verification emails (plain text, half of them with a
+distracting reference number, and HTML-only with CSS colours) with
+newsletters that carry 6-digit order numbers, several messages per
+recipient. Compares the old approach (full MIME parse of every message,
+first \\b\\d{6}\\b in the newest message per recipient) with
+otp_extract.extract_batch().
+
+    python bench_otp_extract.py [--messages 100000] [--corpus otp_corpus.mbox]
+"""
+import argparse
+import email
+import email.policy
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from email.utils import formatdate, parseaddr
+
+from otp_extract import extract_batch, iter_mbox
+
+
+NAIVE_PATTERN = re.compile(r"\b(\d{6})\b")
+
+_HP_PLAIN = (
+    "From: HP <no-reply@hp.com>\nTo: {to}\nSubject: Your HP account verification code\n"
+    "Date: {date}\nMessage-ID: <{n}@hp.com>\nContent-Type: text/plain; charset=utf-8\n\n"
+    "Hello,\n\n{reference}Your verification code is {code}.\n\nHP Account Team\n"
+)
+_HP_HTML = (
+    "From: HP Account <accounts@email.hp.com>\nTo: {to}\nSubject: Verify your email address\n"
+    "Date: {date}\nMessage-ID: <{n}@hp.com>\nContent-Type: text/html; charset=utf-8\n\n"
+    "<html><head><style>.btn {{ color: #{ref}; }}</style></head><body>"
+    "<p style=\"color:#{ref}\">Use this code to verify your HP account:</p>"
+    "<div class=\"otp\">{code}</div><p>The code expires in 10 minutes.</p></body></html>\n"
+)
+_NEWSLETTER = (
+    "From: Printer Deals <news@shop.example.com>\nTo: {to}\nSubject: Order {ref} has shipped\n"
+    "Date: {date}\nMessage-ID: <{n}@shop.example.com>\nContent-Type: text/plain; charset=utf-8\n\n"
+    "Your order {ref} is on its way. Track it with code {ref}.\n"
+)
+
+
+def build_corpus(path, messages=100000, seed=1):
+    """Write the corpus to `path`; return {recipient: expected newest code}."""
+    rng = random.Random(seed)
+    recipients = max(1, messages // 4)
+    expected = {}
+    base = 1735689600  # 2025-01-01
+    with open(path, "wb") as fh:
+        for n in range(messages):
+            to = f"user{rng.randrange(recipients)}@mailsac.com"
+            fields = {"to": to, "n": n, "date": formatdate(base + n),
+                      "code": f"{rng.randrange(1000000):06d}", "ref": f"{rng.randrange(100000, 1000000)}"}
+            fields["reference"] = f"Request reference {fields['ref']}.\n" if rng.random() < 0.5 else ""
+            kind = rng.random()
+            if kind < 0.4:
+                raw = _HP_PLAIN.format(**fields)
+            elif kind < 0.6:
+                raw = _HP_HTML.format(**fields)
+            else:
+                raw = _NEWSLETTER.format(**fields)
+            if kind < 0.6:
+                expected[to] = fields["code"]
+            fh.write(b"From MAILER-DAEMON Wed Jan  1 00:00:00 2025\n" + raw.encode() + b"\n")
+    return expected
+
+
+def naive_batch(raws):
+    """Old approach: newest message per recipient, first 6-digit number in its text."""
+    newest = {}
+    for raw in raws:
+        msg = email.message_from_bytes(raw, policy=email.policy.default)
+        part = msg.get_body(preferencelist=("plain", "html"))
+        match = NAIVE_PATTERN.search(part.get_content() if part is not None else "")
+        newest[parseaddr(msg["To"])[1].lower()] = match.group(1) if match else None
+    return newest
+
+
+def _wrong(found, expected):
+    return sum(1 for to, code in expected.items() if found.get(to) != code)
+
+
+def run(messages=100000, corpus=None, seed=1):
+    tmp = None
+    if corpus is None:
+        fd, tmp = tempfile.mkstemp(suffix=".mbox")
+        os.close(fd)
+        corpus = tmp
+    try:
+        expected = build_corpus(corpus, messages, seed)
+
+        start = time.perf_counter()
+        naive = naive_batch(iter_mbox(corpus))
+        naive_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = {to: m.code for to, m in extract_batch(iter_mbox(corpus)).items()}
+        fast_s = time.perf_counter() - start
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+    return {
+        "messages": messages,
+        "recipients_with_otp": len(expected),
+        "naive_s": round(naive_s, 3),
+        "naive_msgs_per_s": round(messages / naive_s),
+        "naive_wrong_codes": _wrong(naive, expected),
+        "extract_s": round(fast_s, 3),
+        "extract_msgs_per_s": round(messages / fast_s),
+        "extract_wrong_codes": _wrong(found, expected),
+        "speedup": round(naive_s / fast_s, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--corpus", help="keep the generated mbox at this path")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    result = run(args.messages, args.corpus, args.seed)
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
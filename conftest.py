@@ -0,0 +1,286 @@
+"""
+Shared test fixtures and fakes.
+
+  sim            installs a simulated HP Smart (sim_ui.py) with a fresh step
+                 log, artifacts, breakers and app session; call it with
+                 SimConfig options to get the SimApp
+  failures       callable returning the FAIL lines of the current step log
+  fake_clock     manual clock: `now`, monotonic(), sleep() and calling it
+  mailsac_stub   local Mailsac HTTP API serving canned messages
+  imap_stub      starts a local IMAP server over a list of raw messages
+  otp_email      builds a raw HP verification email
+"""
+import json
+import socketserver
+import threading
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pytest
+
+import app_session
+import artifacts
+import resilience
+import step_log
+import ui_backend
+from locator import LOCATOR
+from sim_ui import SimApp, SimConfig
+from ui_backend import SimBackend
+
+
+# Signup stage fixtures, FAIL-step checks and xdist log merging
+pytest_plugins = ["pytest_signup"]
+
+
+# -------------------------------------------------------------
+#  SIMULATED HP SMART
+# -------------------------------------------------------------
+def install(monkeypatch, tmp_path, **config):
+    app = SimApp(SimConfig(seed=7, **config))
+    previous = ui_backend.set_backend(SimBackend(app))
+    monkeypatch.setenv("HP_SMART_BACKEND", "sim")
+    monkeypatch.delenv("OTP_PROVIDER", raising=False)
+    monkeypatch.delenv("MAILSAC_API_KEY", raising=False)
+    monkeypatch.chdir(tmp_path)
+    return app, previous
+
+
+@pytest.fixture
+def sim(monkeypatch, tmp_path):
+    recorder = step_log.StepRecorder(str(tmp_path / "steps.ndjson"), echo=False)
+    previous_rec = step_log.set_recorder(recorder)
+    monkeypatch.setenv("ARTIFACTS_DIR", str(tmp_path / "artifacts"))
+    artifacts.uninstall()
+    resilience.reset_breakers()
+    previous_session = app_session.set_session(None)
+    installed = []
+
+    def make(**config):
+        app, previous = install(monkeypatch, tmp_path, **config)
+        installed.append(previous)
+        return app
+
+    yield make
+    artifacts.uninstall()
+    resilience.reset_breakers()
+    app_session.set_session(previous_session)
+    ui_backend.set_backend(installed[0] if installed else None)
+    step_log.set_recorder(previous_rec)
+    LOCATOR.invalidate()
+
+
+def _failures():
+    rec = step_log.get_recorder()
+    rec.flush_all()
+    return [e["desc"] for e in rec.events(kind="log") if e["status"] == "FAIL"]
+
+
+@pytest.fixture
+def failures():
+    return _failures
+
+
+# -------------------------------------------------------------
+#  FAKE CLOCK
+# -------------------------------------------------------------
+class FakeClock:
+    """Time only moves when a test sets `now` or something sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock():
+    return FakeClock()
+
+
+# -------------------------------------------------------------
+#  MAIL STUBS
+# -------------------------------------------------------------
+def build_message(to, otp, subject="Your HP account verification code"):
+    msg = EmailMessage()
+    msg["From"] = "HP <no-reply@hp.com>"
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content(f"Hello,\n\nYour verification code is {otp}.\n\nHP Account Team")
+    return msg.as_bytes()
+
+
+@pytest.fixture
+def otp_email():
+    return build_message
+
+
+class StubMailsac:
+    """Plays back canned messages; a message becomes visible after `visible_after` listings."""
+
+    def __init__(self):
+        self.messages = {}
+        self.listings = 0
+        self.connections = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+
+    def add(self, address, msg_id, text, received="2025-01-01T00:00:00Z", visible_after=0):
+        self.messages.setdefault(address, []).append(
+            {"_id": msg_id, "text": text, "received": received, "visible_after": visible_after}
+        )
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, ctype="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                stub.connections.add(self.client_address)
+                if self.headers.get("Mailsac-Key") != "k":
+                    return self._send(401, b"{}")
+                parts = [unquote(p) for p in self.path.split("/") if p]
+                if parts[:2] == ["api", "addresses"] and parts[3] == "messages":
+                    stub.listings += 1
+                    visible = [
+                        {"_id": m["_id"], "received": m["received"]}
+                        for m in stub.messages.get(parts[2], [])
+                        if stub.listings > m["visible_after"]
+                    ]
+                    return self._send(200, json.dumps(visible).encode())
+                if parts[:2] == ["api", "domains"] and parts[3] == "messages":
+                    stub.listings += 1
+                    visible = [
+                        {"_id": m["_id"], "received": m["received"], "to": [{"address": address}]}
+                        for address, messages in stub.messages.items()
+                        if address.endswith("@" + parts[2])
+                        for m in messages
+                        if stub.listings > m["visible_after"]
+                    ]
+                    return self._send(200, json.dumps(visible).encode())
+                if parts[:2] == ["api", "text"]:
+                    for m in stub.messages.get(parts[2], []):
+                        if m["_id"] == parts[3]:
+                            return self._send(200, m["text"].encode(), "text/plain")
+                return self._send(404, b"{}")
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server.server_address[1]
+
+
+@pytest.fixture
+def mailsac_stub():
+    with StubMailsac() as stub:
+        yield stub
+
+
+class StubImap(socketserver.ThreadingTCPServer):
+    """Minimal IMAP4rev1 server: LOGIN, SELECT, EXAMINE, NOOP, SEARCH TO, FETCH RFC822, UID, LOGOUT."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.logins = 0
+        super().__init__(("127.0.0.1", 0), StubImapHandler)
+
+
+class StubImapHandler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        data = line if isinstance(line, bytes) else line.encode()
+        self.wfile.write(data + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.send("* OK [CAPABILITY IMAP4rev1] stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, cmd, *args = line.decode().rstrip("\r\n").split(" ")
+            cmd = cmd.upper()
+            if cmd == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1")
+            elif cmd == "LOGIN":
+                if args != ["user", '"secret"'] and args != ["user", "secret"]:
+                    self.send(f"{tag} NO bad credentials")
+                    continue
+                server.logins += 1
+            elif cmd in ("SELECT", "EXAMINE"):
+                self.send(f"* {len(server.messages)} EXISTS")
+            elif cmd == "SEARCH":
+                address = args[-1].strip('"')
+                ids = [str(i + 1) for i, raw in enumerate(server.messages)
+                       if f"To: {address}".encode() in raw]
+                self.send("* SEARCH " + " ".join(ids) if ids else "* SEARCH")
+            elif cmd == "UID" and args[0].upper() == "SEARCH":
+                # UIDs are the 1-based positions; "n:*" always includes the newest
+                uids = list(range(1, len(server.messages) + 1))
+                if args[1].upper() == "UID":
+                    low = int(args[2].split(":")[0])
+                    uids = [u for u in uids if u >= low] or uids[-1:]
+                self.send("* SEARCH " + " ".join(map(str, uids)) if uids else "* SEARCH")
+            elif cmd == "UID" and args[0].upper() == "FETCH":
+                for uid in args[1].split(","):
+                    raw = server.messages[int(uid) - 1]
+                    self.send(f"* {uid} FETCH (UID {uid} RFC822 {{{len(raw)}}}".encode())
+                    self.wfile.write(raw)
+                    self.send(")")
+            elif cmd == "FETCH":
+                raw = server.messages[int(args[0]) - 1]
+                self.send(f"* {args[0]} FETCH (RFC822 {{{len(raw)}}}".encode())
+                self.wfile.write(raw)
+                self.send(")")
+            elif cmd == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            self.send(f"{tag} OK {cmd} completed")
+
+
+@pytest.fixture
+def imap_stub():
+    servers = []
+
+    def start(messages):
+        server = StubImap(messages)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,558 @@
+"""
+Coordinator and agents for running signups on many machines.
+
+One Windows desktop drives one HP Smart foreground window, so one machine
+runs one signup at a time. The coordinator holds the queue of identities and
+hands them out as leased jobs to agents, one agent per desktop, over a TCP
+socket speaking JSON lines. Each agent runs the batch runner's stages
+(run_account) for its job and sends back the result record together with the
+job's step events.
+
+  lease      a job belongs to an agent for `lease_seconds`; the agent extends
+             it with heartbeats while it works
+  requeue    a lease that runs out (agent crashed, machine hung, network
+             gone) puts the job back in the queue, up to `max_attempts` times
+  results    the first result for a job wins; late duplicates are dropped,
+             except that a real result replaces a "lease lost" one (the
+             results file then holds both lines, the later one counts)
+  submit     an agent asks the coordinator before it submits the form and
+             does not submit without its lease; a lease that runs out after
+             the submit is given up ("lease lost after submit") instead of
+             requeued, so no identity is signed up twice
+
+Results go to a JSONL file and the agents' step events to the coordinator's
+step log, so report.py and profiling.py work on a distributed run as usual.
+
+    python coordinator.py serve -n 1000 --port 8765 [--lease 120] [--stub]
+    python coordinator.py agent --connect 10.0.0.5:8765 [--stub]
+    python coordinator.py local -n 40 --agents 4 --stub   # all on loopback
+"""
+import argparse
+import itertools
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import artifacts
+from batch_runner import DesktopSignupStages, JsonlWriter, StubSignupStages, run_account
+from step_log import get_recorder, log_step
+
+
+DEFAULT_PORT = 8765
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+
+
+class CoordinatorError(RuntimeError):
+    """The coordinator refused a request or could not be reached."""
+
+
+# -------------------------------------------------------------
+#  QUEUE
+# -------------------------------------------------------------
+class Lease:
+    __slots__ = ("job_id", "agent", "token", "expires", "submitted")
+
+    def __init__(self, job_id, agent, token, expires):
+        self.job_id = job_id
+        self.agent = agent
+        self.token = token
+        self.expires = expires
+        self.submitted = False
+
+
+class WorkQueue:
+    """
+    Jobs, leases and results. All scheduling decisions live here, behind one
+    lock and an injectable clock, so they can be tested without sockets.
+    """
+
+    def __init__(self, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, clock=time.monotonic,
+                 on_result=None):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.on_result = on_result
+        self.jobs = {}
+        self.results = {}
+        self.attempts = {}
+        self.pending = deque()
+        self.leases = {}
+        self.agents = {}
+        self.stats = {"leased": 0, "requeued": 0, "lost": 0, "duplicates": 0}
+        self._ids = itertools.count()
+        self._gave_up = set()  # jobs finished with a synthetic "lease lost" record
+        self._issued = {}  # lease token -> job id, for every lease ever handed out
+        self._lock = threading.Lock()
+
+    def add(self, identity, flow="signup"):
+        with self._lock:
+            job_id = next(self._ids)
+            self.jobs[job_id] = {"id": job_id, "flow": flow, "identity": identity}
+            self.attempts[job_id] = 0
+            self.pending.append(job_id)
+            return job_id
+
+    def _seen(self, agent):
+        self.agents[agent] = self.clock()
+
+    def _finish(self, job_id, record):
+        self.results[job_id] = record
+        if self.on_result is not None:
+            self.on_result(record)
+
+    def _reap(self):
+        """Requeue (or give up on) jobs whose lease ran out; a submitted form is never redone."""
+        now = self.clock()
+        requeued = []
+        for job_id, lease in list(self.leases.items()):
+            if lease.expires > now:
+                continue
+            del self.leases[job_id]
+            if not lease.submitted and self.attempts[job_id] < self.max_attempts:
+                requeued.append(job_id)
+                self.stats["requeued"] += 1
+            else:
+                error = "lease lost after submit" if lease.submitted else "lease lost"
+                record = {"job": job_id, "status": "FAIL", "error": error,
+                          "agent": lease.agent, "attempts": self.attempts[job_id],
+                          "email": self.jobs[job_id]["identity"].get("email")}
+                self.stats["lost"] += 1
+                self._gave_up.add(job_id)
+                self._finish(job_id, record)
+        # Requeued jobs go first, oldest first
+        self.pending.extendleft(reversed(requeued))
+
+    def reap(self):
+        with self._lock:
+            self._reap()
+
+    def lease(self, agent):
+        """Next job for `agent` as (job, lease token), or (None, None) when nothing is pending."""
+        with self._lock:
+            self._seen(agent)
+            self._reap()
+            while self.pending:
+                job_id = self.pending.popleft()
+                if job_id in self.results:
+                    continue
+                self.attempts[job_id] += 1
+                token = uuid.uuid4().hex[:12]
+                self.leases[job_id] = Lease(job_id, agent, token, self.clock() + self.lease_seconds)
+                self._issued[token] = job_id
+                self.stats["leased"] += 1
+                return dict(self.jobs[job_id], attempt=self.attempts[job_id]), token
+            return None, None
+
+    def heartbeat(self, agent, job_id, token):
+        """Extend the lease; False when the agent no longer holds it."""
+        with self._lock:
+            self._seen(agent)
+            lease = self.leases.get(job_id)
+            if lease is None or lease.token != token:
+                return False
+            lease.expires = self.clock() + self.lease_seconds
+            return True
+
+    def submit(self, agent, job_id, token):
+        """
+        Record that `agent` is about to submit `job_id`'s form; False when it
+        no longer holds the lease, and must not submit.
+        """
+        with self._lock:
+            self._seen(agent)
+            lease = self.leases.get(job_id)
+            if lease is None or lease.token != token or lease.expires <= self.clock():
+                return False
+            lease.submitted = True
+            return True
+
+    def complete(self, agent, job_id, token, record):
+        """
+        Store the result of `job_id`. A job that already has a result keeps
+        it (returns False); a result arriving after the lease was requeued,
+        or after the job was given up as "lease lost", is still taken, since
+        the work is done. `token` only has to be one this job was leased
+        with, not the current one.
+        """
+        with self._lock:
+            self._seen(agent)
+            if job_id not in self.jobs:
+                raise CoordinatorError(f"unknown job {job_id}")
+            if self._issued.get(token) != job_id:
+                raise CoordinatorError(f"job {job_id} was never leased as {token!r}")
+            if job_id in self._gave_up:
+                self._gave_up.discard(job_id)
+                self.stats["lost"] -= 1
+            elif job_id in self.results:
+                self.stats["duplicates"] += 1
+                return False
+            self.leases.pop(job_id, None)
+            self._finish(job_id, dict(record, job=job_id, agent=agent, attempts=self.attempts[job_id]))
+            return True
+
+    def done(self):
+        with self._lock:
+            return len(self.results) == len(self.jobs)
+
+    def counts(self):
+        with self._lock:
+            return {"jobs": len(self.jobs), "pending": len(self.pending), "leased": len(self.leases),
+                    "finished": len(self.results)}
+
+
+# -------------------------------------------------------------
+#  SERVER
+# -------------------------------------------------------------
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = self.server.coordinator.dispatch(json.loads(line))
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator:
+    """Serves a WorkQueue over TCP and collects results and step events."""
+
+    def __init__(self, queue, output="coordinator_results.jsonl", events_path="coordinator_steps.ndjson",
+                 host="127.0.0.1", port=0, idle_poll=0.5):
+        self.queue = queue
+        self.writer = JsonlWriter(output)
+        queue.on_result = self.writer.write
+        self.events_path = events_path
+        self.idle_poll = idle_poll
+        self._events_lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.coordinator = self
+        self._thread = None
+        self.started = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._server.serve_forever, name="coordinator", daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.writer.close()
+
+    def dispatch(self, message):
+        op, agent = message.get("op"), message.get("agent")
+        if op == "hello":
+            return {"ok": True, "lease_seconds": self.queue.lease_seconds}
+        if op == "lease":
+            job, token = self.queue.lease(agent)
+            if job is None:
+                return {"ok": True, "job": None, "done": self.queue.done(), "retry_in": self.idle_poll}
+            return {"ok": True, "job": job, "lease": token}
+        if op == "heartbeat":
+            return {"ok": self.queue.heartbeat(agent, message["job"], message["lease"])}
+        if op == "submit":
+            return {"ok": self.queue.submit(agent, message["job"], message["lease"])}
+        if op == "result":
+            accepted = self.queue.complete(agent, message["job"], message["lease"], message["record"])
+            if accepted:
+                self._write_events(message.get("events") or ())
+            return {"ok": True, "accepted": accepted}
+        raise CoordinatorError(f"unknown op {op!r}")
+
+    def _write_events(self, events):
+        if not events:
+            return
+        data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events)
+        with self._events_lock:
+            with open(self.events_path, "a", encoding="utf-8") as fh:
+                fh.write(data)
+
+    def wait(self, timeout=None, poll=0.1):
+        """Block until every job has a result (requeueing expired leases meanwhile)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.queue.done():
+            self.queue.reap()
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def summary(self):
+        results = list(self.queue.results.values())
+        passed = sum(1 for r in results if r.get("status") == "PASS")
+        elapsed = time.monotonic() - (self.started or time.monotonic())
+        return {
+            "count": len(self.queue.jobs),
+            "agents": len(self.queue.agents),
+            "passed": passed,
+            "failed": len(results) - passed,
+            "requeued": self.queue.stats["requeued"],
+            "lost": self.queue.stats["lost"],
+            "duplicates": self.queue.stats["duplicates"],
+            "elapsed": round(elapsed, 3),
+            "accounts_per_min": round(len(results) / elapsed * 60, 1) if elapsed else 0.0,
+        }
+
+
+# -------------------------------------------------------------
+#  AGENT
+# -------------------------------------------------------------
+class _Connection:
+    """One JSON-lines connection; calls are serialized so the heartbeat thread can share it."""
+
+    def __init__(self, address, timeout=30):
+        self._sock = socket.create_connection(address, timeout=timeout)
+        self._file = self._sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def call(self, **message):
+        with self._lock:
+            self._file.write((json.dumps(message) + "\n").encode("utf-8"))
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise CoordinatorError("coordinator closed the connection")
+        reply = json.loads(line)
+        if not reply.get("ok", False) and "error" in reply:
+            raise CoordinatorError(reply["error"])
+        return reply
+
+    def close(self):
+        for closer in (self._file.close, self._sock.close):
+            try:
+                closer()
+            except OSError:
+                pass
+
+
+class _AssignedStages:
+    """A stages object whose next identity is the one the coordinator assigned."""
+
+    def __init__(self, stages, identity, lost=None, claim=None):
+        self._stages = stages
+        self._identity = identity
+        self._lost = lost
+        self._claim = claim
+        self.ui_exclusive = getattr(stages, "ui_exclusive", False)
+
+    def new_identity(self):
+        return self._identity
+
+    def submit_form(self, identity):
+        # Without the lease the job may already be requeued to another agent
+        # The coordinator records the submit, so it gives the job up rather than requeue it
+        lost = self._lost is not None and self._lost.is_set()
+        if lost or (self._claim is not None and not self._claim()):
+            log_step(f"Lease on {identity['email']} lost, not submitting the form.", "FAIL")
+            return False
+        return self._stages.submit_form(identity)
+
+    def __getattr__(self, name):
+        return getattr(self._stages, name)
+
+
+def _read_new_events(path, offset, run_id):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as fh:
+        fh.seek(offset)
+        return [e for e in map(json.loads, filter(str.strip, fh)) if e.get("run") == run_id]
+
+
+class Agent:
+    """
+    Leases jobs from a coordinator and runs them one at a time with
+    `stages` ({flow name: stages object}).
+    """
+
+    def __init__(self, address, stages, agent_id=None, ui_lock=None):
+        self.address = address
+        self.stages = stages
+        self.agent_id = agent_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.ui_lock = ui_lock or threading.Lock()
+        self.completed = 0
+
+    def _heartbeat(self, conn, job, token, stop, interval, lost):
+        while not stop.wait(interval):
+            try:
+                ok = conn.call(op="heartbeat", agent=self.agent_id, job=job["id"], lease=token)["ok"]
+                error = "coordinator revoked it"
+            except (OSError, CoordinatorError) as e:
+                ok, error = False, e
+            if not ok:
+                log_step(f"Heartbeat for job {job['id']} failed ({error}), abandoning its lease.", "INFO")
+                lost.set()
+                return
+
+    def _claim_submit(self, conn, job, token, lost):
+        try:
+            ok = conn.call(op="submit", agent=self.agent_id, job=job["id"], lease=token)["ok"]
+        except (OSError, CoordinatorError):
+            ok = False
+        if not ok:
+            lost.set()
+        return ok
+
+    def run_job(self, conn, job, token, interval):
+        stages = self.stages.get(job["flow"])
+        recorder = get_recorder()
+        recorder.flush_all()
+        offset = os.path.getsize(recorder.path) if os.path.exists(recorder.path) else 0
+        stop, lost = threading.Event(), threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(conn, job, token, stop, interval, lost),
+                                name=f"{self.agent_id}-heartbeat", daemon=True)
+        beat.start()
+        try:
+            if stages is None:
+                record = {"index": job["id"], "status": "FAIL", "error": f"agent has no flow {job['flow']!r}"}
+            else:
+                assigned = _AssignedStages(stages, job["identity"], lost,
+                                           claim=lambda: self._claim_submit(conn, job, token, lost))
+                record = run_account(job["id"], assigned, self.ui_lock)
+        finally:
+            stop.set()
+            beat.join()
+        recorder.flush_all()
+        events = _read_new_events(recorder.path, offset, record.get("run_id"))
+        record["lease_lost"] = lost.is_set()
+        return conn.call(op="result", agent=self.agent_id, job=job["id"], lease=token,
+                         record=record, events=events)
+
+    def run(self, max_jobs=None):
+        """Work until the coordinator has nothing left (or `max_jobs` are done); return jobs completed."""
+        conn = _Connection(self.address)
+        try:
+            hello = conn.call(op="hello", agent=self.agent_id)
+            interval = hello["lease_seconds"] / 3
+            while max_jobs is None or self.completed < max_jobs:
+                reply = conn.call(op="lease", agent=self.agent_id)
+                job = reply.get("job")
+                if job is None:
+                    if reply.get("done"):
+                        break
+                    time.sleep(reply.get("retry_in", 0.5))
+                    continue
+                self.run_job(conn, job, reply["lease"], interval)
+                self.completed += 1
+        finally:
+            conn.close()
+        return self.completed
+
+
+# -------------------------------------------------------------
+#  CLI
+# -------------------------------------------------------------
+def _stages(args):
+    if args.stub:
+        return {"signup": StubSignupStages(args.stub_ui_latency, args.stub_mail_latency)}
+    return {"signup": DesktopSignupStages(max_wait=args.max_wait)}
+
+
+def _parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve(args, on_start=None):
+    if args.stub:
+        new_identity = StubSignupStages().new_identity
+    else:
+        from identity import next_identity
+
+        def new_identity():
+            return next_identity().as_dict()
+
+    queue = WorkQueue(lease_seconds=args.lease, max_attempts=args.max_attempts)
+    for _ in range(args.count):
+        queue.add(new_identity())
+    coordinator = Coordinator(queue, args.output, args.events, args.host, args.port)
+    address = coordinator.start()
+    print(f"Coordinator listening on {address[0]}:{address[1]} with {args.count} jobs", flush=True)
+    try:
+        if on_start:
+            on_start(address)
+        coordinator.wait()
+    finally:
+        coordinator.stop()
+    summary = coordinator.summary()
+    print(json.dumps(summary))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run signups on many machines.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "agent", "local"):
+        sub = commands.add_parser(name)
+        sub.add_argument("--stub", action="store_true", help="stubbed UI and mail backends")
+        sub.add_argument("--stub-ui-latency", type=float, default=0.05)
+        sub.add_argument("--stub-mail-latency", type=float, default=0.5)
+        sub.add_argument("--max-wait", type=int, default=90, help="OTP wait per mailbox (s)")
+        if name == "agent":
+            sub.add_argument("--connect", required=True, help="coordinator host:port")
+            sub.add_argument("--max-jobs", type=int)
+            continue
+        sub.add_argument("-n", "--count", type=int, default=10, help="number of accounts")
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=DEFAULT_PORT if name == "serve" else 0)
+        sub.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length (s)")
+        sub.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+        sub.add_argument("-o", "--output", default="coordinator_results.jsonl")
+        sub.add_argument("--events", default="coordinator_steps.ndjson", help="step log for agent events")
+        if name == "local":
+            sub.add_argument("--agents", type=int, default=2, help="agent processes to start")
+    args = parser.parse_args(argv)
+
+    if args.command == "agent":
+        artifacts.install()
+        done = Agent(_parse_address(args.connect), _stages(args)).run(args.max_jobs)
+        print(json.dumps({"jobs": done}))
+        return done
+
+    if args.command == "serve":
+        return serve(args)
+
+    agents = []
+
+    def spawn(address):
+        command = [sys.executable, os.path.abspath(__file__), "agent", "--connect", f"{address[0]}:{address[1]}",
+                   "--stub-ui-latency", str(args.stub_ui_latency),
+                   "--stub-mail-latency", str(args.stub_mail_latency), "--max-wait", str(args.max_wait)]
+        if args.stub:
+            command.append("--stub")
+        for _ in range(args.agents):
+            agents.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+
+    try:
+        return serve(args, on_start=spawn)
+    finally:
+        for proc in agents:
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
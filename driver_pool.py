@@ -0,0 +1,262 @@
+"""
+Pool of warm headless Chrome sessions for the Selenium OTP fallback.
+
+Starting Chrome costs 2-5 seconds, and the Selenium provider used to pay it
+on every mailbox check. DriverPool keeps a fixed number of sessions alive
+and hands each one to a single caller at a time:
+
+  - on release a session is reset (alerts dismissed, extra tabs closed,
+    cookies cleared, about:blank) so the next mailbox starts clean;
+  - on acquire an idle session is health-checked and replaced if it died;
+  - a session is recycled after `max_uses` checks or `max_age` seconds,
+    and immediately when its user reports it broken.
+
+    pool = get_driver_pool()
+    with pool.session() as driver:
+        driver.get("https://mailsac.com/inbox/...")
+
+The factory is injectable, so the pool is tested with fake drivers.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from step_log import log_step
+
+
+class DriverPoolClosed(RuntimeError):
+    """acquire() on a pool that has been closed."""
+
+
+def chrome_factory(headless=True):
+    """New Chrome WebDriver (selenium is imported on first use)."""
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-first-run")
+    options.add_argument("--window-size=1280,900")
+    return webdriver.Chrome(options=options)
+
+
+def reset_session(driver):
+    """Bring a used session back to a single blank tab without cookies."""
+    try:
+        driver.switch_to.alert.accept()
+    except Exception:
+        pass
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.delete_all_cookies()
+    driver.get("about:blank")
+
+
+def is_healthy(driver):
+    """True if the browser still answers WebDriver commands."""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+# -------------------------------------------------------------
+#  POOL
+# -------------------------------------------------------------
+class PooledDriver:
+    """A pooled session plus its usage counters."""
+
+    __slots__ = ("driver", "uses", "created_at")
+
+    def __init__(self, driver, created_at):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = created_at
+
+
+class DriverPool:
+    """
+    Fixed-size pool of warm WebDriver sessions.
+
+    `factory()` starts a session; `reset(driver)` and `health_check(driver)`
+    default to reset_session / is_healthy. acquire() blocks while all
+    `size` sessions are in use.
+    """
+
+    def __init__(self, factory=chrome_factory, size=2, max_uses=50, max_age=None,
+                 reset=reset_session, health_check=is_healthy, clock=time.monotonic, log=None):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.reset = reset
+        self.health_check = health_check
+        self.clock = clock
+        self.log = log or log_step
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "unhealthy": 0, "broken": 0}
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _create(self):
+        driver = self.factory()
+        self._count("created")
+        return PooledDriver(driver, self.clock())
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+
+    def _expired(self, pooled):
+        if self.max_uses and pooled.uses >= self.max_uses:
+            return True
+        return self.max_age is not None and self.clock() - pooled.created_at >= self.max_age
+
+    def acquire(self, timeout=None):
+        """A healthy session for exclusive use; release() or discard() it afterwards."""
+        if self._closed:
+            raise DriverPoolClosed("Driver pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No pooled browser session available")
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self.health_check(pooled.driver):
+                    self._count("reused")
+                    return pooled
+                self._count("unhealthy")
+                self._quit(pooled)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, pooled):
+        """Return a session after use; it is reset, or recycled when worn out."""
+        pooled.uses += 1
+        keep = not self._closed and not self._expired(pooled)
+        if keep:
+            try:
+                self.reset(pooled.driver)
+            except Exception as e:
+                self.log(f"Browser session reset failed ({e}), recycling it.", "INFO")
+                keep = False
+        if keep:
+            self._idle.put(pooled)
+        else:
+            self._count("recycled")
+            self._quit(pooled)
+        self._slots.release()
+
+    def discard(self, pooled):
+        """Quit a session its user found broken, freeing its slot."""
+        self._count("broken")
+        self._quit(pooled)
+        self._slots.release()
+
+    @contextmanager
+    def session(self, timeout=None):
+        """Context manager yielding a driver; broken on exception, released otherwise."""
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled.driver
+        except BaseException:
+            self.discard(pooled)
+            raise
+        self.release(pooled)
+
+    def warm(self, count=None, wait=False):
+        """Have up to `count` (default: size) idle sessions ready, started in the background."""
+        count = min(count or self.size, self.size)
+
+        def start():
+            # Hold the free slots so nothing else takes the sessions being started
+            held = 0
+            while held < count and self._slots.acquire(blocking=False):
+                held += 1
+            ready = []
+            while len(ready) < held:
+                try:
+                    ready.append(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+            created = [None] * (held - len(ready))
+
+            def create(i):
+                try:
+                    created[i] = self._create()
+                except Exception as e:
+                    self.log(f"Could not start a browser session ({e}).", "INFO")
+
+            starters = [threading.Thread(target=create, args=(i,), name=f"driver-warm-{i}", daemon=True)
+                        for i in range(len(created))]
+            for t in starters:
+                t.start()
+            for t in starters:
+                t.join()
+            for pooled in ready + [p for p in created if p is not None]:
+                if self._closed:
+                    self._quit(pooled)
+                else:
+                    self._idle.put(pooled)
+            for _ in range(held):
+                self._slots.release()
+
+        thread = threading.Thread(target=start, name="driver-warm", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def close(self):
+        """Quit every idle session; sessions in use are quit when released."""
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(pooled)
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE POOL
+# -------------------------------------------------------------
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_driver_pool():
+    """
+    Shared pool configured from SELENIUM_POOL_SIZE (2), SELENIUM_MAX_USES (50)
+    and SELENIUM_HEADLESS (1). It starts warming up when first requested.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            headless = os.environ.get("SELENIUM_HEADLESS", "1") != "0"
+            _POOL = DriverPool(
+                factory=lambda: chrome_factory(headless=headless),
+                size=int(os.environ.get("SELENIUM_POOL_SIZE", "2")),
+                max_uses=int(os.environ.get("SELENIUM_MAX_USES", "50")),
+            )
+            _POOL.warm()
+            atexit.register(_POOL.close)
+        return _POOL
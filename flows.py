@@ -0,0 +1,452 @@
+"""
+Declarative HP Smart flows and the shared step executor.
+
+Each flow (open the Create Account / Sign In flyout, fill the signup form,
+enter the OTP, sign in, Scan, Return Home) is plain data: an ordered list of
+steps, each naming a window, a selector, fallback selectors, an action and
+an optional wait condition. run_flow() executes any of them with retries,
+per-step timing and an early exit on the first failed required step.
+
+All flows are validated once when this module is imported (compile_flows),
+so a typo in a selector or placeholder fails at startup instead of 40
+seconds into a run.
+"""
+import re
+from dataclasses import dataclass
+
+from locator import HP_ACCOUNT_TITLE, HP_SMART_TITLE, LOCATOR
+from step_log import count_retry, log_step, step
+from text_input import enter_text
+from waits import any_of, control_exists, control_gone, wait_ready, wait_until, window_exists
+
+
+ACTIONS = ("focus_window", "click", "type", "fill", "paste", "wait")
+# "type" and "fill" enter text fastest-first (see text_input.py); "paste" prefers the clipboard
+PASTE_FIRST = ("paste", "value", "keys")
+TARGET_ACTIONS = ("click", "type", "fill", "paste")
+VALUE_ACTIONS = ("type", "fill", "paste")
+WAIT_KINDS = ("exists", "gone", "window_exists", "window_gone", "any")
+CONTROL_TYPES = ("Button", "Edit", "Text", "Pane", "Hyperlink", "CheckBox", "ComboBox",
+                 "Document", "Group", "Image", "List", "ListItem", "MenuItem", "Window")
+
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class FlowError(ValueError):
+    """A flow definition is invalid."""
+
+
+# -------------------------------------------------------------
+#  DEFINITIONS
+# -------------------------------------------------------------
+@dataclass(frozen=True)
+class Selector:
+    """
+    How to find one control. auto_id/title/control_type/found_index go to
+    child_window(); `text` is a substring match used by indexed fallbacks.
+    """
+
+    auto_id: str = None
+    title: str = None
+    control_type: str = None
+    found_index: int = None
+    text: str = None
+
+    def criteria(self):
+        return {k: v for k, v in (("auto_id", self.auto_id), ("title", self.title),
+                                  ("control_type", self.control_type),
+                                  ("found_index", self.found_index)) if v is not None}
+
+    def describe(self):
+        parts = [f"{k}={v!r}" for k, v in self.criteria().items()]
+        if self.text:
+            parts.append(f"text~{self.text!r}")
+        return ", ".join(parts)
+
+
+@dataclass(frozen=True)
+class Wait:
+    """Condition to wait for; `any` holds when any of `options` holds."""
+
+    kind: str
+    target: Selector = None
+    window: str = None
+    timeout: float = 15
+    replaces: float = None
+    options: tuple = ()
+
+
+@dataclass(frozen=True)
+class Step:
+    name: str
+    action: str
+    target: Selector = None
+    window: str = HP_SMART_TITLE
+    fallbacks: tuple = ()
+    value: str = None
+    timeout: float = 15
+    wait_after: Wait = None
+    retries: int = 0
+    optional: bool = False
+    log: str = None
+    fail_log: str = None
+
+
+@dataclass(frozen=True)
+class Flow:
+    name: str
+    steps: tuple
+    inputs: tuple = ()
+    precondition: Wait = None
+
+
+# -------------------------------------------------------------
+#  VALIDATION
+# -------------------------------------------------------------
+def _check_selector(sel, where, problems):
+    if not isinstance(sel, Selector):
+        problems.append(f"{where}: expected a Selector, got {sel!r}")
+        return
+    if not (sel.criteria() or sel.text):
+        problems.append(f"{where}: selector has no criteria")
+    if sel.control_type and sel.control_type not in CONTROL_TYPES:
+        problems.append(f"{where}: unknown control_type {sel.control_type!r}")
+
+
+def _check_window(pattern, where, problems):
+    try:
+        re.compile(pattern)
+    except (re.error, TypeError) as e:
+        problems.append(f"{where}: bad window pattern {pattern!r}: {e}")
+
+
+def _check_wait(wait, where, problems):
+    if wait.kind not in WAIT_KINDS:
+        problems.append(f"{where}: unknown wait kind {wait.kind!r}")
+    elif wait.kind == "any":
+        if not wait.options:
+            problems.append(f"{where}: 'any' wait needs options")
+        for i, option in enumerate(wait.options):
+            _check_wait(option, f"{where}.options[{i}]", problems)
+    elif wait.kind in ("exists", "gone") and wait.target is not None:
+        _check_selector(wait.target, where, problems)
+    elif wait.kind in ("window_exists", "window_gone") and wait.window is None:
+        problems.append(f"{where}: {wait.kind!r} wait needs a window pattern")
+    if wait.window is not None:
+        _check_window(wait.window, where, problems)
+
+
+def validate_flow(flow):
+    """Return a list of problems with `flow` (empty when it is valid)."""
+    problems = []
+    seen = set()
+    for s in flow.steps:
+        where = f"{flow.name}.{s.name}"
+        if s.name in seen:
+            problems.append(f"{where}: duplicate step name")
+        seen.add(s.name)
+        if s.action not in ACTIONS:
+            problems.append(f"{where}: unknown action {s.action!r}")
+        if s.action in TARGET_ACTIONS and s.target is None:
+            problems.append(f"{where}: action {s.action!r} needs a target")
+        if s.action in VALUE_ACTIONS and s.value is None:
+            problems.append(f"{where}: action {s.action!r} needs a value")
+        if s.action == "wait" and s.wait_after is None:
+            problems.append(f"{where}: wait step needs wait_after")
+        if s.target is not None:
+            _check_selector(s.target, where, problems)
+        for i, fb in enumerate(s.fallbacks):
+            _check_selector(fb, f"{where}.fallbacks[{i}]", problems)
+        _check_window(s.window, where, problems)
+        if s.wait_after is not None:
+            _check_wait(s.wait_after, f"{where}.wait_after", problems)
+        for text in (s.value, s.log, s.fail_log):
+            for name in _PLACEHOLDER.findall(text or ""):
+                if name not in flow.inputs:
+                    problems.append(f"{where}: placeholder {{{name}}} is not a flow input")
+    if flow.precondition is not None:
+        _check_wait(flow.precondition, f"{flow.name}.precondition", problems)
+    return problems
+
+
+def compile_flows(flows):
+    """Validate every flow and return them by name; raise FlowError on any problem."""
+    problems = []
+    by_name = {}
+    for flow in flows:
+        if flow.name in by_name:
+            problems.append(f"{flow.name}: duplicate flow name")
+        by_name[flow.name] = flow
+        problems.extend(validate_flow(flow))
+    if problems:
+        raise FlowError("Invalid flow definitions:\n  " + "\n  ".join(problems))
+    return by_name
+
+
+def iter_selectors(flows):
+    """Yield (flow, step, window, selector) for every selector the flows use."""
+    def from_wait(flow, s, wait):
+        if wait.kind == "any":
+            for option in wait.options:
+                yield from from_wait(flow, s, option)
+        elif wait.target is not None:
+            yield flow, s, wait.window or s.window, wait.target
+
+    for flow in flows:
+        for s in flow.steps:
+            if s.target is not None:
+                yield flow, s, s.window, s.target
+            for fb in s.fallbacks:
+                yield flow, s, s.window, fb
+            if s.wait_after is not None:
+                yield from from_wait(flow, s, s.wait_after)
+
+
+# -------------------------------------------------------------
+#  EXECUTOR
+# -------------------------------------------------------------
+def _condition(wait, window, desktop, locator, self_spec=None):
+    if wait.kind == "any":
+        return any_of(*(_condition(o, window, desktop, locator, self_spec) for o in wait.options))
+    if wait.kind in ("window_exists", "window_gone"):
+        cond = window_exists(desktop, wait.window)
+        if wait.kind == "window_exists":
+            return cond
+        return lambda: not cond()
+    if wait.window is not None:
+        window = locator.window(desktop, wait.window)
+    spec = window.child_window(**wait.target.criteria()) if wait.target else (self_spec or window)
+    return control_exists(spec) if wait.kind == "exists" else control_gone(spec)
+
+
+def _spec_of(window, ctrl):
+    """A child_window() spec that finds the fallback match `ctrl` again, for its waits."""
+    info = ctrl.element_info
+    criteria = {k: v for k, v in (("auto_id", info.automation_id), ("title", info.name),
+                                  ("control_type", info.control_type)) if v}
+    return window.child_window(**criteria)
+
+
+def _resolve(s, window, locator, name):
+    """Primary selector via child_window(), then fallbacks via the locator index."""
+    try:
+        spec = window.child_window(**s.target.criteria())
+        wait_ready(spec, "visible enabled ready", timeout=s.timeout, name=name)
+        return spec, spec
+    except Exception:
+        if not s.fallbacks:
+            raise
+    for fb in s.fallbacks:
+        if fb.text:
+            ctrl = locator.find_text(window, fb.text, control_type=fb.control_type)
+        else:
+            ctrl = locator.find(window, auto_id=fb.auto_id, title=fb.title,
+                                control_type=fb.control_type)
+        if ctrl is not None:
+            log_step(f"{s.name}: primary selector not found, using fallback ({fb.describe()}).", "INFO")
+            return ctrl, _spec_of(window, ctrl)
+    raise LookupError(f"no control matches {s.target.describe()} or its fallbacks")
+
+
+def _perform(s, ctrl, window, values, name):
+    value = s.value.format(**values) if s.value is not None else None
+    if s.action == "focus_window":
+        wait_ready(window, "exists visible enabled ready", timeout=s.timeout, name=name)
+        window.set_focus()
+    elif s.action == "click":
+        ctrl.click_input()
+    elif s.action in ("type", "fill"):
+        enter_text(ctrl, value, name=s.name, key=f"{s.window}|{s.target.describe()}")
+    elif s.action == "paste":
+        enter_text(ctrl, value, name=s.name, key=f"{s.window}|{s.target.describe()}",
+                   strategies=PASTE_FIRST)
+
+
+def run_step(s, desktop, values=None, locator=LOCATOR, flow=None):
+    """
+    Run one step with its retries. Returns True on success. Its waits are
+    named "<flow>.<step>" when `flow` is given, since steps such as
+    focus_main_window are shared by flows whose waits take different times.
+    """
+    values = values or {}
+    name = f"{flow.name}.{s.name}" if flow is not None else s.name
+    window = locator.window(desktop, s.window)
+    error = None
+    for attempt in range(s.retries + 1):
+        try:
+            ctrl = spec = None
+            if s.target is not None:
+                ctrl, spec = _resolve(s, window, locator, name)
+            _perform(s, ctrl, window, values, name)
+            if s.log:
+                log_step(s.log.format(**values))
+            if s.wait_after is not None:
+                wait = s.wait_after
+                # A post-condition that never holds fails the attempt like an exception;
+                # a target-less wait re-finds the step's control through `spec`
+                wait_until(_condition(wait, window, desktop, locator, spec), timeout=wait.timeout,
+                           name=f"{name}_done", replaces=wait.replaces, raise_on_timeout=True)
+            return True
+        except Exception as e:
+            error = e
+            if attempt < s.retries:
+                count_retry()
+                log_step(f"{s.name}: attempt {attempt + 1} failed ({e}), retrying.", "INFO")
+
+    message = (s.fail_log or f"Step '{s.name}' failed").format(**values)
+    if error is not None and not s.fail_log:
+        message = f"{message}: {error}"
+    log_step(message, "INFO" if s.optional else "FAIL")
+    return False
+
+
+def run_flow(flow, desktop, values=None, locator=LOCATOR):
+    """
+    Execute `flow` step by step. Returns True when every required step
+    passed; stops at the first failed required step or precondition.
+    """
+    values = values or {}
+    missing = [name for name in flow.inputs if name not in values]
+    if missing:
+        raise FlowError(f"{flow.name}: missing inputs {missing}")
+
+    with step(flow.name):
+        if flow.precondition is not None:
+            pre = flow.precondition
+            window = locator.window(desktop, pre.window or HP_SMART_TITLE)
+            if not wait_until(_condition(pre, window, desktop, locator), timeout=pre.timeout,
+                              name=f"{flow.name}_precondition"):
+                log_step(f"Precondition for '{flow.name}' not met, skipping flow.", "FAIL")
+                return False
+        for s in flow.steps:
+            with step(f"{flow.name}.{s.name}"):
+                ok = run_step(s, desktop, values, locator, flow=flow)
+            if not ok and not s.optional:
+                return False
+        return True
+
+
+def flow_done(flow, desktop, locator=LOCATOR):
+    """
+    True if the UI already shows what `flow`'s last step waits for (e.g. the
+    OTP page after signup_form), checked once without waiting. Lets a retry
+    tell "failed" from "got through but reported late".
+    """
+    last = flow.steps[-1]
+    if last.wait_after is None:
+        return False
+    try:
+        window = locator.window(desktop, last.window or HP_SMART_TITLE)
+        return bool(_condition(last.wait_after, window, desktop, locator)())
+    except Exception:
+        return False
+
+
+# -------------------------------------------------------------
+#  FLOWS
+# -------------------------------------------------------------
+MANAGE_ACCOUNT_BTN = Selector(title="Manage HP Account", auto_id="HpcSignedOutIcon", control_type="Button")
+
+FOCUS_HP_SMART = Step("focus_main_window", "focus_window", timeout=30,
+                      log="Focused HP Smart main window.")
+OPEN_ACCOUNT_FLYOUT = Step("open_account_flyout", "click", MANAGE_ACCOUNT_BTN, timeout=15,
+                           log="Clicked Manage HP Account button.")
+
+OPEN_CREATE_ACCOUNT = Flow("open_create_account", (
+    FOCUS_HP_SMART,
+    OPEN_ACCOUNT_FLYOUT,
+    Step("click_create_account", "click",
+         Selector(auto_id="HpcSignOutFlyout_CreateBtn", control_type="Button"),
+         timeout=15, log="Clicked Create Account button."),
+))
+
+OPEN_SIGN_IN = Flow("open_sign_in", (
+    FOCUS_HP_SMART,
+    OPEN_ACCOUNT_FLYOUT,
+    Step("click_sign_in", "click",
+         Selector(auto_id="HpcSignOutFlyout_SignInBtn", control_type="Button"),
+         timeout=10, optional=True, log="Clicked Sign In button.",
+         fail_log="Sign In button not found in flyout, assuming browser is already opened."),
+))
+
+SIGNUP_FORM = Flow("signup_form", (
+    Step("focus_account_window", "focus_window", window=HP_ACCOUNT_TITLE, timeout=30,
+         log="Focused HP Account browser window."),
+    Step("type_first_name", "type", Selector(auto_id="firstName", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, value="{first_name}"),
+    Step("type_last_name", "type", Selector(auto_id="lastName", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, value="{last_name}"),
+    Step("type_email", "type", Selector(auto_id="email", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, value="{email}"),
+    Step("type_password", "type", Selector(auto_id="password", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, value="{password}"),
+    # Form submission is done once the OTP entry screen shows up
+    Step("submit_signup", "click", Selector(auto_id="sign-up-submit", control_type="Button"),
+         window=HP_ACCOUNT_TITLE, timeout=10,
+         log="Filled account form with Name: {first_name} {last_name} | Email: {email}",
+         wait_after=Wait("exists", Selector(auto_id="code", control_type="Edit"),
+                         timeout=20, replaces=6)),
+), inputs=("first_name", "last_name", "email", "password"))
+
+VERIFY_OTP = Flow("verify_otp", (
+    Step("focus_otp_window", "focus_window", window=HP_ACCOUNT_TITLE, timeout=20,
+         log="Focused OTP input screen."),
+    Step("paste_otp", "paste", Selector(auto_id="code", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, value="{otp}", timeout=10, log="OTP pasted successfully."),
+    Step("click_verify", "click", Selector(auto_id="submit-code", control_type="Button"),
+         window=HP_ACCOUNT_TITLE, timeout=10, log="Clicked Verify button.",
+         wait_after=Wait("gone", Selector(auto_id="code", control_type="Edit"),
+                         timeout=15, replaces=4)),
+), inputs=("otp",))
+
+SIGN_IN = Flow("sign_in", (
+    Step("focus_sign_in_window", "focus_window", window=HP_ACCOUNT_TITLE, timeout=60,
+         log="Focused HP Account sign-in browser window."),
+    # Page has finished loading once the username box is in the tree
+    Step("wait_sign_in_page", "wait", window=HP_ACCOUNT_TITLE,
+         wait_after=Wait("exists", Selector(control_type="Edit", found_index=0),
+                         timeout=15, replaces=2)),
+    Step("type_username", "fill", Selector(control_type="Edit", found_index=0),
+         window=HP_ACCOUNT_TITLE, value="{email}", log="Typed email/username: {email}"),
+    Step("click_use_password", "click", Selector(title="Use password", control_type="Button"),
+         window=HP_ACCOUNT_TITLE, timeout=30, log="Clicked 'Use password' button.",
+         wait_after=Wait("gone", timeout=15, replaces=3)),
+    Step("type_password", "fill", Selector(auto_id="password", control_type="Edit"),
+         window=HP_ACCOUNT_TITLE, fallbacks=(Selector(control_type="Edit"),),
+         value="{password}", timeout=30, log="Typed password.",
+         fail_log="No Edit control found for password field."),
+    # Login is complete once the HP account browser window closes
+    Step("click_sign_in", "click", Selector(auto_id="sign-in", control_type="Button"),
+         window=HP_ACCOUNT_TITLE, fallbacks=(Selector(text="Sign in", control_type="Button"),),
+         timeout=30, log="Clicked final 'Sign in' button.",
+         fail_log="Could not locate 'Sign in' button.",
+         wait_after=Wait("window_gone", window=HP_ACCOUNT_TITLE, timeout=20, replaces=6)),
+), inputs=("email", "password"))
+
+SCAN = Flow("scan", (
+    Step("focus_main_window", "focus_window", timeout=30,
+         log="Refocused HP Smart main window before clicking 'Scan'."),
+    # Scan screen is open once the home tile is gone or 'Return Home' shows
+    Step("click_scan", "click", Selector(title="Scan", control_type="Button"),
+         fallbacks=(Selector(text="Scan", control_type="Button"),),
+         log="Clicked 'Scan' button on HP Smart home screen.",
+         fail_log="Could not find 'Scan' button on HP Smart main window.",
+         wait_after=Wait("any", timeout=20, replaces=5, options=(
+             Wait("gone"),
+             Wait("exists", Selector(title="Return Home", control_type="Button")),
+         ))),
+), precondition=Wait("window_exists", window=HP_SMART_TITLE, timeout=30))
+
+RETURN_HOME = Flow("return_home", (
+    Step("focus_main_window", "focus_window", timeout=30,
+         log="Focused HP Smart Scan screen to click 'Return Home'."),
+    Step("click_return_home", "click", Selector(title="Return Home", control_type="Button"),
+         fallbacks=(Selector(text="Return Home", control_type="Button"),),
+         log="Clicked 'Return Home' button on Scan screen.",
+         fail_log="Could not find 'Return Home' button on Scan screen.",
+         wait_after=Wait("gone", timeout=20, replaces=5)),
+), precondition=Wait("window_exists", window=HP_SMART_TITLE, timeout=30))
+
+
+FLOWS = compile_flows([OPEN_CREATE_ACCOUNT, OPEN_SIGN_IN, SIGNUP_FORM, VERIFY_OTP,
+                       SIGN_IN, SCAN, RETURN_HOME])
@@ -0,0 +1,417 @@
+"""
+Unique signup identities at scale.
+
+The scripts used to pick one of 20 x 20 names plus a 4-letter suffix, about
+180 million combinations drawn at random, so a batch of a few thousand
+accounts already risked reusing a mailbox (and its old OTP mail). Here:
+
+  - IdentityFactory maps a seeded permutation of a counter onto a 6-character
+    base-36 mailbox code, so the n-th identity of a seed never repeats
+    (36^6 codes per seed) and names come from 179 x 134 pools;
+  - UsedMailboxes is a persisted bloom filter of every mailbox handed out,
+    so other seeds and earlier runs are skipped too;
+  - pregenerate() writes millions of fixed-width records ahead of time and
+    IdentityFile memory-maps them, so take() is O(1) and the runner never
+    waits on generation. The read cursor lives in the file header, so a
+    later run continues where the previous one stopped.
+
+The scripts and the batch runner call next_identity(). It reads
+IDENTITY_FILE (a pregenerated file), otherwise builds a factory from
+IDENTITY_SEED; IDENTITY_USED_PATH enables the persisted used-mailbox filter.
+
+    python identity.py -n 1000000 -o identities.bin --used used_mailboxes.bloom
+"""
+import argparse
+import atexit
+import hashlib
+import itertools
+import math
+import mmap
+import os
+import random
+import struct
+import threading
+from dataclasses import asdict, dataclass
+
+from otp_providers import MAIL_DOMAIN
+
+
+DEFAULT_PASSWORD = "SecurePassword123"
+
+
+class IdentitiesExhausted(RuntimeError):
+    """A factory ran out of codes or an identity file out of records."""
+
+
+# -------------------------------------------------------------
+#  NAME POOLS
+# -------------------------------------------------------------
+FIRST_NAMES = (
+    "Aaron", "Abigail", "Adam", "Adrian", "Aiden", "Alan", "Albert", "Alex", "Alice", "Alicia",
+    "Allison", "Amanda", "Amber", "Amelia", "Amy", "Andrea", "Andrew", "Angela", "Anna", "Anthony",
+    "Aria", "Arthur", "Ashley", "Audrey", "Austin", "Ava", "Barbara", "Benjamin", "Beth", "Blake",
+    "Brandon", "Brian", "Brianna", "Brooke", "Bruce", "Caleb", "Cameron", "Carl", "Carlos", "Carol",
+    "Caroline", "Catherine", "Charles", "Charlotte", "Chloe", "Chris", "Christian", "Claire", "Cole",
+    "Connor", "Daniel", "David", "Dean", "Diana", "Dominic", "Dylan", "Edward", "Eleanor", "Elena",
+    "Eli", "Elijah", "Elizabeth", "Ella", "Emily", "Emma", "Eric", "Ethan", "Eva", "Evan",
+    "Evelyn", "Felix", "Fiona", "Frank", "Gabriel", "Gavin", "George", "Grace", "Hailey", "Hannah",
+    "Harper", "Harry", "Hazel", "Heather", "Henry", "Hudson", "Ian", "Isaac", "Isabella", "Isla",
+    "Ivy", "Jack", "Jacob", "Jade", "James", "Jane", "Jason", "Jasmine", "Jennifer", "Jeremy",
+    "Jessica", "Joel", "John", "Jordan", "Joseph", "Joshua", "Julia", "Julian", "Justin", "Kate",
+    "Katherine", "Kayla", "Keith", "Kevin", "Kyle", "Laura", "Lauren", "Layla", "Leah", "Leo",
+    "Levi", "Liam", "Lily", "Lincoln", "Logan", "Lucas", "Lucy", "Luke", "Madison", "Maria",
+    "Mark", "Mason", "Matthew", "Maya", "Megan", "Melissa", "Mia", "Michael", "Mila", "Miles",
+    "Molly", "Natalie", "Nathan", "Nicholas", "Nicole", "Noah", "Nora", "Oliver", "Olivia", "Oscar",
+    "Owen", "Paige", "Patrick", "Paul", "Peter", "Rachel", "Rebecca", "Riley", "Robert", "Ruby",
+    "Ryan", "Samantha", "Samuel", "Sara", "Scarlett", "Sean", "Sebastian", "Sophia", "Stella", "Stephen",
+    "Steven", "Taylor", "Thomas", "Tyler", "Victoria", "Vincent", "Violet", "William", "Wyatt", "Zoe",
+)
+
+LAST_NAMES = (
+    "Adams", "Alexander", "Allen", "Alvarez", "Anderson", "Bailey", "Baker", "Barnes", "Bell", "Bennett",
+    "Brooks", "Brown", "Bryant", "Butler", "Campbell", "Carter", "Castillo", "Chavez", "Clark", "Coleman",
+    "Collins", "Cook", "Cooper", "Cox", "Cruz", "Davis", "Diaz", "Edwards", "Ellis", "Evans",
+    "Fisher", "Flores", "Ford", "Foster", "Garcia", "Gibson", "Gomez", "Gonzalez", "Graham", "Gray",
+    "Green", "Griffin", "Hall", "Hamilton", "Harris", "Hayes", "Henderson", "Hernandez", "Hill", "Howard",
+    "Hughes", "Hunt", "Jackson", "James", "Jenkins", "Jimenez", "Johnson", "Jones", "Jordan", "Kelly",
+    "Kennedy", "Kim", "King", "Lee", "Lewis", "Long", "Lopez", "Marshall", "Martin", "Martinez",
+    "Mason", "Mendoza", "Miller", "Mitchell", "Moore", "Morales", "Morgan", "Morris", "Murphy", "Myers",
+    "Nelson", "Nguyen", "Ortiz", "Owens", "Parker", "Patel", "Perez", "Perry", "Peterson", "Phillips",
+    "Powell", "Price", "Ramirez", "Ramos", "Reed", "Reyes", "Reynolds", "Richardson", "Rivera", "Roberts",
+    "Robinson", "Rodriguez", "Rogers", "Ross", "Ruiz", "Russell", "Sanchez", "Sanders", "Scott", "Shaw",
+    "Simmons", "Smith", "Stewart", "Sullivan", "Taylor", "Thomas", "Thompson", "Torres", "Turner", "Walker",
+    "Wallace", "Ward", "Warren", "Washington", "Watson", "Webb", "Wells", "West", "White", "Williams",
+    "Wilson", "Wood", "Wright", "Young",
+)
+
+
+# -------------------------------------------------------------
+#  IDENTITY
+# -------------------------------------------------------------
+@dataclass(frozen=True)
+class Identity:
+    first_name: str
+    last_name: str
+    mailbox: str
+    password: str = DEFAULT_PASSWORD
+    domain: str = MAIL_DOMAIN
+
+    @property
+    def email(self):
+        return f"{self.mailbox}@{self.domain}"
+
+    def as_dict(self):
+        record = asdict(self)
+        del record["domain"]
+        record["email"] = self.email
+        return record
+
+
+# -------------------------------------------------------------
+#  USED MAILBOXES
+# -------------------------------------------------------------
+class UsedMailboxes:
+    """
+    Bloom filter of handed-out mailboxes, memory-mapped from `path`.
+
+    Sized on creation for `capacity` entries at `error_rate` false positives
+    (1M at 1e-6 is a 3.6 MB file); an existing file keeps its own sizing. A
+    false positive only skips an unused mailbox, it never admits a used one.
+    """
+
+    MAGIC = b"HPBLOOM1"
+    _HEADER = struct.Struct("<8sQQI")  # magic, bits, entries, hashes
+
+    def __init__(self, path, capacity=1000000, error_rate=1e-6):
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            with open(path, "wb") as fh:
+                fh.write(self._HEADER.pack(self.MAGIC, bits, 0, hashes))
+                fh.truncate(self._HEADER.size + (bits + 7) // 8)
+        self._fh = open(path, "r+b")
+        self._map = mmap.mmap(self._fh.fileno(), 0)
+        magic, self.bits, self._entries, self.hashes = self._HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a used-mailbox filter")
+
+    def __len__(self):
+        return self._entries
+
+    def _positions(self, mailbox):
+        digest = hashlib.blake2b(mailbox.lower().encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, mailbox):
+        base = self._HEADER.size
+        bits = self._map
+        return all(bits[base + (p >> 3)] & (1 << (p & 7)) for p in self._positions(mailbox))
+
+    def add(self, mailbox):
+        """Mark `mailbox` as used; False when it (probably) already was."""
+        base = self._HEADER.size
+        with self._lock:
+            new = False
+            for p in self._positions(mailbox):
+                byte = self._map[base + (p >> 3)]
+                if not byte & (1 << (p & 7)):
+                    self._map[base + (p >> 3)] = byte | (1 << (p & 7))
+                    new = True
+            if new:
+                self._entries += 1
+                self._HEADER.pack_into(self._map, 0, self.MAGIC, self.bits, self._entries, self.hashes)
+            return new
+
+    def flush(self):
+        with self._lock:
+            self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._map.closed:
+                self._map.flush()
+                self._map.close()
+            self._fh.close()
+
+
+# -------------------------------------------------------------
+#  FACTORY
+# -------------------------------------------------------------
+CODE_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+CODE_LENGTH = 6
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+
+
+def _coprime(rng, modulus):
+    value = rng.randrange(1, modulus)
+    while math.gcd(value, modulus) != 1:
+        value += 1
+    return value % modulus or 1
+
+
+def _base36(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, digit = divmod(value, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class IdentityFactory:
+    """
+    Seeded, thread-safe identity generator.
+
+    The n-th identity of a seed is fixed: its mailbox code is an affine
+    permutation of n over 36^6 values, so a seed yields CODE_SPACE distinct
+    mailboxes without remembering any of them. With `used` (UsedMailboxes)
+    mailboxes already handed out under another seed are skipped.
+    """
+
+    def __init__(self, seed=None, used=None, domain=MAIL_DOMAIN, password=DEFAULT_PASSWORD,
+                 start=0, first_names=FIRST_NAMES, last_names=LAST_NAMES):
+        self.seed = random.SystemRandom().randrange(2 ** 63) if seed is None else seed
+        self.used = used
+        self.domain = domain
+        self.password = password
+        self.position = start
+        self.skipped = 0
+        self.first_names = first_names
+        self.last_names = last_names
+        rng = random.Random(self.seed)
+        self._code_mul = _coprime(rng, CODE_SPACE)
+        self._code_add = rng.randrange(CODE_SPACE)
+        names = len(first_names) * len(last_names)
+        self._name_mul = _coprime(rng, names)
+        self._name_add = rng.randrange(names)
+        self._lock = threading.Lock()
+
+    def identity_at(self, n):
+        """The n-th identity of this seed (ignores `used`)."""
+        code = _base36((self._code_mul * n + self._code_add) % CODE_SPACE)
+        names = (self._name_mul * n + self._name_add) % (len(self.first_names) * len(self.last_names))
+        last, first = divmod(names, len(self.first_names))
+        first, last = self.first_names[first], self.last_names[last]
+        mailbox = f"{first.lower()}.{last.lower()}.{code}test"
+        return Identity(first, last, mailbox, self.password, self.domain)
+
+    def next(self):
+        with self._lock:
+            while self.position < CODE_SPACE:
+                identity = self.identity_at(self.position)
+                self.position += 1
+                if self.used is None or self.used.add(identity.mailbox):
+                    return identity
+                self.skipped += 1
+        raise IdentitiesExhausted(f"seed {self.seed} has no unused mailbox codes left")
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.next()
+            except IdentitiesExhausted:
+                return
+
+
+# -------------------------------------------------------------
+#  PREGENERATED FILES
+# -------------------------------------------------------------
+RECORD_SIZE = 128
+_FILE_MAGIC = b"HPIDENT1"
+_FILE_HEADER = struct.Struct("<8sIQQ64s")  # magic, record size, count, cursor, domain
+_CURSOR_OFFSET = struct.calcsize("<8sIQ")
+
+
+def pregenerate(path, count, factory=None):
+    """
+    Write `count` identities from `factory` to `path` as fixed-width records
+    (first, last, mailbox and password, tab-separated). Returns the count.
+    """
+    factory = factory or IdentityFactory()
+    domain = factory.domain.encode()
+    if len(domain) > 64:
+        raise ValueError(f"mail domain too long for the file header: {factory.domain}")
+    with open(path, "wb") as fh:
+        fh.write(_FILE_HEADER.pack(_FILE_MAGIC, RECORD_SIZE, 0, 0, domain))
+        written = 0
+        # islice, not a break after the fact: one extra draw would be marked used but never written
+        for identity in itertools.islice(factory, count):
+            record = "\t".join((identity.first_name, identity.last_name, identity.mailbox,
+                                identity.password)).encode()
+            if len(record) >= RECORD_SIZE:
+                raise ValueError(f"identity does not fit in {RECORD_SIZE} bytes: {identity.mailbox}")
+            fh.write(record.ljust(RECORD_SIZE - 1) + b"\n")
+            written += 1
+        fh.seek(0)
+        fh.write(_FILE_HEADER.pack(_FILE_MAGIC, RECORD_SIZE, written, 0, domain))
+    if factory.used is not None:
+        factory.used.flush()
+    return written
+
+
+class IdentityFile:
+    """
+    Memory-mapped pregenerated identities.
+
+    take() hands out the next unused record and advances the cursor stored
+    in the file header, so records are never handed out twice, also across
+    runs. One process should take from a file at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = open(path, "r+b")
+        self._map = mmap.mmap(self._fh.fileno(), 0)
+        magic, self.record_size, self.count, self.cursor, domain = _FILE_HEADER.unpack_from(self._map, 0)
+        if magic != _FILE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a pregenerated identity file")
+        self.domain = domain.rstrip(b"\0").decode()
+
+    def __len__(self):
+        return self.count
+
+    def remaining(self):
+        return self.count - self.cursor
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        start = _FILE_HEADER.size + index * self.record_size
+        first, last, mailbox, password = self._map[start:start + self.record_size].decode().rstrip().split("\t")
+        return Identity(first, last, mailbox, password, self.domain)
+
+    def take(self):
+        with self._lock:
+            if self.cursor >= self.count:
+                raise IdentitiesExhausted(f"all {self.count} identities in {self.path} are used")
+            index = self.cursor
+            self.cursor += 1
+            struct.pack_into("<Q", self._map, _CURSOR_OFFSET, self.cursor)
+        return self[index]
+
+    next = take
+
+    def close(self):
+        with self._lock:
+            if not self._map.closed:
+                self._map.flush()
+                self._map.close()
+            self._fh.close()
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE SOURCE
+# -------------------------------------------------------------
+_SOURCE = None
+_SOURCE_LOCK = threading.Lock()
+
+
+def get_identity_source():
+    """
+    Shared identity source: the pregenerated IDENTITY_FILE when set, otherwise
+    an IdentityFactory seeded from IDENTITY_SEED (random when unset) that
+    records used mailboxes in IDENTITY_USED_PATH when set.
+    """
+    global _SOURCE
+    with _SOURCE_LOCK:
+        if _SOURCE is None:
+            path = os.environ.get("IDENTITY_FILE")
+            if path:
+                _SOURCE = IdentityFile(path)
+            else:
+                used_path = os.environ.get("IDENTITY_USED_PATH")
+                seed = os.environ.get("IDENTITY_SEED")
+                _SOURCE = IdentityFactory(
+                    seed=int(seed) if seed else None,
+                    used=UsedMailboxes(used_path) if used_path else None,
+                )
+                if _SOURCE.used is not None:
+                    atexit.register(_SOURCE.used.close)
+            if os.environ.get("HP_SMART_RECORD") or os.environ.get("HP_SMART_BACKEND", "").lower() == "replay":
+                # Recorded runs save the identities they used; replays hand the same ones out
+                from ui_backend import get_backend
+                _SOURCE = get_backend().identities(_SOURCE)
+        return _SOURCE
+
+
+def set_identity_source(source):
+    """Install `source` (None: built from the environment on next use); returns the previous one."""
+    global _SOURCE
+    with _SOURCE_LOCK:
+        previous, _SOURCE = _SOURCE, source
+    return previous
+
+
+def next_identity():
+    """The next unique identity from the shared source."""
+    return get_identity_source().next()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pregenerate unique signup identities.")
+    parser.add_argument("-n", "--count", type=int, default=1000000)
+    parser.add_argument("-o", "--output", default="identities.bin")
+    parser.add_argument("--seed", type=int, help="generator seed (random when omitted)")
+    parser.add_argument("--used", help="used-mailbox filter to check and extend")
+    parser.add_argument("--capacity", type=int, default=1000000, help="filter size when it is created")
+    args = parser.parse_args(argv)
+
+    used = UsedMailboxes(args.used, capacity=args.capacity) if args.used else None
+    try:
+        factory = IdentityFactory(seed=args.seed, used=used)
+        written = pregenerate(args.output, args.count, factory)
+    finally:
+        if used is not None:
+            used.close()
+    print(f"Wrote {written} identities to {args.output} (seed {factory.seed}, skipped {factory.skipped})")
+    return written
+
+
+if __name__ == "__main__":
+    main()
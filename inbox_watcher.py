@@ -0,0 +1,306 @@
+"""
+Shared inbox watcher that multiplexes OTP polling.
+
+With one OtpProvider.fetch_otp() loop per pending signup, 200 signups in
+flight meant 200 independent polling loops. InboxWatcher runs a single loop
+instead: pending mailboxes register with watch(), which returns a Future;
+each tick lists every new message with one bulk call and resolves the
+Future of the message's recipient with its OTP.
+
+Bulk sources:
+
+  MailsacDomainSource  GET /api/domains/{domain}/messages (custom domain)
+  ImapCatchAllSource   UID SEARCH / FETCH of new messages in a catch-all inbox
+
+Enable it for the scripts and the batch runner with OTP_PROVIDER=watch
+(OTP_WATCH_INTERVAL sets the tick, default 1s). The Mailsac source needs
+OTP_DOMAIN to be a domain the API key owns.
+"""
+import imaplib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from urllib.parse import quote
+
+from otp_extract import extract
+from otp_providers import ImapProvider, OtpProvider, extract_otp, listed_as_otp
+from step_log import StepCancelled, log_step
+from waits import check_cancelled
+
+
+# Read message ids remembered while a batch keeps the watcher busy
+SEEN_LIMIT = 5000
+
+
+class InboxMessage:
+    """
+    One listed message for one recipient. `text` is set when the listing
+    includes the body, `code` when the source already extracted it.
+    """
+
+    __slots__ = ("recipient", "id", "received", "text", "code")
+
+    def __init__(self, recipient, message_id, received="", text=None, code=None):
+        self.recipient = recipient.lower()
+        self.id = message_id
+        self.received = received
+        self.text = text
+        self.code = code
+
+
+# -------------------------------------------------------------
+#  BULK SOURCES
+# -------------------------------------------------------------
+class MailsacDomainSource:
+    """Every message of a custom Mailsac domain in one listing call."""
+
+    def __init__(self, provider, domain):
+        self.provider = provider
+        self.domain = domain
+
+    def poll(self):
+        status, body = self.provider.request(f"/api/domains/{quote(self.domain)}/messages")
+        if status != 200:
+            raise RuntimeError(f"Mailsac API returned HTTP {status} for domain {self.domain}")
+        messages = []
+        for m in json.loads(body or b"[]"):
+            if not listed_as_otp(m):
+                continue
+            for to in m.get("to") or ():
+                address = to.get("address") if isinstance(to, dict) else to
+                if address:
+                    messages.append(InboxMessage(address, m["_id"], m.get("received", "")))
+        return messages
+
+    def read(self, message):
+        return self.provider.message_text(message.recipient, message.id)
+
+
+class ImapCatchAllSource:
+    """
+    New messages of a catch-all IMAP inbox, tracked by UID.
+
+    The first poll reads at most `backlog` of the newest messages; later
+    polls fetch only UIDs above the highest one seen.
+    """
+
+    _UID = re.compile(rb"UID (\d+)")
+
+    def __init__(self, provider, backlog=200):
+        self.provider = provider
+        self.backlog = backlog
+        self.last_uid = None
+
+    def _new_uids(self, conn):
+        query = ("ALL",) if self.last_uid is None else ("UID", f"{self.last_uid + 1}:*")
+        typ, data = conn.uid("SEARCH", None, *query)
+        if typ != "OK" or not data or not data[0]:
+            return []
+        uids = [int(u) for u in data[0].split()]
+        if self.last_uid is None:
+            return uids[-self.backlog:]
+        # "n:*" always matches the newest message, even when its UID is below n
+        return [u for u in uids if u > self.last_uid]
+
+    def _fetch(self, conn, uids):
+        messages = []
+        typ, parts = conn.uid("FETCH", ",".join(map(str, uids)), "(RFC822)")
+        if typ != "OK":
+            return messages
+        for part in parts:
+            if not isinstance(part, tuple):
+                continue
+            uid = self._UID.search(part[0])
+            match = extract(part[1]) if uid else None
+            if match is None:
+                continue
+            for address in match.recipients:
+                messages.append(InboxMessage(address, f"imap:{uid.group(1).decode()}",
+                                             match.received, code=match.code))
+        return messages
+
+    def poll(self):
+        pool = self.provider.pool
+        conn = pool.acquire(timeout=30)
+        try:
+            conn.noop()
+            uids = self._new_uids(conn)
+            messages = self._fetch(conn, uids) if uids else []
+        except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError):
+            pool.discard(conn)
+            raise
+        pool.release(conn)
+        if uids:
+            self.last_uid = max(uids)
+        elif self.last_uid is None:
+            self.last_uid = 0
+        return messages
+
+    def read(self, message):
+        return message.text or ""
+
+
+def make_source(provider, domain=None):
+    """Bulk source over an existing API or IMAP provider."""
+    if isinstance(provider, ImapProvider):
+        return ImapCatchAllSource(provider)
+    return MailsacDomainSource(provider, domain or provider.domain)
+
+
+# -------------------------------------------------------------
+#  WATCHER
+# -------------------------------------------------------------
+class InboxWatcher:
+    """
+    One polling loop for many pending mailboxes.
+
+    The loop thread starts on the first watch() and exits when nothing is
+    pending. A new registration is picked up on the next tick rather than
+    triggering a poll of its own. Each message is read at most once per
+    recipient, as long as it is among the last `seen_limit` ids read.
+    """
+
+    def __init__(self, source, interval=1.0, clock=time.monotonic, log=None, seen_limit=SEEN_LIMIT):
+        self.source = source
+        self.interval = interval
+        self.clock = clock
+        self.log = log or log_step
+        self.stats = {"polls": 0, "reads": 0, "resolved": 0, "expired": 0, "errors": 0}
+        self.seen_limit = seen_limit
+        self._waiters = {}
+        self._seen = OrderedDict()  # read (id, recipient) keys, oldest first
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, address, timeout=90):
+        """Future resolved with the OTP sent to `address`, or None after `timeout` seconds."""
+        future = Future()
+        future.set_running_or_notify_cancel()
+        if self._stop.is_set():
+            future.set_result(None)
+            return future
+        with self._lock:
+            self._waiters.setdefault(address.lower(), []).append((self.clock() + timeout, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="inbox-watcher", daemon=True)
+                self._thread.start()
+        return future
+
+    def unwatch(self, future):
+        """Stop watching for the mailbox `future` was returned for."""
+        with self._lock:
+            for address, waiters in list(self._waiters.items()):
+                keep = [(deadline, f) for deadline, f in waiters if f is not future]
+                if keep:
+                    self._waiters[address] = keep
+                else:
+                    del self._waiters[address]
+
+    def pending(self):
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def _expire(self):
+        now = self.clock()
+        expired = []
+        with self._lock:
+            for address, waiters in list(self._waiters.items()):
+                keep = [(deadline, f) for deadline, f in waiters if deadline > now and not f.done()]
+                expired.extend(f for deadline, f in waiters if deadline <= now and not f.done())
+                if keep:
+                    self._waiters[address] = keep
+                else:
+                    del self._waiters[address]
+            # Decided under the lock: once _thread is None, watch() may start a new loop
+            alive = bool(self._waiters)
+            if not alive:
+                # Nothing left to watch: let the loop exit and forget read ids
+                self._thread = None
+                self._seen.clear()
+        for future in expired:
+            self.stats["expired"] += 1
+            future.set_result(None)
+        return alive
+
+    def _dispatch(self, messages):
+        for message in messages:
+            key = (message.id, message.recipient)
+            if key in self._seen:
+                continue
+            with self._lock:
+                waiting = message.recipient in self._waiters
+            if not waiting:
+                continue
+            self._seen[key] = None
+            if len(self._seen) > self.seen_limit:
+                self._seen.popitem(last=False)
+            self.stats["reads"] += 1
+            otp = message.code or extract_otp(self.source.read(message))
+            if not otp:
+                continue
+            with self._lock:
+                waiters = self._waiters.pop(message.recipient, [])
+            for _, future in waiters:
+                if not future.done():
+                    self.stats["resolved"] += 1
+                    future.set_result(otp)
+
+    def poll_once(self):
+        """One bulk listing plus dispatch; returns the number of pending mailboxes left."""
+        self.stats["polls"] += 1
+        try:
+            self._dispatch(self.source.poll())
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log(f"Inbox watcher poll failed: {e}", "INFO")
+        return self.pending()
+
+    def _run(self):
+        while self._expire() and not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.interval)
+
+    def close(self):
+        """Stop the loop and resolve every pending Future with None."""
+        self._stop.set()
+        with self._lock:
+            waiters = [f for ws in self._waiters.values() for _, f in ws]
+            self._waiters.clear()
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+
+# -------------------------------------------------------------
+#  PROVIDER ADAPTER
+# -------------------------------------------------------------
+class WatchedInboxProvider(OtpProvider):
+    """OtpProvider whose fetch_otp() registers with a shared InboxWatcher."""
+
+    name = "watch"
+
+    def __init__(self, watcher, domain=None, log=None):
+        super().__init__(log)
+        self.watcher = watcher
+        if domain:
+            self.domain = domain
+
+    def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+        future = self.watcher.watch(self.address(mailbox), timeout=max_wait)
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except FutureTimeout:
+                pass
+            try:
+                check_cancelled()
+            except StepCancelled:
+                self.watcher.unwatch(future)
+                raise
+
+    def close(self):
+        self.watcher.close()
@@ -0,0 +1,158 @@
+"""
+Durable per-account run ledger.
+
+Until now only the in-memory step log knew how far a signup got, so a
+failure or crash after the form was submitted threw the whole account away
+and the next run repeated the slow UI stages with a new identity. The
+ledger is a SQLite table (WAL journal, one row per mailbox) updated as each
+stage completes:
+
+  identity     identity generated and reserved
+  submit_form  signup form submitted, the OTP mail is on its way
+  fetch_otp    OTP received (stored with the row)
+  verify       OTP entered, account created (status PASS)
+
+resumable() lists the accounts that did not reach PASS, with their last
+completed stage, so a runner can pick them up where they stopped: skip the
+form after submit_form and reuse the stored code after fetch_otp. Resuming
+after submit_form needs the HP account page of that signup to still be open.
+
+The batch runner takes --ledger/--resume; test_otpfinal.main() uses the
+ledger named by RUN_LEDGER. One runner process should use a ledger at a time.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+
+STAGES = ("identity", "submit_form", "fetch_otp", "verify")
+IDENTITY_FIELDS = ("first_name", "last_name", "email", "mailbox", "password")
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    mailbox    TEXT PRIMARY KEY,
+    email      TEXT NOT NULL,
+    first_name TEXT NOT NULL,
+    last_name  TEXT NOT NULL,
+    password   TEXT NOT NULL,
+    stage      TEXT NOT NULL,
+    otp        TEXT,
+    status     TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    run_id     TEXT,
+    error      TEXT,
+    created    REAL NOT NULL,
+    updated    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_status ON accounts (status, created);
+"""
+
+
+def reached(stage, target):
+    """True when `stage` is `target` or a later stage."""
+    return stage is not None and STAGES.index(stage) >= STAGES.index(target)
+
+
+class Ledger:
+    """
+    Account rows in a SQLite file, shared by every worker thread.
+
+    Each update is a single autocommitted statement, so a crash leaves the
+    last completed stage of every account on disk.
+    """
+
+    def __init__(self, path="run_ledger.sqlite", clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self.journal_mode = self._conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _row(row):
+        record = dict(row)
+        record["identity"] = {k: record[k] for k in IDENTITY_FIELDS}
+        return record
+
+    def begin(self, identity, run_id=None):
+        """Open (or reopen) the row for `identity`; its completed stages are kept."""
+        now = self.clock()
+        self._execute(
+            "INSERT INTO accounts (mailbox, email, first_name, last_name, password, stage, status,"
+            " attempts, run_id, created, updated) VALUES (?, ?, ?, ?, ?, 'identity', 'OPEN', 1, ?, ?, ?)"
+            " ON CONFLICT(mailbox) DO UPDATE SET status = 'OPEN', attempts = attempts + 1,"
+            " run_id = excluded.run_id, error = NULL, updated = excluded.updated",
+            (identity["mailbox"], identity["email"], identity["first_name"], identity["last_name"],
+             identity["password"], run_id, now, now),
+        )
+
+    def advance(self, mailbox, stage, otp=None):
+        """Record that `stage` completed (with the OTP after fetch_otp)."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        self._execute(
+            "UPDATE accounts SET stage = ?, otp = COALESCE(?, otp), updated = ? WHERE mailbox = ?",
+            (stage, otp, self.clock(), mailbox),
+        )
+
+    def finish(self, mailbox, status, error=None):
+        """Close the row with PASS or FAIL."""
+        self._execute(
+            "UPDATE accounts SET status = ?, error = ?, updated = ? WHERE mailbox = ?",
+            (status, error, self.clock(), mailbox),
+        )
+
+    def get(self, mailbox):
+        rows = self._execute("SELECT * FROM accounts WHERE mailbox = ?", (mailbox,))
+        return self._row(rows[0]) if rows else None
+
+    def resumable(self, max_attempts=MAX_ATTEMPTS, limit=None):
+        """
+        Unfinished accounts (failed, or left OPEN by a crash) with fewer than
+        `max_attempts` attempts, oldest first.
+        """
+        sql = "SELECT * FROM accounts WHERE status != 'PASS' AND attempts < ? ORDER BY created"
+        params = (max_attempts,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [self._row(r) for r in self._execute(sql, params)]
+
+    def counts(self):
+        """{(stage, status): number of accounts}."""
+        rows = self._execute("SELECT stage, status, COUNT(*) FROM accounts GROUP BY stage, status")
+        return {(stage, status): n for stage, status, n in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE LEDGER
+# -------------------------------------------------------------
+_LEDGER = None
+_LEDGER_LOCK = threading.Lock()
+
+
+def get_ledger():
+    """Shared ledger at RUN_LEDGER, or None when it is not set."""
+    global _LEDGER
+    path = os.environ.get("RUN_LEDGER")
+    if not path:
+        return None
+    with _LEDGER_LOCK:
+        if _LEDGER is None:
+            _LEDGER = Ledger(path)
+            atexit.register(_LEDGER.close)
+        return _LEDGER
@@ -0,0 +1,236 @@
+"""
+Cached UI element locator.
+
+Every flow used to call desktop.window(title_re=...) again and, when a
+child_window() lookup failed, walk descendants() and read window_text() of
+every button one by one. On a large UIA tree each of those walks costs
+hundreds of milliseconds because every property read is a cross-process
+call.
+
+Locator keeps resolved window handles per title pattern and builds a
+ControlIndex of a window in a single descendants() pass, reading each
+control's auto_id, title and control_type exactly once. Fallback lookups
+then become dictionary hits. Cached handles are checked before use and
+dropped (and the index rebuilt) when they have gone stale.
+"""
+import threading
+import time
+
+
+HP_SMART_TITLE = ".*HP Smart.*"
+HP_ACCOUNT_TITLE = ".*HP account.*"
+
+
+def is_alive(ctrl):
+    """True if a resolved wrapper still points at a live element."""
+    try:
+        return bool(ctrl.is_visible())
+    except Exception:
+        return False
+
+
+# -------------------------------------------------------------
+#  CONTROL INDEX
+# -------------------------------------------------------------
+class IndexedControl:
+    """A control plus the properties read while indexing it."""
+
+    __slots__ = ("ctrl", "auto_id", "title", "control_type")
+
+    def __init__(self, ctrl, auto_id, title, control_type):
+        self.ctrl = ctrl
+        self.auto_id = auto_id
+        self.title = title
+        self.control_type = control_type
+
+
+class ControlIndex:
+    """One-pass index of a window's controls by auto_id, title and control_type."""
+
+    def __init__(self, controls, built_at=None):
+        self.built_at = time.monotonic() if built_at is None else built_at
+        self.entries = []
+        self.by_auto_id = {}
+        self.by_title = {}
+        self.by_type = {}
+        for ctrl in controls:
+            info = ctrl.element_info
+            entry = IndexedControl(
+                ctrl,
+                info.automation_id or "",
+                (info.name or "").strip(),
+                info.control_type or "",
+            )
+            self.entries.append(entry)
+            if entry.auto_id:
+                self.by_auto_id.setdefault(entry.auto_id, []).append(entry)
+            if entry.title:
+                self.by_title.setdefault(entry.title, []).append(entry)
+            self.by_type.setdefault(entry.control_type, []).append(entry)
+
+    @classmethod
+    def build(cls, window):
+        return cls(window.descendants())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _candidates(self, auto_id, title, control_type):
+        if auto_id:
+            return self.by_auto_id.get(auto_id, ())
+        if title:
+            return self.by_title.get(title, ())
+        if control_type:
+            return self.by_type.get(control_type, ())
+        return self.entries
+
+    def find_all(self, auto_id=None, title=None, control_type=None):
+        """Controls matching every given criterion exactly, in tree order."""
+        return [
+            e.ctrl for e in self._candidates(auto_id, title, control_type)
+            if (not auto_id or e.auto_id == auto_id)
+            and (not title or e.title == title)
+            and (not control_type or e.control_type == control_type)
+        ]
+
+    def find(self, auto_id=None, title=None, control_type=None):
+        matches = self.find_all(auto_id, title, control_type)
+        return matches[0] if matches else None
+
+    def find_text(self, text, control_type=None):
+        """First control whose title contains `text` (exact titles are a dict hit)."""
+        exact = self.find(title=text, control_type=control_type)
+        if exact is not None:
+            return exact
+        for e in self.by_type.get(control_type, ()) if control_type else self.entries:
+            if text in e.title:
+                return e.ctrl
+        return None
+
+
+# -------------------------------------------------------------
+#  LOCATOR
+# -------------------------------------------------------------
+class Locator:
+    """
+    Caches window specs, their resolved handles and control indexes.
+
+    `index_ttl` bounds how long an index is trusted without a rebuild; a
+    miss or a stale hit always triggers one rebuild.
+    """
+
+    def __init__(self, index_ttl=30.0, clock=time.monotonic):
+        self.index_ttl = index_ttl
+        self.clock = clock
+        self._windows = {}
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self.stats = {"window_hits": 0, "window_misses": 0, "index_builds": 0,
+                      "index_hits": 0, "stale": 0}
+
+    def window(self, desktop, title_re):
+        """WindowSpecification for `title_re`, reused while its handle is alive."""
+        key = (id(desktop), title_re)
+        with self._lock:
+            owner, spec, handle = self._windows.get(key, (None, None, None))
+            # Keeping the owner guards against a recycled id() of another desktop
+            if owner is desktop:
+                if handle is None or is_alive(handle):
+                    self.stats["window_hits"] += 1
+                    return spec
+                self.stats["stale"] += 1
+                self._drop(key)
+            self.stats["window_misses"] += 1
+            spec = desktop.window(title_re=title_re)
+            self._windows[key] = (desktop, spec, None)
+            return spec
+
+    def handle(self, desktop, title_re):
+        """Resolved wrapper of the window (resolving it once and caching the result)."""
+        key = (id(desktop), title_re)
+        spec = self.window(desktop, title_re)
+        with self._lock:
+            _, _, handle = self._windows[key]
+            if handle is None:
+                handle = spec.wrapper_object()
+                self._windows[key] = (desktop, spec, handle)
+            return handle
+
+    def _index(self, window, rebuild=False):
+        key = id(window)
+        with self._lock:
+            owner, cached = self._indexes.get(key, (None, None))
+            fresh = owner is window and (
+                self.index_ttl is None or self.clock() - cached.built_at < self.index_ttl
+            )
+            if fresh and not rebuild:
+                self.stats["index_hits"] += 1
+                return cached, False
+            index = ControlIndex(window.descendants(), built_at=self.clock())
+            self.stats["index_builds"] += 1
+            self._indexes[key] = (window, index)
+            return index, True
+
+    def index(self, window, rebuild=False):
+        """ControlIndex of `window` (a spec or wrapper), built in one descendants() pass."""
+        return self._index(window, rebuild)[0]
+
+    def _lookup(self, window, lookup):
+        """Run `lookup(index)`; rebuild once on a stale hit or a miss in an older index."""
+        index, built = self._index(window)
+        ctrl = lookup(index)
+        if ctrl is not None and is_alive(ctrl):
+            return ctrl
+        if ctrl is not None:
+            self.stats["stale"] += 1
+        elif built:
+            return None
+        ctrl = lookup(self.index(window, rebuild=True))
+        return ctrl if ctrl is not None and is_alive(ctrl) else None
+
+    def find(self, window, auto_id=None, title=None, control_type=None):
+        return self._lookup(window, lambda idx: idx.find(auto_id, title, control_type))
+
+    def find_text(self, window, text, control_type=None):
+        return self._lookup(window, lambda idx: idx.find_text(text, control_type))
+
+    def find_all(self, window, control_type=None):
+        index, built = self._index(window)
+        controls = [c for c in index.find_all(control_type=control_type) if is_alive(c)]
+        if controls or built:
+            return controls
+        return self.index(window, rebuild=True).find_all(control_type=control_type)
+
+    def snapshot(self):
+        """
+        The cached indexes as plain data, without touching the UI:
+        [{"window", "age", "controls": [[control_type, auto_id, title], ...]}].
+        """
+        with self._lock:
+            names = {}
+            for (_, title_re), (_, spec, handle) in self._windows.items():
+                for obj in (spec, handle):
+                    if obj is not None:
+                        names[id(obj)] = title_re
+            now = self.clock()
+            return [{"window": names.get(key), "age": round(now - index.built_at, 3),
+                     "controls": [[e.control_type, e.auto_id, e.title] for e in index.entries]}
+                    for key, (_, index) in self._indexes.items()]
+
+    def _drop(self, key):
+        _, spec, handle = self._windows.pop(key, (None, None, None))
+        for obj in (spec, handle):
+            if obj is not None:
+                self._indexes.pop(id(obj), None)
+
+    def invalidate(self, window=None):
+        """Forget the index of `window`, or every cached window and index."""
+        with self._lock:
+            if window is None:
+                self._windows.clear()
+                self._indexes.clear()
+            else:
+                self._indexes.pop(id(window), None)
+
+
+LOCATOR = Locator()
@@ -0,0 +1,268 @@
+"""
+OTP extraction from raw verification emails.
+
+The old extractor took the first `\\b\\d{6}\\b` anywhere in the rendered
+text of the newest message, so a reference number, a CSS colour (#112233)
+in an HTML-only part or an unrelated newsletter could produce a wrong code
+and cost a full extra flow. This module:
+
+  - scans the header block with precompiled patterns (no email.parser, no
+    body) and drops messages whose sender and subject do not match a known
+    OtpTemplate;
+  - reads the body of the remaining messages once: single-part 7bit/8bit
+    bodies are decoded in place, anything else goes through the MIME
+    parser; text/plain first, HTML (tags stripped) second;
+  - pulls the code with precompiled patterns anchored to a keyword
+    ("code", "passcode") or to a line of its own.
+
+extract_batch() runs over a whole inbox dump and keeps the newest code per
+recipient; iter_mbox() reads such a dump. bench_otp_extract.py measures
+both against the old approach on a 100k-message corpus.
+"""
+import email
+import re
+from dataclasses import dataclass
+from email.header import decode_header, make_header
+from email.utils import parsedate_to_datetime
+from html import unescape
+
+
+# -------------------------------------------------------------
+#  TEMPLATES
+# -------------------------------------------------------------
+@dataclass(frozen=True)
+class OtpTemplate:
+    """Which messages carry a code (sender + subject) and how to find it (codes)."""
+
+    name: str
+    sender: re.Pattern
+    subject: re.Pattern
+    codes: tuple
+
+    def matches(self, sender, subject):
+        return bool(self.sender.search(sender) and self.subject.search(subject))
+
+
+HP_OTP = OtpTemplate(
+    "hp_otp",
+    sender=re.compile(r"@(?:[\w-]+\.)*hp\.com$", re.I),
+    subject=re.compile(r"\b(?:code|passcode|verif\w*)\b", re.I),
+    codes=(
+        # "Your verification code is 123456", "Code: 123456", "passcode - 123456"
+        re.compile(r"\b(?:code|passcode)\b(?:\s+is)?[\s:=\-]*(\d{6})(?!\d)", re.I),
+        # the code alone on its own line (HTML templates render it like this)
+        re.compile(r"^[ \t]*(\d{6})[ \t]*$", re.M),
+    ),
+)
+
+TEMPLATES = (HP_OTP,)
+
+
+def classify(sender, subject, templates=TEMPLATES):
+    """The template matching `sender` (an address) and `subject`, or None."""
+    for template in templates:
+        if template.matches(sender or "", subject or ""):
+            return template
+    return None
+
+
+def find_code(text, template=HP_OTP):
+    """The code in already-rendered message text, or None."""
+    if not text:
+        return None
+    for pattern in template.codes:
+        match = pattern.search(text)
+        if match:
+            return match.group(1)
+    return None
+
+
+# -------------------------------------------------------------
+#  MIME
+# -------------------------------------------------------------
+_HEADER_END = re.compile(rb"\r?\n\r?\n")
+_HEADER_LINE = re.compile(rb"^([!-9;-~]+):[ \t]*(.*(?:\r?\n[ \t].*)*)", re.M)
+_FOLD = re.compile(rb"\r?\n[ \t]+")
+_ADDRESS = re.compile(r"<([^<>\s]+@[^<>\s]+)>|([^\s<>,;:\"]+@[^\s<>,;:\"]+)")
+_CHARSET = re.compile(r"charset=\"?([\w.:-]+)", re.I)
+_HTML_DROP = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.I | re.S)
+_HTML_BREAK = re.compile(r"<(?:br|/p|/div|/tr|/td|/h\d|/li)\b[^>]*>", re.I)
+_HTML_TAG = re.compile(r"<[^>]+>")
+_SPACES = re.compile(r"[ \t\xa0]+")
+
+
+def html_to_text(html):
+    """Rough but fast HTML rendering: drop scripts/styles and tags, keep block breaks."""
+    text = _HTML_DROP.sub(" ", html)
+    text = _HTML_BREAK.sub("\n", text)
+    text = unescape(_HTML_TAG.sub(" ", text))
+    return _SPACES.sub(" ", text)
+
+
+def header_text(value):
+    """Decode RFC 2047 encoded words (=?utf-8?...?=) in a header value."""
+    value = value or ""
+    if "=?" not in value:
+        return value
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def parse_headers(raw):
+    """({lower-case name: [values]}, body offset) from the header block of `raw`."""
+    end = _HEADER_END.search(raw)
+    head = raw[:end.start()] if end else raw
+    headers = {}
+    for name, value in _HEADER_LINE.findall(head):
+        value = _FOLD.sub(b" ", value).decode("utf-8", "replace").strip()
+        headers.setdefault(name.decode("ascii").lower(), []).append(value)
+    return headers, end.end() if end else len(raw)
+
+
+def addresses(values):
+    """Lower-cased addresses in header values, in order, without duplicates."""
+    found = []
+    for value in values:
+        for bracketed, bare in _ADDRESS.findall(value):
+            address = (bracketed or bare).lower()
+            if address not in found:
+                found.append(address)
+    return found
+
+
+def _decode(data, charset):
+    try:
+        return data.decode(charset or "utf-8", "replace")
+    except LookupError:
+        return data.decode("utf-8", "replace")
+
+
+def _body_texts(raw, headers, body_start):
+    """Texts of the body; simple single-part bodies skip the MIME parser."""
+    ctype = (headers.get("content-type") or ["text/plain"])[0]
+    encoding = (headers.get("content-transfer-encoding") or ["7bit"])[0].lower()
+    kind = ctype.split(";", 1)[0].strip().lower()
+    if kind in ("text/plain", "text/html") and encoding in ("7bit", "8bit"):
+        charset = _CHARSET.search(ctype)
+        text = _decode(raw[body_start:], charset.group(1) if charset else None)
+        return [text if kind == "text/plain" else html_to_text(text)]
+    return _texts(email.message_from_bytes(raw))
+
+
+def _texts(msg):
+    """text/plain parts, then text/html parts rendered to text."""
+    plain, html = [], []
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_maintype() != "text":
+            continue
+        if (part.get("Content-Disposition") or "").lower().startswith("attachment"):
+            continue
+        payload = part.get_payload(decode=True) or b""
+        text = _decode(payload, part.get_content_charset())
+        if part.get_content_subtype() == "plain":
+            plain.append(text)
+        elif part.get_content_subtype() == "html":
+            html.append(text)
+    return plain + [html_to_text(h) for h in html]
+
+
+def message_text(raw):
+    """Text of a raw RFC 822 message (text/plain first, rendered HTML as fallback)."""
+    texts = _texts(email.message_from_bytes(raw))
+    return texts[0] if texts else ""
+
+
+def _timestamp(date):
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except Exception:
+        return 0.0
+
+
+class OtpMatch:
+    """A code found in one message."""
+
+    __slots__ = ("code", "template", "sender", "recipients", "subject", "received", "message_id")
+
+    def __init__(self, code, template, sender, recipients, subject, received, message_id):
+        self.code = code
+        self.template = template
+        self.sender = sender
+        self.recipients = recipients
+        self.subject = subject
+        self.received = received
+        self.message_id = message_id
+
+    def __repr__(self):
+        return f"OtpMatch({self.code!r}, {self.template!r}, to={self.recipients!r})"
+
+
+def extract(raw, templates=TEMPLATES):
+    """
+    OtpMatch for one raw message, or None.
+
+    Headers are checked first; the body is only read for messages whose
+    sender and subject match a template.
+    """
+    headers, body_start = parse_headers(raw)
+    senders = addresses(headers.get("from", ()))
+    subject = header_text((headers.get("subject") or [""])[0])
+    template = classify(senders[0] if senders else "", subject, templates)
+    if template is None:
+        return None
+    for text in _body_texts(raw, headers, body_start):
+        code = find_code(text, template)
+        if code:
+            recipients = addresses(headers.get("to", []) + headers.get("delivered-to", [])
+                                   + headers.get("x-original-to", []))
+            return OtpMatch(code, template.name, senders[0], tuple(recipients), subject,
+                            _timestamp((headers.get("date") or [""])[0]),
+                            (headers.get("message-id") or [None])[0])
+    return None
+
+
+# -------------------------------------------------------------
+#  BATCH
+# -------------------------------------------------------------
+def iter_matches(raws, templates=TEMPLATES):
+    """Yield an OtpMatch for every message in `raws` that carries a code."""
+    for raw in raws:
+        match = extract(raw, templates)
+        if match is not None:
+            yield match
+
+
+def extract_batch(raws, recipient=None, templates=TEMPLATES):
+    """
+    Newest OtpMatch per recipient over a whole inbox dump (an iterable of
+    raw messages). With `recipient`, only that address is kept.
+    """
+    recipient = recipient.lower() if recipient else None
+    newest = {}
+    for match in iter_matches(raws, templates):
+        for address in match.recipients:
+            if recipient and address != recipient:
+                continue
+            current = newest.get(address)
+            if current is None or match.received >= current.received:
+                newest[address] = match
+    return newest
+
+
+def iter_mbox(path):
+    """Raw messages of an mbox file, read sequentially (">From " unescaping included)."""
+    lines = []
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(b"From "):
+                if lines:
+                    yield b"".join(lines)
+                lines = []
+                continue
+            if line.startswith(b">From "):
+                line = line[1:]
+            lines.append(line)
+    if lines:
+        yield b"".join(lines)
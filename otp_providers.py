@@ -0,0 +1,466 @@
+"""
+Pluggable OTP providers.
+
+Every provider answers one question: "what is the 6-digit code in the newest
+HP verification email for this mailbox?". The HTTP-API and IMAP backends talk
+to the mail service directly over pooled keep-alive connections and stop
+polling as soon as a matching message arrives. The Selenium backend is the
+original Mailsac inbox scraper, kept as a fallback.
+
+Select a backend with OTP_PROVIDER=api|imap|watch|selenium. Without it, the API
+backend is used when MAILSAC_API_KEY is set, Selenium otherwise. Each backend
+imports its client library (http.client, imaplib, selenium) on first use.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from artifacts import remember, watch_driver
+from otp_extract import classify, extract, find_code
+from resilience import CircuitOpen, get_breaker
+from step_log import count_retry, log_step, waiting
+from waits import check_cancelled, wait_until
+
+
+MAILSAC_DOMAIN = "mailsac.com"
+# Domain of the generated signup addresses (a custom domain for OTP_PROVIDER=watch)
+MAIL_DOMAIN = os.environ.get("OTP_DOMAIN", MAILSAC_DOMAIN)
+# Older messages are only read when the newest ones carry no code
+MAX_CANDIDATES = 3
+# Truthy poll result that ends a wait once the mailsac breaker is open
+_OPEN = object()
+
+
+def extract_otp(text):
+    """Return the verification code in rendered message `text`, or None (see otp_extract)."""
+    return find_code(text)
+
+
+def listed_as_otp(message):
+    """False when a listing entry's sender and subject match no OTP template."""
+    senders = [f.get("address", "") for f in message.get("from") or () if isinstance(f, dict)]
+    subject = message.get("subject")
+    if not senders or subject is None:
+        return True
+    return any(classify(sender.lower(), subject) for sender in senders)
+
+
+# -------------------------------------------------------------
+#  CONNECTION POOL
+# -------------------------------------------------------------
+class ConnectionPool:
+    """
+    Fixed-size pool of keep-alive connections.
+
+    `factory()` opens a new connection and `closer(conn)` shuts one down.
+    Connections are created lazily and reused until a caller reports them
+    broken with discard().
+    """
+
+    def __init__(self, factory, closer, size=4):
+        self.factory = factory
+        self.closer = closer
+        self.size = size
+        self.created = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No pooled connection available")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            conn = self.factory()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def release(self, conn):
+        self._idle.put(conn)
+        self._slots.release()
+
+    def discard(self, conn):
+        try:
+            self.closer(conn)
+        except Exception:
+            pass
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self.closer(conn)
+            except Exception:
+                pass
+
+
+# -------------------------------------------------------------
+#  PROVIDER INTERFACE
+# -------------------------------------------------------------
+class OtpProvider:
+    """Base class: fetch the OTP for `mailbox` (local part of the address)."""
+
+    name = "base"
+    domain = MAIL_DOMAIN
+
+    def __init__(self, log=None):
+        self.log = log or log_step
+
+    def address(self, mailbox):
+        return mailbox if "@" in mailbox else f"{mailbox}@{self.domain}"
+
+    def check_once(self, mailbox):
+        """Return the OTP if a matching message is already there, else None."""
+        raise NotImplementedError
+
+    def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+        """
+        Poll until a matching message arrives or `max_wait` expires.
+
+        Every poll is recorded on the shared "mailsac" circuit breaker; once
+        it opens, the wait ends with CircuitOpen instead of running out
+        (or, in pause mode, polls are skipped until the cooldown is over).
+        """
+        breaker = get_breaker("mailsac")
+
+        def poll():
+            token = breaker.allow()
+            if not token:
+                return _OPEN if breaker.on_open != "pause" else None
+            try:
+                otp = self.check_once(mailbox)
+            except Exception:
+                breaker.record(False, token)
+                raise
+            except BaseException:
+                breaker.cancel(token)
+                raise
+            breaker.record(True, token)
+            return otp
+
+        otp = wait_until(
+            poll,
+            timeout=max_wait,
+            interval=min(0.25, poll_interval),
+            max_interval=poll_interval,
+            name=f"{self.name}_otp",
+            tune=False,  # max_wait is the caller's budget, not a learned one
+        )
+        if otp is _OPEN:
+            raise CircuitOpen(f"circuit mailsac is open, next trial in {breaker.remaining():.0f}s")
+        return otp
+
+    def close(self):
+        pass
+
+
+# -------------------------------------------------------------
+#  HTTP API BACKEND
+# -------------------------------------------------------------
+class MailsacApiProvider(OtpProvider):
+    """
+    Mailsac REST API backend.
+
+    Lists /api/addresses/{email}/messages and reads the newest messages that
+    look like verification emails with /api/text/{email}/{id}. Requests
+    share a pool of HTTP/1.1 keep-alive connections.
+    """
+
+    name = "api"
+
+    def __init__(self, api_key, base_url="https://mailsac.com", pool_size=4,
+                 timeout=10, log=None):
+        super().__init__(log)
+        self.api_key = api_key
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.pool = ConnectionPool(self._connect, lambda conn: conn.close(), size=pool_size)
+
+    def _connect(self):
+        import http.client
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, path):
+        """GET `path` and return (status, body bytes), retrying once on a dropped connection."""
+        import http.client
+        headers = {"Mailsac-Key": self.api_key, "Connection": "keep-alive"}
+        for attempt in range(2):
+            conn = self.pool.acquire(timeout=self.timeout)
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                self.pool.discard(conn)
+                if attempt:
+                    raise
+                count_retry()
+                continue
+            if resp.will_close:
+                self.pool.discard(conn)
+            else:
+                self.pool.release(conn)
+            return resp.status, body
+
+    def list_messages(self, address):
+        status, body = self.request(f"/api/addresses/{quote(address)}/messages")
+        if status != 200:
+            raise RuntimeError(f"Mailsac API returned HTTP {status} for {address}")
+        return json.loads(body or b"[]")
+
+    def message_text(self, address, message_id):
+        status, body = self.request(f"/api/text/{quote(address)}/{quote(message_id)}")
+        if status != 200:
+            raise RuntimeError(f"Mailsac API returned HTTP {status} for message {message_id}")
+        return body.decode("utf-8", "replace")
+
+    def check_once(self, mailbox):
+        address = self.address(mailbox)
+        messages = [m for m in self.list_messages(address) if listed_as_otp(m)]
+        messages.sort(key=lambda m: m.get("received", ""), reverse=True)
+        for message in messages[:MAX_CANDIDATES]:
+            otp = extract_otp(self.message_text(address, message["_id"]))
+            if otp:
+                return otp
+        return None
+
+    def close(self):
+        self.pool.close()
+
+
+# -------------------------------------------------------------
+#  IMAP BACKEND
+# -------------------------------------------------------------
+class ImapProvider(OtpProvider):
+    """
+    IMAP backend for a catch-all inbox.
+
+    Searches INBOX for messages addressed to the mailbox and returns the
+    code of the newest one that matches an OTP template. Logged-in
+    connections are kept in a pool and checked with NOOP before reuse.
+    """
+
+    name = "imap"
+
+    def __init__(self, host, user, password, port=None, use_ssl=True,
+                 folder="INBOX", pool_size=2, log=None):
+        super().__init__(log)
+        self.host = host
+        self.port = port or (993 if use_ssl else 143)
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.folder = folder
+        self.pool = ConnectionPool(self._connect, self._logout, size=pool_size)
+
+    def _connect(self):
+        import imaplib
+        cls = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        conn = cls(self.host, self.port)
+        conn.login(self.user, self.password)
+        conn.select(self.folder, readonly=True)
+        return conn
+
+    @staticmethod
+    def _logout(conn):
+        conn.logout()
+
+    def _newest_match(self, conn, address):
+        conn.noop()  # refreshes EXISTS and detects dead connections
+        typ, data = conn.search(None, "TO", f'"{address}"')
+        if typ != "OK" or not data or not data[0]:
+            return None
+        for num in reversed(data[0].split()[-MAX_CANDIDATES:]):
+            typ, parts = conn.fetch(num, "(RFC822)")
+            if typ != "OK":
+                continue
+            for part in parts:
+                if isinstance(part, tuple):
+                    match = extract(part[1])
+                    if match is not None:
+                        return match
+        return None
+
+    def check_once(self, mailbox):
+        import imaplib
+        address = self.address(mailbox)
+        conn = self.pool.acquire(timeout=30)
+        try:
+            match = self._newest_match(conn, address)
+        except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError):
+            self.pool.discard(conn)
+            raise
+        self.pool.release(conn)
+        return match.code if match else None
+
+    def close(self):
+        self.pool.close()
+
+
+# -------------------------------------------------------------
+#  SELENIUM FALLBACK BACKEND
+# -------------------------------------------------------------
+class SeleniumProvider(OtpProvider):
+    """
+    Original Mailsac web-inbox scraper.
+
+    Borrows a warm headless Chrome session from driver_pool, opens the
+    mailbox and reads #emailBody of the first inbox row. The session goes
+    back to the pool, reset, as soon as the code has been read.
+    """
+
+    name = "selenium"
+
+    def __init__(self, log=None, pool=None):
+        super().__init__(log)
+        self.pool = pool
+
+    def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+        from driver_pool import get_driver_pool
+
+        pool = self.pool or get_driver_pool()
+        with get_breaker("mailsac").guard(), pool.session(timeout=max_wait) as driver, watch_driver(driver):
+            return self._scrape(driver, mailbox, max_wait, poll_interval)
+
+    def _scrape(self, driver, mailbox, max_wait, poll_interval):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        wait = WebDriverWait(driver, 20)
+
+        with waiting("mailsac_page_load"):
+            driver.get("https://mailsac.com")
+            remember("mailsac", mailbox=mailbox)
+            self.log("Opened Mailsac website.")
+
+            mailbox_field = wait.until(
+                EC.presence_of_element_located((By.XPATH, "//input[@placeholder='mailbox']"))
+            )
+        mailbox_field.send_keys(mailbox)
+
+        check_btn = wait.until(
+            EC.element_to_be_clickable((By.XPATH, "//button[normalize-space()='Check the mail!']"))
+        )
+        check_btn.click()
+        self.log("Opened Mailsac inbox.")
+
+        start_time = time.time()
+        while time.time() - start_time < max_wait:
+            check_cancelled()
+            try:
+                with waiting("mailsac_inbox_row"):
+                    email_row = WebDriverWait(driver, poll_interval).until(
+                        EC.presence_of_element_located(
+                            (By.XPATH,
+                             "//table[contains(@class,'inbox-table')]/tbody/tr[contains(@class,'clickable')][1]")
+                        )
+                    )
+                email_row.click()
+                self.log("Clicked on first email row.")
+                break
+            except Exception:
+                # Refresh inbox and retry
+                count_retry()
+                try:
+                    driver.find_element(By.XPATH, "//button[normalize-space()='Check the mail!']").click()
+                    self.log("Refreshed Mailsac inbox.", "INFO")
+                except Exception as refresh_err:
+                    self.log(f"Unable to refresh inbox: {refresh_err}", "FAIL")
+                    break
+
+        with waiting("mailsac_email_body"):
+            body_elem = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "#emailBody")))
+        return extract_otp(body_elem.text)
+
+
+# -------------------------------------------------------------
+#  FACTORY
+# -------------------------------------------------------------
+_SHARED = {}
+_SHARED_LOCK = threading.RLock()
+
+
+def get_otp_provider(name=None, log=None):
+    """
+    Return the configured provider.
+
+    API and IMAP providers are shared per process so their connection pools
+    are reused across signups; Selenium providers are cheap wrappers around
+    the shared browser pool in driver_pool.py. While HP_SMART_RECORD is set
+    the provider is wrapped so its fetches land in the cassette.
+    """
+    provider = _make_provider(name, log)
+    if os.environ.get("HP_SMART_RECORD"):
+        from ui_backend import get_backend
+        provider = get_backend().wrap_provider(provider)
+    return provider
+
+
+def _make_provider(name, log):
+    backend = os.environ.get("HP_SMART_BACKEND", "").lower()
+    name = name or ("replay" if backend == "replay" else None) or os.environ.get("OTP_PROVIDER") or (
+        "api" if os.environ.get("MAILSAC_API_KEY")
+        else "sim" if backend == "sim"
+        else "selenium"
+    )
+    if name == "replay":
+        # Recorded mail responses come with the cassette
+        from ui_backend import get_backend
+        return get_backend().otp_provider(log=log)
+    if name == "selenium":
+        return SeleniumProvider(log=log)
+    if name == "sim":
+        # The simulated mail server lives in the active (sim) UI backend
+        from sim_ui import SimOtpProvider
+        from ui_backend import get_backend
+        return SimOtpProvider(get_backend().app, log=log)
+
+    with _SHARED_LOCK:
+        provider = _SHARED.get(name)
+        if provider is None:
+            if name == "api":
+                provider = MailsacApiProvider(
+                    os.environ["MAILSAC_API_KEY"],
+                    base_url=os.environ.get("MAILSAC_BASE_URL", "https://mailsac.com"),
+                    log=log,
+                )
+            elif name == "watch":
+                # One bulk polling loop over the IMAP catch-all or the Mailsac domain
+                from inbox_watcher import InboxWatcher, WatchedInboxProvider, make_source
+                inner = _make_provider("imap" if os.environ.get("IMAP_HOST") else "api", log=log)
+                watcher = InboxWatcher(make_source(inner),
+                                       interval=float(os.environ.get("OTP_WATCH_INTERVAL", "1.0")),
+                                       log=log)
+                provider = WatchedInboxProvider(watcher, log=log)
+            elif name == "imap":
+                provider = ImapProvider(
+                    os.environ["IMAP_HOST"],
+                    os.environ["IMAP_USER"],
+                    os.environ["IMAP_PASSWORD"],
+                    port=int(os.environ["IMAP_PORT"]) if os.environ.get("IMAP_PORT") else None,
+                    use_ssl=os.environ.get("IMAP_SSL", "1") != "0",
+                    log=log,
+                )
+            else:
+                raise ValueError(f"Unknown OTP provider: {name}")
+            _SHARED[name] = provider
+        return provider
@@ -0,0 +1,124 @@
+"""
+Stage pipelining helpers.
+
+start_otp_watch() begins polling the mailbox in a background thread as soon
+as the mailbox name is known, so browser startup and the first polls happen
+while the HP Smart form is still being filled. The verification step then
+just waits on the returned OtpWatch, and cancels it when the form was never
+submitted so no abandoned poll runs out its budget in the background.
+
+StageTimeline records when each stage ran (from any thread) and reports how
+much the stages overlapped.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+
+from step_log import StepCancelled
+from waits import cancel_waits_on
+
+
+class StageTimeline:
+    """Thread-safe record of (stage, start, end) intervals on the monotonic clock."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.origin = clock()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, start, self.clock())
+
+    def add(self, name, start, end):
+        with self._lock:
+            self._spans.append((name, start, end))
+
+    def spans(self, name=None):
+        with self._lock:
+            return [s for s in self._spans if name is None or s[0] == name]
+
+    def duration(self, name):
+        return sum(end - start for _, start, end in self.spans(name))
+
+    def overlap(self, first, second):
+        """Seconds during which a `first` stage and a `second` stage both ran."""
+        total = 0.0
+        for _, a_start, a_end in self.spans(first):
+            for _, b_start, b_end in self.spans(second):
+                total += max(0.0, min(a_end, b_end) - max(a_start, b_start))
+        return total
+
+    def summary(self, background="otp_watch"):
+        """One-line summary: each stage's duration and its overlap with `background`."""
+        names = []
+        for name, _, _ in self.spans():
+            if name not in names:
+                names.append(name)
+        parts = [f"{name} {self.duration(name):.2f}s" for name in names]
+        overlapped = sum(self.overlap(background, name) for name in names if name != background)
+        return f"Stages: {' | '.join(parts)} | {background} overlapped {overlapped:.2f}s"
+
+    def as_dict(self):
+        return [
+            {"stage": name, "start": round(start - self.origin, 4), "end": round(end - self.origin, 4)}
+            for name, start, end in self.spans()
+        ]
+
+
+class OtpWatch(Future):
+    """Future of a background mailbox poll; cancel() also stops the poll itself."""
+
+    def __init__(self):
+        super().__init__()
+        self.stop = threading.Event()
+
+    def cancel(self):
+        """Stop the poll's waits and cancel the Future unless it already has a result."""
+        self.stop.set()
+        return super().cancel()
+
+
+def start_otp_watch(fetch, mailbox, timeline=None, stage="otp_watch", **kwargs):
+    """
+    Run `fetch(mailbox, **kwargs)` in a daemon thread and return an OtpWatch
+    with its result. Once the watch is cancelled, waits in the thread raise
+    StepCancelled, so the fetch ends quietly instead of logging a failure
+    into the run it was started from.
+    """
+    watch = OtpWatch()
+
+    def run():
+        cancel_waits_on(watch.stop)
+        clock = timeline.clock if timeline is not None else time.monotonic
+        start = clock()
+        try:
+            result = fetch(mailbox, **kwargs)
+        except StepCancelled:
+            result = error = None
+        except BaseException as e:
+            error = e
+        else:
+            error = None
+        # Record the span before resolving the future so waiters see it
+        if timeline is not None:
+            timeline.add(stage, start, clock())
+        try:
+            if error is None:
+                watch.set_result(result)
+            else:
+                watch.set_exception(error)
+        except InvalidStateError:
+            pass  # cancelled meanwhile
+
+    # Carry the caller's context (run id, worker id, step) into the watcher thread
+    ctx = contextvars.copy_context()
+    threading.Thread(target=ctx.run, args=(run,), name=f"otp-watch-{mailbox}", daemon=True).start()
+    return watch
@@ -0,0 +1,221 @@
+"""
+Step profiles from the step log: Chrome trace and Prometheus metrics.
+
+Every @step scope already records a "step" event with its wall time; since
+waits (wait_until, wait_ready, waiting()) and retries are charged to the
+enclosing steps, each step event also carries `wait` (seconds spent waiting
+on the UI, the mailbox or a page load) and `retries`. Acting time is the
+rest. This module turns a recorded NDJSON log into:
+
+  chrome_trace()    Trace Event JSON (open it in ui.perfetto.dev or
+                    chrome://tracing): one process per run, one track per
+                    worker, steps and waits as nested slices, log lines as
+                    instant events;
+  prometheus_text() Prometheus text exposition: per-step duration
+                    histograms, wait/action seconds, retries and outcomes.
+
+Both scripts write reports/run_<id>.trace.json and reports/metrics.prom next
+to their HTML reports.
+
+    python profiling.py [--log automation_steps.ndjson] [--run RUN_ID]
+                        [--trace trace.json] [--metrics metrics.prom]
+"""
+import argparse
+import json
+import os
+
+from step_log import DEFAULT_PATH, iter_events
+
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# -------------------------------------------------------------
+#  AGGREGATION
+# -------------------------------------------------------------
+class StepProfile:
+    """Totals for one step name."""
+
+    __slots__ = ("calls", "failed", "wall", "wait", "retries", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.failed = 0
+        self.wall = 0.0
+        self.wait = 0.0
+        self.retries = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+    @property
+    def action(self):
+        return max(0.0, self.wall - self.wait)
+
+    def add(self, event):
+        duration = event.get("duration", 0.0)
+        self.calls += 1
+        self.failed += event.get("status") == "FAIL"
+        self.wall += duration
+        self.wait += min(event.get("wait", 0.0), duration)
+        self.retries += event.get("retries", 0)
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self):
+        return {"calls": self.calls, "failed": self.failed, "wall": round(self.wall, 4),
+                "wait": round(self.wait, 4), "action": round(self.action, 4), "retries": self.retries}
+
+
+def step_profiles(events):
+    """({step: StepProfile}, {wait name: [seconds, count, timeouts]}) over `events`."""
+    steps, waits = {}, {}
+    for event in events:
+        kind = event.get("kind")
+        if kind == "step":
+            steps.setdefault(event["step"], StepProfile()).add(event)
+        elif kind == "wait":
+            totals = waits.setdefault(event["step"], [0.0, 0, 0])
+            totals[0] += event.get("duration", 0.0)
+            totals[1] += 1
+            totals[2] += event.get("status") == "TIMEOUT"
+    return steps, waits
+
+
+# -------------------------------------------------------------
+#  CHROME TRACE
+# -------------------------------------------------------------
+def chrome_trace(events):
+    """Trace Event Format dict: steps and waits as complete ("X") slices."""
+    trace = []
+    pids, tids = {}, {}
+
+    def ids(event):
+        run, worker = event.get("run") or "run", event.get("worker") or "main"
+        if run not in pids:
+            pids[run] = len(pids) + 1
+            trace.append({"ph": "M", "name": "process_name", "pid": pids[run], "tid": 0,
+                          "args": {"name": f"run {run}"}})
+        key = (run, worker)
+        if key not in tids:
+            tids[key] = len(tids) + 1
+            trace.append({"ph": "M", "name": "thread_name", "pid": pids[run], "tid": tids[key],
+                          "args": {"name": worker}})
+        return pids[run], tids[key]
+
+    for event in events:
+        kind = event.get("kind")
+        pid, tid = ids(event)
+        ts = round(event["t"] * 1e6, 1)
+        if kind in ("step", "wait"):
+            duration = event.get("duration", 0.0)
+            args = {"status": event.get("status")}
+            if kind == "step":
+                wait = min(event.get("wait", 0.0), duration)
+                args.update(wait_s=round(wait, 6), action_s=round(duration - wait, 6),
+                            retries=event.get("retries", 0))
+            trace.append({"ph": "X", "cat": kind, "name": event["step"], "pid": pid, "tid": tid,
+                          "ts": ts, "dur": round(duration * 1e6, 1), "args": args})
+        elif kind == "log":
+            trace.append({"ph": "i", "s": "t", "cat": "log", "name": event.get("desc", ""),
+                          "pid": pid, "tid": tid, "ts": ts,
+                          "args": {"status": event.get("status"), "step": event.get("step")}})
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+# -------------------------------------------------------------
+#  PROMETHEUS
+# -------------------------------------------------------------
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _bound(value):
+    return f"{value:g}"
+
+
+def prometheus_text(events, prefix="hp_automation"):
+    """Prometheus text exposition (version 0.0.4) of the step profiles."""
+    steps, waits = step_profiles(events)
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+    family("step_duration_seconds", "histogram", "Wall time of automation steps.")
+    for name, p in sorted(steps.items()):
+        label = f'step="{_label(name)}"'
+        for bound, count in zip(DURATION_BUCKETS, p.buckets):
+            lines.append(f'{prefix}_step_duration_seconds_bucket{{{label},le="{_bound(bound)}"}} {count}')
+        lines.append(f'{prefix}_step_duration_seconds_bucket{{{label},le="+Inf"}} {p.calls}')
+        lines.append(f"{prefix}_step_duration_seconds_sum{{{label}}} {p.wall:.6f}")
+        lines.append(f"{prefix}_step_duration_seconds_count{{{label}}} {p.calls}")
+
+    family("step_wait_seconds_total", "counter", "Time steps spent waiting (UI, mailbox, page loads).")
+    for name, p in sorted(steps.items()):
+        lines.append(f'{prefix}_step_wait_seconds_total{{step="{_label(name)}"}} {p.wait:.6f}')
+
+    family("step_action_seconds_total", "counter", "Time steps spent acting (wall time minus waits).")
+    for name, p in sorted(steps.items()):
+        lines.append(f'{prefix}_step_action_seconds_total{{step="{_label(name)}"}} {p.action:.6f}')
+
+    family("step_retries_total", "counter", "Retries inside steps.")
+    for name, p in sorted(steps.items()):
+        lines.append(f'{prefix}_step_retries_total{{step="{_label(name)}"}} {p.retries}')
+
+    family("step_runs_total", "counter", "Step runs by outcome.")
+    for name, p in sorted(steps.items()):
+        label = _label(name)
+        lines.append(f'{prefix}_step_runs_total{{step="{label}",status="PASS"}} {p.calls - p.failed}')
+        lines.append(f'{prefix}_step_runs_total{{step="{label}",status="FAIL"}} {p.failed}')
+
+    family("wait_seconds_total", "counter", "Time spent in each named wait.")
+    for name, (seconds, _, _) in sorted(waits.items()):
+        lines.append(f'{prefix}_wait_seconds_total{{wait="{_label(name)}"}} {seconds:.6f}')
+    family("wait_timeouts_total", "counter", "Waits that ran out of time.")
+    for name, (_, _, timeouts) in sorted(waits.items()):
+        lines.append(f'{prefix}_wait_timeouts_total{{wait="{_label(name)}"}} {timeouts}')
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------------------
+#  FILES
+# -------------------------------------------------------------
+def _write(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(text)
+
+
+def write_trace(log_path, path, run_id=None):
+    """Write the Chrome trace of `run_id` (or every run) in `log_path` to `path`."""
+    _write(path, json.dumps(chrome_trace(iter_events(log_path, run_id=run_id)), separators=(",", ":")))
+    return path
+
+
+def write_metrics(log_path, path, run_id=None):
+    """Write Prometheus metrics for `run_id` (or every run) in `log_path` to `path`."""
+    _write(path, prometheus_text(iter_events(log_path, run_id=run_id)))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export step profiles from the step log.")
+    parser.add_argument("--log", default=DEFAULT_PATH, help="NDJSON step log")
+    parser.add_argument("--run", help="only this run id")
+    parser.add_argument("--trace", default="trace.json", help="Chrome trace output")
+    parser.add_argument("--metrics", default="metrics.prom", help="Prometheus text output")
+    args = parser.parse_args(argv)
+
+    write_trace(args.log, args.trace, args.run)
+    write_metrics(args.log, args.metrics, args.run)
+    steps, _ = step_profiles(iter_events(args.log, run_id=args.run))
+    for name, p in sorted(steps.items(), key=lambda item: -item[1].wall):
+        print(f"{name:50s} {json.dumps(p.as_dict())}")
+    return steps
+
+
+if __name__ == "__main__":
+    main()
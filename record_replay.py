@@ -0,0 +1,538 @@
+"""
+Record a real run once, replay it deterministically and faster on Linux.
+
+Recording (HP_SMART_RECORD=cassette.json) wraps the active UI backend, the
+OTP provider and the identity source in proxies. Every call on the desktop,
+its window specs, wrappers and element_info, every keystroke and clipboard
+access, and every mail fetch is logged with its arguments, its result (or
+exception) and when it started and ended. Objects a call returns are proxied
+in turn under a key derived from the call chain, e.g.
+
+    desktop.window[[], {"title_re": ".*HP account.*"}].child_window[...].exists[...]
+
+so the same code asks for the same keys in a later run. The cassette is
+written when the process exits.
+
+Replaying (HP_SMART_BACKEND=replay HP_SMART_CASSETTE=cassette.json) serves
+those responses back through the ui_backend API with no HP Smart, Mailsac or
+Windows involved, and hands out the recorded identities. Time is virtual:
+
+  * actions (clicks, typing, focus, keys) are consumed in recorded order per
+    key and move the virtual clock to when they happened;
+  * queries (exists, window_text, descendants, fetch_otp, ...) get the
+    latest response recorded by the current virtual time, but never one
+    recorded after the next pending action, so the UI only changes when
+    the flow acts on it, as it did live;
+  * HP_SMART_REPLAY_SPEED=1 replays in real time, N runs N times faster and
+    0 (the default) drops all latency: every query sees the last state the
+    recorded run saw before its next action.
+
+A call the cassette has no response for raises CassetteMiss, so a changed
+flow shows up as a failed step instead of a silent pass. Replay in a fresh
+process: learned text-entry strategies and locator caches change which calls
+a flow makes.
+
+    python record_replay.py info cassette.json
+    python record_replay.py replay cassette.json --speed 10 --runs 5
+"""
+import argparse
+import atexit
+import builtins
+import json
+import os
+import threading
+import time
+from dataclasses import asdict
+
+from otp_providers import OtpProvider
+
+
+FORMAT_VERSION = 1
+
+# Calls that change the UI; everything else only observes it
+ACTIONS = {"click_input", "click", "type_keys", "set_edit_text", "set_text", "set_focus", "close",
+           "invoke", "select", "send_keys", "copy"}
+
+_PRIMITIVES = (type(None), bool, int, float, str)
+
+
+class CassetteMiss(LookupError):
+    """The replayed run made a call the recorded run did not."""
+
+
+class ReplayedError(Exception):
+    """Base of exceptions re-raised from a cassette whose type is not a builtin."""
+
+
+_ERROR_TYPES = {}
+
+
+def _error(name, message):
+    cls = getattr(builtins, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = _ERROR_TYPES.get(name)
+        if cls is None:
+            cls = _ERROR_TYPES[name] = type(name, (ReplayedError,), {})
+    return cls(message)
+
+
+def call_key(parent, name, args, kwargs):
+    return f"{parent}.{name}{json.dumps([list(args), kwargs], sort_keys=True, default=str)}"
+
+
+def _is_value(result):
+    if isinstance(result, (list, tuple)):
+        return all(isinstance(item, _PRIMITIVES) for item in result)
+    return isinstance(result, _PRIMITIVES)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        cassette = json.load(fh)
+    if cassette.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported cassette format {cassette.get('format')!r}")
+    return cassette
+
+
+# -------------------------------------------------------------
+#  RECORDING
+# -------------------------------------------------------------
+class Recorder:
+    """Collects the calls made through recording proxies into a cassette."""
+
+    def __init__(self, path=None, backend=None, clock=time.monotonic):
+        self.path = path
+        self.backend = backend
+        self.clock = clock
+        self.started = clock()
+        self.events = []
+        self.identities = []
+        self._lock = threading.Lock()
+
+    def _add(self, key, start, kind, **outcome):
+        end = self.clock()
+        with self._lock:
+            self.events.append(dict(outcome, seq=len(self.events), key=key, kind=kind,
+                                    t=round(start - self.started, 6), dt=round(end - start, 6)))
+
+    def _wrap(self, key, start, kind, result):
+        if _is_value(result):
+            self._add(key, start, kind, value=list(result) if isinstance(result, tuple) else result)
+            return result
+        if isinstance(result, (list, tuple)):
+            self._add(key, start, kind, list=len(result))
+            return [_Recorded(self, item, f"{key}[{i}]") for i, item in enumerate(result)]
+        self._add(key, start, kind, obj=True)
+        return _Recorded(self, result, key)
+
+    def call(self, parent, name, fn, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        key = call_key(parent, name, args, kwargs)
+        kind = "action" if name in ACTIONS else "query"
+        start = self.clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._add(key, start, kind, error=[type(e).__name__, str(e)])
+            raise
+        return self._wrap(key, start, kind, result)
+
+    def attribute(self, parent, name, target):
+        key = f"{parent}.{name}"
+        start = self.clock()
+        try:
+            value = getattr(target, name)
+        except Exception as e:
+            self._add(key, start, "attr", error=[type(e).__name__, str(e)])
+            raise
+        if callable(value):
+            return value
+        return self._wrap(key, start, "attr", value)
+
+    def cassette(self):
+        with self._lock:
+            events = list(self.events)
+        return {"format": FORMAT_VERSION, "backend": self.backend, "recorded_at": time.time(),
+                "duration": round(self.clock() - self.started, 6),
+                "identities": list(self.identities), "events": events}
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.cassette(), fh)
+        os.replace(tmp, path)
+        return path
+
+
+class _Recorded:
+    """Proxy that records every call made on `target` under `key`."""
+
+    def __init__(self, recorder, target, key):
+        self._recorder = recorder
+        self._target = target
+        self._key = key
+
+    def __getattr__(self, name):
+        value = self._recorder.attribute(self._key, name, self._target)
+        if not callable(value) or isinstance(value, _Recorded):
+            return value
+
+        def call(*args, **kwargs):
+            return self._recorder.call(self._key, name, value, args, kwargs)
+        return call
+
+    def __repr__(self):
+        return f"<recorded {self._key}>"
+
+
+class _RecordedIdentities:
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def next(self):
+        identity = self.inner.next()
+        self.recorder.identities.append(asdict(identity))
+        return identity
+
+    def close(self):
+        close = getattr(self.inner, "close", None)
+        if close is not None:
+            close()
+
+
+class RecordingProvider(OtpProvider):
+    """Records the results and timing of another provider's fetches."""
+
+    def __init__(self, inner, recorder):
+        super().__init__(inner.log)
+        self.inner = inner
+        self.recorder = recorder
+        self.name = inner.name
+        self.domain = inner.domain
+
+    def check_once(self, mailbox):
+        return self.recorder.call("mail", "check_once", self.inner.check_once, (mailbox,))
+
+    def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+        # Keyed by mailbox only, so a replay with other waits still finds it
+        def fetch(mailbox):
+            return self.inner.fetch_otp(mailbox, max_wait=max_wait, poll_interval=poll_interval)
+        return self.recorder.call("mail", "fetch_otp", fetch, (mailbox,))
+
+    def close(self):
+        self.inner.close()
+
+
+class RecordingBackend:
+    """Wraps another ui_backend backend and records everything done through it."""
+
+    def __init__(self, inner, path=None):
+        self.inner = inner
+        self.name = f"record:{inner.name}"
+        self.recorder = Recorder(path, backend=inner.name)
+        self._desktop = None
+        if path:
+            atexit.register(self.recorder.save)
+
+    def __getattr__(self, name):
+        # e.g. SimBackend.app, which the sim OTP provider reads
+        return getattr(self.inner, name)
+
+    def desktop(self):
+        if self._desktop is None:
+            self._desktop = _Recorded(self.recorder, self.inner.desktop(), "desktop")
+        return self._desktop
+
+    def send_keys(self, keys, **kwargs):
+        self.recorder.call("keyboard", "send_keys", self.inner.send_keys, (keys,), kwargs)
+
+    def copy(self, text):
+        self.recorder.call("clipboard", "copy", self.inner.copy, (text,))
+
+    def paste(self):
+        return self.recorder.call("clipboard", "paste", self.inner.paste)
+
+    def identities(self, inner):
+        return _RecordedIdentities(inner, self.recorder)
+
+    def wrap_provider(self, provider):
+        return provider if isinstance(provider, RecordingProvider) else RecordingProvider(provider, self.recorder)
+
+
+# -------------------------------------------------------------
+#  REPLAY
+# -------------------------------------------------------------
+class _Record:
+    __slots__ = ("seq", "kind", "start", "end", "event")
+
+    def __init__(self, event):
+        self.seq = event["seq"]
+        self.kind = event["kind"]
+        self.start = event["t"]
+        self.end = event["t"] + event["dt"]
+        self.event = event
+
+
+class Replayer:
+    """Serves a cassette's responses on a virtual clock (see the module docstring)."""
+
+    def __init__(self, cassette, speed=0.0, clock=time.monotonic, sleep=time.sleep):
+        self.cassette = cassette
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.by_key = {}
+        self.actions = []
+        for event in cassette["events"]:
+            record = _Record(event)
+            self.by_key.setdefault(event["key"], []).append(record)
+            if record.kind == "action":
+                self.actions.append(record)
+        self.actions.sort(key=lambda r: (r.start, r.seq))
+        self.stats = {"actions": 0, "queries": 0, "misses": 0, "slept": 0.0}
+        self._consumed = set()
+        self._next_action = 0
+        self._position = {}
+        self._virtual = 0.0
+        self._anchor = clock()
+        self._lock = threading.Lock()
+
+    # -- virtual time -------------------------------------------
+    def now(self):
+        """Virtual seconds since the start of the recording (infinite without latency)."""
+        if not self.speed:
+            return float("inf")
+        return self._virtual + (self.clock() - self._anchor) * self.speed
+
+    def _advance(self, t):
+        with self._lock:
+            if self.speed:
+                self._virtual = max(self.now(), t)
+                self._anchor = self.clock()
+
+    def _horizon(self):
+        while self._next_action < len(self.actions) and self.actions[self._next_action].seq in self._consumed:
+            self._next_action += 1
+        return self.actions[self._next_action].start if self._next_action < len(self.actions) else float("inf")
+
+    def _wait_until(self, t):
+        if self.speed:
+            lag = (t - self.now()) / self.speed
+            if lag > 0:
+                self.stats["slept"] += lag
+                self.sleep(lag)
+        self._advance(t)
+
+    # -- responses ------------------------------------------------
+    def _records(self, key):
+        records = self.by_key.get(key)
+        if not records:
+            self.stats["misses"] += 1
+            raise CassetteMiss(f"not in the cassette: {key}")
+        return records
+
+    def has(self, key):
+        return key in self.by_key
+
+    def action(self, key):
+        records = [r for r in self._records(key) if r.kind == "action"]
+        with self._lock:
+            index = self._position.get(key, 0)
+            if index >= len(records):
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"no recorded call left for {key}")
+            record = records[index]
+            self._position[key] = index + 1
+            self._consumed.add(record.seq)
+            self.stats["actions"] += 1
+        self._wait_until(record.end)
+        return record
+
+    def query(self, key):
+        records = self._records(key)
+        with self._lock:
+            limit = min(self.now(), self._horizon())
+            chosen = None
+            for record in records:
+                if record.end <= limit and record.end < self._horizon():
+                    chosen = record
+            if chosen is None:
+                horizon = self._horizon()
+                chosen = next((r for r in records if r.end < horizon), records[0])
+            self.stats["queries"] += 1
+        self._wait_until(chosen.end)
+        return chosen
+
+    def _result(self, key, record):
+        event = record.event
+        if "error" in event:
+            raise _error(*event["error"])
+        if "list" in event:
+            return [_Replayed(self, f"{key}[{i}]") for i in range(event["list"])]
+        if event.get("obj"):
+            return _Replayed(self, key)
+        return event.get("value")
+
+    def call(self, parent, name, args=(), kwargs=None):
+        key = call_key(parent, name, args, kwargs or {})
+        record = self.action(key) if name in ACTIONS else self.query(key)
+        return self._result(key, record)
+
+    def attribute(self, parent, name):
+        key = f"{parent}.{name}"
+        return self._result(key, self.query(key))
+
+
+class _Replayed:
+    """Stand-in for a recorded object: attributes and calls come from the cassette."""
+
+    def __init__(self, replayer, key):
+        self._replayer = replayer
+        self._key = key
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        if self._replayer.has(f"{self._key}.{name}"):
+            return self._replayer.attribute(self._key, name)
+
+        def call(*args, **kwargs):
+            return self._replayer.call(self._key, name, args, kwargs)
+        return call
+
+    def __repr__(self):
+        return f"<replayed {self._key}>"
+
+
+class _ReplayedIdentities:
+    def __init__(self, records):
+        self.records = list(records)
+        self._lock = threading.Lock()
+
+    def next(self):
+        from identity import IdentitiesExhausted, Identity
+        with self._lock:
+            if not self.records:
+                raise IdentitiesExhausted("the cassette has no recorded identities left")
+            return Identity(**self.records.pop(0))
+
+    def close(self):
+        pass
+
+
+class ReplayOtpProvider(OtpProvider):
+    """The recorded mail fetches, at their recorded latency."""
+
+    name = "replay"
+
+    def __init__(self, replayer, log=None):
+        super().__init__(log)
+        self.replayer = replayer
+
+    def check_once(self, mailbox):
+        return self.replayer.call("mail", "check_once", (mailbox,))
+
+    def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+        return self.replayer.call("mail", "fetch_otp", (mailbox,))
+
+
+class ReplayBackend:
+    """ui_backend backend that plays a cassette back (HP_SMART_BACKEND=replay)."""
+
+    name = "replay"
+
+    def __init__(self, cassette, speed=0.0):
+        self.cassette = cassette
+        self.replayer = Replayer(cassette, speed=speed)
+        self._desktop = _Replayed(self.replayer, "desktop")
+
+    @classmethod
+    def from_env(cls):
+        path = os.environ.get("HP_SMART_CASSETTE", "cassette.json")
+        return cls(load(path), speed=float(os.environ.get("HP_SMART_REPLAY_SPEED", "0")))
+
+    def desktop(self):
+        return self._desktop
+
+    def send_keys(self, keys, **kwargs):
+        self.replayer.call("keyboard", "send_keys", (keys,), kwargs)
+
+    def copy(self, text):
+        self.replayer.call("clipboard", "copy", (text,))
+
+    def paste(self):
+        return self.replayer.call("clipboard", "paste")
+
+    def identities(self, inner=None):
+        return _ReplayedIdentities(self.cassette["identities"])
+
+    def otp_provider(self, log=None):
+        return ReplayOtpProvider(self.replayer, log=log)
+
+
+# -------------------------------------------------------------
+#  CLI
+# -------------------------------------------------------------
+def info(cassette):
+    events = cassette["events"]
+    kinds = {}
+    for event in events:
+        kinds[event["kind"]] = kinds.get(event["kind"], 0) + 1
+    return {"backend": cassette["backend"], "duration": cassette["duration"], "events": len(events),
+            "keys": len({e["key"] for e in events}), "identities": len(cassette["identities"]), **kinds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded HP Smart signup run.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_info = sub.add_parser("info", help="summarize a cassette")
+    p_info.add_argument("cassette")
+    p_replay = sub.add_parser("replay", help="run the signup script against a cassette")
+    p_replay.add_argument("cassette")
+    p_replay.add_argument("--speed", type=float, default=0.0, help="1 = real time, N = N× faster, 0 = no latency")
+    p_replay.add_argument("--runs", type=int, default=1, help="replay it this many times (fresh state each)")
+    args = parser.parse_args(argv)
+
+    cassette = load(args.cassette)
+    if args.command == "info":
+        summary = info(cassette)
+        print(json.dumps(summary))
+        return summary
+
+    import test_otpfinal
+    import ui_backend
+    from step_log import get_recorder
+    os.environ["HP_SMART_BACKEND"] = "replay"
+    timings = []
+    for _ in range(args.runs):
+        # Each run starts from the recorded state, like a fresh process would
+        backend = ReplayBackend(cassette, speed=args.speed)
+        ui_backend.set_backend(backend)
+        _reset_process_state(backend)
+        started = time.perf_counter()
+        test_otpfinal.main()
+        timings.append(round(time.perf_counter() - started, 4))
+    get_recorder().flush_all()
+    summary = {"recorded": cassette["duration"], "speed": args.speed, "runs": timings,
+               "misses": backend.replayer.stats["misses"]}
+    print(json.dumps(summary))
+    return summary
+
+
+def _reset_process_state(backend):
+    import app_session
+    import identity
+    import resilience
+    from locator import LOCATOR
+    from text_input import TEXT_ENTRY
+    identity.set_identity_source(backend.identities())
+    LOCATOR.invalidate()
+    TEXT_ENTRY.forget()
+    resilience.reset_breakers()
+    app_session.set_session(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Streaming HTML report writer.
+
+Reads the NDJSON step log written by step_log.py once and writes an HTML
+report without holding the log in memory: every "step" event is folded into
+fixed-size latency histograms (p50/p95/p99 per step, pass/fail counts) and
+per-run totals, while each logged line is spooled as a table row to a
+temporary file that is copied in after the summary tables.
+
+Memory is bounded by the number of distinct step names and runs, not by
+the number of events. All text is HTML-escaped. generate_report() writes the
+current run's report and trace plus the aggregate report and metrics, as the
+scripts do at the end of a run.
+"""
+import argparse
+import heapq
+import math
+import os
+import shutil
+import tempfile
+from html import escape
+
+from profiling import write_metrics, write_trace
+from step_log import DEFAULT_PATH, get_recorder, iter_events
+
+
+REPORT_PATH = "reports/automation_report.html"
+METRICS_PATH = "reports/metrics.prom"
+
+
+# -------------------------------------------------------------
+#  AGGREGATION
+# -------------------------------------------------------------
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram with ~2.5% relative error.
+
+    Bucket i covers [GROWTH**i, GROWTH**(i+1)) seconds, so one histogram
+    needs only a few hundred buckets from microseconds to hours.
+    """
+
+    GROWTH = 1.05
+    MIN_VALUE = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        value = max(value, self.MIN_VALUE)
+        index = int(math.floor(math.log(value, self.GROWTH)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Midpoint of the bucket, never above the observed maximum
+                return min(self.GROWTH ** (index + 0.5), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class StepStats:
+    __slots__ = ("latency", "passed", "failed")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.passed = 0
+        self.failed = 0
+
+
+class RunStats:
+    __slots__ = ("start", "end", "steps", "failed", "worker")
+
+    def __init__(self, t, worker):
+        self.start = t
+        self.end = t
+        self.steps = 0
+        self.failed = 0
+        self.worker = worker
+
+
+def _fold(event, steps, runs):
+    t = event.get("t", 0.0)
+    run = runs.get(event["run"])
+    if run is None:
+        run = runs[event["run"]] = RunStats(t, event.get("worker"))
+    end = t + event.get("duration", 0.0)
+    run.start = min(run.start, t)
+    run.end = max(run.end, end)
+    if event.get("kind") == "step":
+        stats = steps.get(event["step"])
+        if stats is None:
+            stats = steps[event["step"]] = StepStats()
+        stats.latency.add(event["duration"])
+        run.steps += 1
+        if event["status"] == "FAIL":
+            stats.failed += 1
+        else:
+            stats.passed += 1
+    elif event.get("kind") == "log" and event.get("status") == "FAIL":
+        # Only the logged failures: every step enclosing one fails with it
+        run.failed += 1
+
+
+def aggregate(log_path, run_id=None):
+    """Single pass over the log; returns (per-step stats, per-run stats)."""
+    steps = {}
+    runs = {}
+    for event in iter_events(log_path, run_id=run_id):
+        _fold(event, steps, runs)
+    return steps, runs
+
+
+# -------------------------------------------------------------
+#  HTML
+# -------------------------------------------------------------
+_STYLE = """<style>
+body { font-family: Helvetica, Arial, sans-serif; font-size: 12px; }
+table { border-collapse: collapse; margin-bottom: 24px; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: left; }
+td.num { text-align: right; }
+.PASS { color: green; } .FAIL { color: red; } .INFO { color: #666; }
+</style>"""
+
+
+def _cell(value, cls=None):
+    attr = f" class='{escape(cls)}'" if cls else ""
+    return f"<td{attr}>{escape(str(value))}</td>"
+
+
+def _write_step_table(fh, steps):
+    fh.write("<h3>Step latency</h3><table><tr><th>Step</th><th>Count</th>"
+             "<th>Pass rate</th><th>Failures</th><th>Mean (s)</th><th>p50 (s)</th>"
+             "<th>p95 (s)</th><th>p99 (s)</th><th>Max (s)</th></tr>\n")
+    for name in sorted(steps, key=lambda n: -steps[n].latency.quantile(0.99)):
+        s = steps[name]
+        total = s.passed + s.failed
+        fh.write("<tr>" + _cell(name)
+                 + _cell(total, "num")
+                 + _cell(f"{s.passed / total:.1%}" if total else "-", "num")
+                 + _cell(s.failed, "num")
+                 + _cell(f"{s.latency.mean:.3f}", "num")
+                 + _cell(f"{s.latency.quantile(0.50):.3f}", "num")
+                 + _cell(f"{s.latency.quantile(0.95):.3f}", "num")
+                 + _cell(f"{s.latency.quantile(0.99):.3f}", "num")
+                 + _cell(f"{s.latency.max:.3f}", "num") + "</tr>\n")
+    fh.write("</table>\n")
+
+
+def _write_run_tables(fh, runs, slowest):
+    total = len(runs)
+    failed = sum(1 for r in runs.values() if r.failed)
+    fh.write("<h3>Runs</h3><table><tr><th>Runs</th><th>Passed</th><th>Failed</th>"
+             "<th>Pass rate</th></tr><tr>"
+             + _cell(total, "num") + _cell(total - failed, "num") + _cell(failed, "num")
+             + _cell(f"{(total - failed) / total:.1%}" if total else "-", "num")
+             + "</tr></table>\n")
+
+    top = heapq.nlargest(slowest, runs.items(), key=lambda item: item[1].end - item[1].start)
+    fh.write(f"<h3>Slowest {len(top)} runs</h3><table><tr><th>Run</th><th>Worker</th>"
+             "<th>Duration (s)</th><th>Steps</th><th>Failures</th></tr>\n")
+    for run_id, r in top:
+        fh.write("<tr>" + _cell(run_id) + _cell(r.worker or "-")
+                 + _cell(f"{r.end - r.start:.3f}", "num") + _cell(r.steps, "num")
+                 + _cell(r.failed, "num") + "</tr>\n")
+    fh.write("</table>\n")
+
+
+def write_report(log_path, out_path=REPORT_PATH, run_id=None,
+                 title="HP Account Automation Report", slowest=10):
+    """
+    Write an HTML report for `run_id` (or every run in the log) to `out_path`.
+    Returns `out_path`.
+    """
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    steps, runs = {}, {}
+    tmp_path = out_path + ".tmp"
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as rows, open(tmp_path, "w", encoding="utf-8") as fh:
+        for event in iter_events(log_path, run_id=run_id):
+            _fold(event, steps, runs)
+            if event.get("kind") == "log":
+                status = event.get("status", "")
+                rows.write("<tr>" + _cell(event["run"]) + _cell(event.get("step") or "-")
+                           + _cell(event["desc"]) + _cell(status, status)
+                           + _cell(f"{event.get('dt', 0.0):.3f}", "num") + "</tr>\n")
+
+        fh.write(f"<!DOCTYPE html><html><head><meta charset='utf-8'/>"
+                 f"<title>{escape(title)}</title>{_STYLE}</head><body>\n")
+        fh.write(f"<h2>{escape(title)}</h2>\n")
+        _write_run_tables(fh, runs, slowest)
+        _write_step_table(fh, steps)
+
+        fh.write("<h3>Steps</h3><table><tr><th>Run</th><th>Step</th>"
+                 "<th>Description</th><th>Status</th><th>+s</th></tr>\n")
+        rows.seek(0)
+        shutil.copyfileobj(rows, fh)
+        fh.write("</table></body></html>\n")
+    # Replace atomically so a report being viewed is never half-written
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def generate_report(title):
+    """Write this run's report and trace, plus the aggregate report and metrics."""
+    recorder = get_recorder()
+    recorder.flush_all()
+    run_id = recorder.current_run_id()
+    write_report(recorder.path, f"reports/run_{run_id}.html", run_id=run_id, title=title)
+    write_report(recorder.path, REPORT_PATH, title=title)
+    write_trace(recorder.path, f"reports/run_{run_id}.trace.json", run_id=run_id)
+    write_metrics(recorder.path, METRICS_PATH)
+
+    print(f"Report generated: {REPORT_PATH} (run: reports/run_{run_id}.html, "
+          f"trace: reports/run_{run_id}.trace.json)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build an HTML report from the NDJSON step log.")
+    parser.add_argument("log", nargs="?", default=DEFAULT_PATH, help="step log (NDJSON)")
+    parser.add_argument("-o", "--output", default=REPORT_PATH)
+    parser.add_argument("--run", help="only include this run id")
+    parser.add_argument("--slowest", type=int, default=10, help="number of slowest runs to list")
+    args = parser.parse_args(argv)
+    path = write_report(args.log, args.output, run_id=args.run, slowest=args.slowest)
+    print(f"Report generated: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Retries and circuit breakers around the HP Smart and Mailsac stages.
+
+A failed launch_hp_smart or fill_account_form used to abort the run, and a
+failed fetch ended it with otp=None. retry_stage() now runs each stage under
+its own RetryPolicy: a few attempts with full-jitter exponential backoff,
+capped by a retry budget shared by all workers, so a bad minute does not
+turn into a retry storm. Before repeating a stage, its `already_done` check
+asks whether the last attempt got further than it reported (e.g. the form
+was submitted and the OTP page is open), so an account is never created
+twice.
+
+Each external dependency has one CircuitBreaker per process, shared by all
+batch workers ("hp_smart" for the UI stages, "mailsac" for the OTP polls).
+When the failure rate over its recent calls spikes, the breaker opens:
+callers fail fast with CircuitOpen, or with CIRCUIT_ON_OPEN=pause wait
+for the cooldown, instead of every worker burning its full timeout on a
+dependency that is down. After the cooldown one trial call is let through
+(half-open); it closes the breaker again or reopens it.
+
+    RETRY_ATTEMPTS="launch_hp_smart=3,fetch_otp_from_mailsac=2"   # per stage
+    CIRCUIT_FAILURE_RATE=0.5 CIRCUIT_MIN_CALLS=5 CIRCUIT_COOLDOWN=30
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from step_log import count_retry, log_step
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+# -------------------------------------------------------------
+#  RETRY POLICY
+# -------------------------------------------------------------
+class RetryPolicy:
+    """
+    Up to `attempts` calls with full-jitter backoff between them.
+
+    A call fails when it raises, or (with `retry_falsy`) when it returns a
+    falsy result; the stage functions report failure that way. Retries
+    beyond `min_retries` are only allowed while they stay under
+    `budget_ratio` of all calls made through this policy.
+    """
+
+    def __init__(self, attempts=3, base=0.5, cap=10.0, retry_falsy=True, budget_ratio=0.2, min_retries=5,
+                 rng=None, sleep=time.sleep):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.retry_falsy = retry_falsy
+        self.budget_ratio = budget_ratio
+        self.min_retries = min_retries
+        self.rng = rng or random.Random()
+        self.sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def delay(self, attempt):
+        """Backoff after failed attempt number `attempt` (1-based)."""
+        return self.rng.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+    def _take_retry(self):
+        with self._lock:
+            if self.retries >= self.min_retries + self.budget_ratio * self.calls:
+                return False
+            self.retries += 1
+            return True
+
+    def run(self, fn, *args, name=None, breaker=None, already_done=None, **kwargs):
+        """Call `fn(*args, **kwargs)` until it succeeds or the attempts or budget run out."""
+        name = name or getattr(fn, "__name__", "call")
+        with self._lock:
+            self.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            token = breaker.before() if breaker is not None else None
+            error = result = None
+            try:
+                result = fn(*args, **kwargs)
+            except CircuitOpen:
+                # Another dependency's breaker: no verdict on this one
+                if breaker is not None:
+                    breaker.cancel(token)
+                raise
+            except Exception as e:
+                error = e
+            except BaseException:
+                if breaker is not None:
+                    breaker.cancel(token)
+                raise
+            failed = error is not None or (self.retry_falsy and not result)
+            if breaker is not None:
+                breaker.record(not failed, token)
+            if not failed:
+                return result
+            if attempt >= self.attempts or not self._take_retry():
+                if error is not None:
+                    raise error
+                return result
+
+            wait = self.delay(attempt)
+            count_retry()
+            log_step(f"{name}: attempt {attempt} failed ({error or 'no result'}), retrying in {wait:.1f}s.",
+                     "INFO")
+            self.sleep(wait)
+            if already_done is not None:
+                done = already_done()
+                if done:
+                    log_step(f"{name}: the last attempt got through after all, not repeating it.", "INFO")
+                    return done
+
+
+# -------------------------------------------------------------
+#  CIRCUIT BREAKER
+# -------------------------------------------------------------
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over the last `window` calls to one dependency.
+
+    Opens once at least `min_calls` were seen and `failure_rate` of them
+    failed. While open, before() raises CircuitOpen (`on_open="fail"`) or
+    sleeps out the cooldown (`on_open="pause"`).
+
+    allow() and before() return a token for the call they let through. Pass
+    it back to record() or cancel(): only the token of the half-open trial
+    decides whether the breaker closes, so a slow call that started before
+    the breaker opened cannot answer for the trial.
+    """
+
+    def __init__(self, name, window=20, failure_rate=0.5, min_calls=5, cooldown=30.0, on_open="fail",
+                 clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.outcomes = deque(maxlen=window)
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.on_open = on_open
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = {"opened": 0, "rejected": 0}
+        self._opened_at = None
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CLOSED
+        return HALF_OPEN if self.clock() >= self._opened_at + self.cooldown else OPEN
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def remaining(self):
+        """Seconds until an open breaker lets a trial call through."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown - self.clock())
+
+    def allow(self):
+        """
+        A truthy token if a call may go ahead now, else False; half-open lets
+        exactly one trial through.
+        """
+        with self._lock:
+            state = self._state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trial is None:
+                self._trial = object()
+                return self._trial
+            self.stats["rejected"] += 1
+            return False
+
+    def _open(self, reason):
+        self._opened_at = self.clock()
+        self.stats["opened"] += 1
+        log_step(f"Circuit {self.name} opened: {reason}, pausing calls for {self.cooldown:.0f}s.", "INFO")
+
+    def record(self, ok, token=None):
+        """Record the outcome of the call `token` (from allow/before) was handed out for."""
+        with self._lock:
+            if token is not None and token is self._trial:
+                self._trial = None
+                if ok:
+                    self._opened_at = None
+                    self.outcomes.clear()
+                    log_step(f"Circuit {self.name} closed again.", "INFO")
+                else:
+                    self._open("the half-open trial call failed")
+                return
+            if self._opened_at is not None:
+                return  # a call started before the breaker opened, not the trial
+            self.outcomes.append(ok)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures >= self.failure_rate * len(self.outcomes):
+                self._open(f"{failures} of the last {len(self.outcomes)} calls failed")
+
+    def cancel(self, token=None):
+        """Give back the half-open trial `token` if it ended without an outcome for this dependency."""
+        with self._lock:
+            if token is not None and token is self._trial:
+                self._trial = None
+
+    def before(self):
+        """
+        Gate a call: return its token when it may go ahead, else raise
+        CircuitOpen or wait (pause mode).
+        """
+        while True:
+            token = self.allow()
+            if token:
+                return token
+            wait = self.remaining()
+            if self.on_open != "pause":
+                raise CircuitOpen(f"circuit {self.name} is open, next trial in {wait:.0f}s")
+            self.sleep(max(wait, 0.05))
+
+    @contextmanager
+    def guard(self):
+        """Gate the block with before() and record whether it raised."""
+        token = self.before()
+        outcome = None
+        try:
+            yield self
+            outcome = True
+        except CircuitOpen:
+            raise
+        except Exception:
+            outcome = False
+            raise
+        finally:
+            if outcome is None:
+                self.cancel(token)  # another breaker, KeyboardInterrupt or an abandoned block
+            else:
+                self.record(outcome, token)
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE BREAKERS AND STAGE POLICIES
+# -------------------------------------------------------------
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+# Breakers of the UI stages; the OTP providers feed "mailsac" poll by poll
+STAGE_BREAKERS = {
+    "launch_hp_smart": "hp_smart",
+    "fill_account_form": "hp_smart",
+}
+STAGE_POLICIES = {
+    "launch_hp_smart": {"attempts": 2},
+    "fill_account_form": {"attempts": 2},
+    # Only errors are retried: a poll that timed out already used its max_wait
+    "fetch_otp_from_mailsac": {"attempts": 2, "retry_falsy": False},
+}
+
+_POLICIES = {}
+
+
+def get_breaker(name):
+    """The shared breaker for dependency `name`, configured from CIRCUIT_*."""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = _BREAKERS[name] = CircuitBreaker(
+                name,
+                failure_rate=float(os.environ.get("CIRCUIT_FAILURE_RATE", "0.5")),
+                min_calls=int(os.environ.get("CIRCUIT_MIN_CALLS", "5")),
+                cooldown=float(os.environ.get("CIRCUIT_COOLDOWN", "30")),
+                on_open=os.environ.get("CIRCUIT_ON_OPEN", "fail"),
+            )
+        return breaker
+
+
+def reset_breakers():
+    """Forget all breakers and retry budgets (tests, a fresh batch)."""
+    with _BREAKERS_LOCK:
+        _BREAKERS.clear()
+        _POLICIES.clear()
+
+
+def get_policy(stage):
+    """The shared RetryPolicy of `stage`; RETRY_ATTEMPTS overrides the attempts."""
+    with _BREAKERS_LOCK:
+        policy = _POLICIES.get(stage)
+        if policy is None:
+            config = dict(STAGE_POLICIES.get(stage, {"attempts": 1}))
+            for pair in os.environ.get("RETRY_ATTEMPTS", "").split(","):
+                key, _, value = pair.partition("=")
+                if key.strip() == stage and value:
+                    config["attempts"] = int(value)
+            policy = _POLICIES[stage] = RetryPolicy(**config)
+        return policy
+
+
+def retry_stage(stage, fn, *args, already_done=None, **kwargs):
+    """
+    Run stage function `fn` under the stage's retry policy and breaker.
+
+    Returns what `fn` returned on its last attempt, or None when the
+    stage's breaker is open (logged as a FAIL).
+    """
+    breaker = get_breaker(STAGE_BREAKERS[stage]) if stage in STAGE_BREAKERS else None
+    try:
+        return get_policy(stage).run(fn, *args, name=stage, breaker=breaker, already_done=already_done, **kwargs)
+    except CircuitOpen as e:
+        log_step(f"{stage}: {e}", "FAIL")
+        return None
+
+
+def pause_while_open(timeout=None):
+    """Hold a worker before its next account while a pause-mode breaker is open."""
+    with _BREAKERS_LOCK:
+        breakers = [b for b in _BREAKERS.values() if b.on_open == "pause"]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for breaker in breakers:
+        while breaker.state == OPEN:
+            left = breaker.remaining()
+            if deadline is not None:
+                left = min(left, deadline - time.monotonic())
+                if left <= 0:
+                    return
+            breaker.sleep(max(left, 0.05))
@@ -0,0 +1,652 @@
+"""
+In-memory simulation of HP Smart and the HP account browser pages.
+
+SimApp models just enough of the real UI for the flows in flows.py: the
+HP Smart main window (Manage HP Account flyout, Scan, Return Home), the HP
+account signup form, the OTP screen, the sign-in pages, the clipboard and a
+mail server that receives the verification email.
+
+The spec classes mimic the parts of pywinauto's WindowSpecification and
+UIAWrapper API the flows use (window/child_window/exists/wait/click_input/
+type_keys/descendants/element_info), so the unchanged script functions can
+run headless on Linux. Latencies and failure rates are configurable; with
+the defaults (no latency) the orchestration runs thousands of flows per
+minute.
+
+    HP_SMART_BACKEND=sim HP_SMART_SIM_LATENCY="page_load=0.2,mail_delivery=1" \
+        python test_otpfinal.py
+"""
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parseaddr
+
+from otp_extract import classify
+from otp_providers import OtpProvider, extract_otp
+
+
+DEFAULT_LATENCIES = {
+    "launch": 0.0,          # Win+Search until the HP Smart window exists
+    "window_open": 0.0,     # HP account browser window opening
+    "page_load": 0.0,       # page / screen transitions
+    "mail_delivery": 0.0,   # signup submitted until the OTP email arrives
+    "action": 0.0,          # every click / keystroke batch
+}
+
+_KEY_TOKEN = re.compile(r"\{\}\}|\{[^}]+\}|[\^+%].|.", re.S)
+
+
+class ElementNotFoundError(LookupError):
+    """No window or control matches the criteria."""
+
+
+class SimTimeoutError(TimeoutError):
+    """A simulated wait() ran out of time."""
+
+
+class SimFailure(RuntimeError):
+    """An injected failure (see SimConfig.failure_rates)."""
+
+
+def _parse_pairs(text, cast=float):
+    pairs = {}
+    for item in filter(None, (p.strip() for p in (text or "").split(","))):
+        key, _, value = item.partition("=")
+        pairs[key.strip()] = cast(value)
+    return pairs
+
+
+# -------------------------------------------------------------
+#  CONFIG
+# -------------------------------------------------------------
+class SimConfig:
+    """
+    latencies:     seconds per event kind (see DEFAULT_LATENCIES)
+    failure_rates: probability per kind: "click", "type", "launch", "mail",
+                   "mail_api" (an OTP poll raising, as when the Mailsac API is down)
+    accept_any_login: sign-in succeeds for unknown accounts (the sign-in
+                   flow uses fixed credentials that the sim never created)
+    """
+
+    def __init__(self, latencies=None, failure_rates=None, seed=None, accept_any_login=True):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.failure_rates = dict(failure_rates or {})
+        self.seed = seed
+        self.accept_any_login = accept_any_login
+
+    @classmethod
+    def from_env(cls):
+        seed = os.environ.get("HP_SMART_SIM_SEED")
+        return cls(
+            latencies=_parse_pairs(os.environ.get("HP_SMART_SIM_LATENCY")),
+            failure_rates=_parse_pairs(os.environ.get("HP_SMART_SIM_FAILURES")),
+            seed=int(seed) if seed else None,
+        )
+
+
+# -------------------------------------------------------------
+#  MAIL
+# -------------------------------------------------------------
+class SimMailServer:
+    """Thread-safe in-memory inboxes keyed by full address."""
+
+    def __init__(self):
+        self._inboxes = {}
+        self._lock = threading.Lock()
+        self.delivered = 0
+
+    def deliver(self, address, subject, body, sender="HP <no-reply@hp.com>"):
+        message = {"from": sender, "to": address, "subject": subject,
+                   "body": body, "received": time.time()}
+        with self._lock:
+            self._inboxes.setdefault(address.lower(), []).append(message)
+            self.delivered += 1
+
+    def messages(self, address):
+        with self._lock:
+            return list(self._inboxes.get(address.lower(), ()))
+
+
+class SimOtpProvider(OtpProvider):
+    """OTP provider that reads the simulated mail server of `app`."""
+
+    name = "sim"
+
+    def __init__(self, app, log=None):
+        super().__init__(log)
+        self.app = app
+
+    def check_once(self, mailbox):
+        # Deliveries are pending events, due once their latency has passed
+        self.app.tick()
+        self.app.maybe_fail("mail_api")
+        for message in reversed(self.app.mail.messages(self.address(mailbox))):
+            if classify(parseaddr(message["from"])[1], message["subject"]):
+                return extract_otp(message["body"])
+        return None
+
+
+# -------------------------------------------------------------
+#  ELEMENTS
+# -------------------------------------------------------------
+class SimElementInfo:
+    __slots__ = ("_ctrl",)
+
+    def __init__(self, ctrl):
+        self._ctrl = ctrl
+
+    @property
+    def automation_id(self):
+        return self._ctrl.auto_id
+
+    @property
+    def name(self):
+        return self._ctrl.title
+
+    @property
+    def control_type(self):
+        return self._ctrl.control_type
+
+
+class SimControl:
+    """A resolved control (the UIAWrapper equivalent)."""
+
+    def __init__(self, app, window, control_type, auto_id="", title="", on_click=None, value=""):
+        self.app = app
+        self.window = window
+        self.control_type = control_type
+        self.auto_id = auto_id
+        self.title = title
+        self.on_click = on_click
+        self.value = value
+        self.enabled = True
+        self.alive = True
+        self.element_info = SimElementInfo(self)
+
+    def _check(self):
+        if not self.alive:
+            raise ElementNotFoundError(f"{self.control_type} {self.auto_id or self.title!r} is gone")
+
+    def is_visible(self):
+        self._check()
+        return True
+
+    def is_enabled(self):
+        self._check()
+        return self.enabled
+
+    def window_text(self):
+        self._check()
+        return self.value if self.control_type == "Edit" else self.title
+
+    def click_input(self):
+        with self.app.lock:
+            self._check()
+            self.app.act("click")
+            self.app.focus = self
+            if self.on_click:
+                self.on_click(self)
+
+    def set_focus(self):
+        self._check()
+        self.app.focus = self
+
+    def type_keys(self, keys, with_spaces=False, **kwargs):
+        with self.app.lock:
+            self._check()
+            self.app.act("type")
+            self.app.focus = self
+            self.app.apply_keys(self, keys)
+
+    def set_edit_text(self, text):
+        with self.app.lock:
+            self._check()
+            self.app.act("type")
+            self.value = text
+
+    def get_value(self):
+        self._check()
+        return self.value
+
+    def wrapper_object(self):
+        return self
+
+
+class SimWindow:
+    def __init__(self, app, title):
+        self.app = app
+        self.title = title
+        self.controls = []
+        self.alive = True
+        self.element_info = SimElementInfo(self)
+        self.control_type = "Window"
+        self.auto_id = ""
+
+    def add(self, control_type, auto_id="", title="", on_click=None, value=""):
+        ctrl = SimControl(self.app, self, control_type, auto_id, title, on_click, value)
+        self.controls.append(ctrl)
+        return ctrl
+
+    def remove(self, *ctrls):
+        for ctrl in ctrls:
+            if ctrl in self.controls:
+                self.controls.remove(ctrl)
+                ctrl.alive = False
+
+    def clear(self):
+        self.remove(*list(self.controls))
+
+    def get(self, auto_id=None, title=None):
+        for ctrl in self.controls:
+            if (auto_id is None or ctrl.auto_id == auto_id) and (title is None or ctrl.title == title):
+                return ctrl
+        return None
+
+    def is_visible(self):
+        if not self.alive:
+            raise ElementNotFoundError(f"window {self.title!r} is closed")
+        return True
+
+    def window_text(self):
+        return self.title
+
+    def set_focus(self):
+        self.is_visible()
+        self.app.raise_window(self)
+
+    def close(self):
+        with self.app.lock:
+            self.app.close_window(self)
+
+    def descendants(self, control_type=None):
+        self.is_visible()
+        return [c for c in self.controls if control_type in (None, c.control_type)]
+
+    def wrapper_object(self):
+        return self
+
+
+# -------------------------------------------------------------
+#  SPECS (lazy, like pywinauto's WindowSpecification)
+# -------------------------------------------------------------
+def _poll(check, timeout, interval=0.002):
+    deadline = time.monotonic() + (timeout or 0)
+    while True:
+        try:
+            result = check()
+            if result:
+                return result
+        except (ElementNotFoundError, SimFailure):
+            pass
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(interval)
+
+
+class _SpecBase:
+    def exists(self, timeout=None, retry_interval=None):
+        return bool(_poll(lambda: self._resolve() is not None, timeout))
+
+    def wait(self, wait_for, timeout=None, retry_interval=None):
+        wanted = wait_for.split()
+
+        def ready():
+            element = self._resolve()
+            if "enabled" in wanted and not getattr(element, "enabled", True):
+                return None
+            return element
+
+        element = _poll(ready, timeout)
+        if element is None:
+            raise SimTimeoutError(f"timed out waiting for '{wait_for}' on {self!r}")
+        return element
+
+    def wrapper_object(self):
+        return self._resolve()
+
+    def is_visible(self):
+        return self._resolve().is_visible()
+
+    def window_text(self):
+        return self._resolve().window_text()
+
+    def set_focus(self):
+        self._resolve().set_focus()
+
+    def close(self):
+        self._resolve().close()
+
+    def descendants(self, control_type=None):
+        return self._resolve().descendants(control_type=control_type)
+
+    @property
+    def element_info(self):
+        return self._resolve().element_info
+
+
+class SimWindowSpec(_SpecBase):
+    def __init__(self, app, title_re):
+        self.app = app
+        self.title_re = title_re
+
+    def __repr__(self):
+        return f"SimWindowSpec(title_re={self.title_re!r})"
+
+    def _resolve(self):
+        windows = self.app.find_windows(self.title_re)
+        if not windows:
+            raise ElementNotFoundError(f"no window matching {self.title_re!r}")
+        return windows[-1]
+
+    def child_window(self, **criteria):
+        return SimControlSpec(self, criteria)
+
+
+class SimControlSpec(_SpecBase):
+    def __init__(self, parent, criteria):
+        self.parent = parent
+        self.criteria = criteria
+
+    def __repr__(self):
+        return f"SimControlSpec({self.criteria!r})"
+
+    def _resolve(self):
+        window = self.parent._resolve()
+        with window.app.lock:
+            window.app.tick()
+            matches = [
+                c for c in window.controls
+                if all(getattr(c, key) == value for key, value in self.criteria.items()
+                       if key in ("auto_id", "title", "control_type"))
+                and ("title_re" not in self.criteria or re.match(self.criteria["title_re"], c.title))
+            ]
+        index = self.criteria.get("found_index") or 0
+        if len(matches) <= index:
+            raise ElementNotFoundError(f"no control matching {self.criteria!r}")
+        return matches[index]
+
+    def child_window(self, **criteria):
+        return SimControlSpec(self.parent, criteria)
+
+    def click_input(self):
+        self._resolve().click_input()
+
+    def type_keys(self, keys, with_spaces=False, **kwargs):
+        self._resolve().type_keys(keys, with_spaces=with_spaces, **kwargs)
+
+    def set_edit_text(self, text):
+        self._resolve().set_edit_text(text)
+
+    def get_value(self):
+        return self._resolve().get_value()
+
+    def is_enabled(self):
+        return self._resolve().is_enabled()
+
+
+class SimDesktop:
+    def __init__(self, app):
+        self.app = app
+
+    def window(self, title_re=None, **kwargs):
+        return SimWindowSpec(self.app, title_re or ".*")
+
+    def windows(self):
+        return self.app.find_windows(".*")
+
+
+# -------------------------------------------------------------
+#  APP STATE MACHINE
+# -------------------------------------------------------------
+class SimApp:
+    """The simulated desktop: HP Smart, HP account windows, clipboard and mail."""
+
+    def __init__(self, config=None):
+        self.config = config or SimConfig()
+        self.random = random.Random(self.config.seed)
+        self.lock = threading.RLock()
+        self.windows = []
+        self.focus = None
+        self.clipboard = ""
+        self.mail = SimMailServer()
+        self.accounts = {}
+        self.signed_in = None
+        self.stats = {}
+        self._pending = []
+        self._seq = itertools.count()
+        self._signups = {}
+
+    # -- plumbing -------------------------------------------------
+    def count(self, key):
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    def maybe_fail(self, kind):
+        rate = self.config.failure_rates.get(kind, 0)
+        if rate and self.random.random() < rate:
+            self.count(f"failed_{kind}")
+            raise SimFailure(f"simulated {kind} failure")
+
+    def act(self, kind):
+        self.count(kind)
+        delay = self.config.latencies.get("action", 0)
+        if delay:
+            time.sleep(delay)
+        self.maybe_fail(kind)
+
+    def schedule(self, latency, fn, *args):
+        """Run `fn(*args)` after the configured latency (immediately when it is 0)."""
+        delay = self.config.latencies.get(latency, 0)
+        with self.lock:
+            if delay <= 0:
+                fn(*args)
+            else:
+                heapq.heappush(self._pending, (time.monotonic() + delay, next(self._seq), fn, args))
+
+    def tick(self):
+        with self.lock:
+            now = time.monotonic()
+            while self._pending and self._pending[0][0] <= now:
+                _, _, fn, args = heapq.heappop(self._pending)
+                fn(*args)
+
+    def find_windows(self, title_re):
+        with self.lock:
+            self.tick()
+            pattern = re.compile(title_re)
+            return [w for w in self.windows if pattern.match(w.title)]
+
+    def open_window(self, title):
+        window = SimWindow(self, title)
+        self.windows.append(window)
+        return window
+
+    def close_window(self, window):
+        if window in self.windows:
+            self.windows.remove(window)
+        window.clear()
+        window.alive = False
+
+    def raise_window(self, window):
+        with self.lock:
+            if window in self.windows:
+                self.windows.remove(window)
+                self.windows.append(window)
+
+    def main_window(self):
+        for window in self.windows:
+            if window.title == "HP Smart":
+                return window
+        return None
+
+    # -- keyboard -------------------------------------------------
+    def send_keys(self, keys):
+        with self.lock:
+            if keys.startswith("{VK_LWIN}"):
+                self.act("launch")
+                self.launch(keys[len("{VK_LWIN}"):].replace("{ENTER}", ""))
+                return
+            self.act("type")
+            if self.focus is not None and self.focus.alive:
+                self.apply_keys(self.focus, keys)
+
+    def apply_keys(self, ctrl, keys):
+        selected = False
+        for token in _KEY_TOKEN.findall(keys):
+            if token == "^a":
+                selected = True
+            elif token == "^v":
+                ctrl.value = (self.clipboard if selected else ctrl.value + self.clipboard)
+                selected = False
+            elif token == "{BACKSPACE}":
+                ctrl.value = "" if selected else ctrl.value[:-1]
+                selected = False
+            elif len(token) == 3 and token[0] == "{" and token[2] == "}":
+                # escaped literal such as {+} or {(}
+                ctrl.value = token[1] if selected else ctrl.value + token[1]
+                selected = False
+            elif token.startswith("{") and len(token) > 1:
+                continue
+            else:
+                ctrl.value = token if selected else ctrl.value + token
+                selected = False
+
+    # -- HP Smart -------------------------------------------------
+    def launch(self, name):
+        if "HP Smart" not in name:
+            return
+        if self.main_window() is None:
+            self.schedule("launch", self._open_main)
+
+    def _open_main(self):
+        self.maybe_fail("launch")
+        main = self.open_window("HP Smart")
+        main.add("Button", "HpcSignedOutIcon", "Manage HP Account", on_click=self._open_flyout)
+        main.add("Button", "HomeScanTile", "Scan", on_click=self._open_scan)
+
+    def _open_flyout(self, ctrl):
+        main = ctrl.window
+        if main.get(auto_id="HpcSignOutFlyout_CreateBtn") is None:
+            main.add("Button", "HpcSignOutFlyout_CreateBtn", "Create account", on_click=self._open_signup)
+            main.add("Button", "HpcSignOutFlyout_SignInBtn", "Sign in", on_click=self._open_sign_in)
+
+    def _close_flyout(self, main):
+        main.remove(main.get(auto_id="HpcSignOutFlyout_CreateBtn"),
+                    main.get(auto_id="HpcSignOutFlyout_SignInBtn"))
+
+    def _open_scan(self, ctrl):
+        self.schedule("page_load", self._show_scan_screen, ctrl.window)
+
+    def _show_scan_screen(self, main):
+        main.remove(main.get(title="Scan"))
+        main.add("Text", "ScanUnavailable", "Scanning is Currently Unavailable")
+        main.add("Button", "ReturnHomeBtn", "Return Home", on_click=self._return_home)
+
+    def _return_home(self, ctrl):
+        self.schedule("page_load", self._show_home, ctrl.window)
+
+    def _show_home(self, main):
+        main.remove(main.get(auto_id="ScanUnavailable"), main.get(title="Return Home"))
+        if main.get(title="Scan") is None:
+            main.add("Button", "HomeScanTile", "Scan", on_click=self._open_scan)
+
+    # -- HP account: signup ---------------------------------------
+    def _open_signup(self, ctrl):
+        self._close_flyout(ctrl.window)
+        self.schedule("window_open", self._show_signup_form)
+
+    def _show_signup_form(self):
+        win = self.open_window("HP account - Create account")
+        for auto_id in ("firstName", "lastName", "email", "password"):
+            win.add("Edit", auto_id, auto_id)
+        win.add("Button", "sign-up-submit", "Create", on_click=self._submit_signup)
+        self.focus = win.controls[0]
+
+    def _submit_signup(self, ctrl):
+        win = ctrl.window
+        fields = {c.auto_id: c.value for c in win.controls if c.control_type == "Edit"}
+        if not all(fields.values()):
+            win.add("Text", "form-error", "Please fill in all required fields")
+            return
+        otp = f"{self.random.randrange(1000000):06d}"
+        self._signups[win] = (fields["email"], fields["password"], otp)
+        self.schedule("page_load", self._show_code_screen, win)
+        self.schedule("mail_delivery", self._send_otp_mail, fields["email"], otp)
+
+    def _show_code_screen(self, win):
+        win.clear()
+        win.add("Text", "code-prompt", "Enter the code we sent to your email")
+        self.focus = win.add("Edit", "code", "code")
+        win.add("Button", "submit-code", "Verify", on_click=self._submit_code)
+
+    def _send_otp_mail(self, address, otp):
+        try:
+            self.maybe_fail("mail")
+        except SimFailure:
+            return
+        self.mail.deliver(address, "Your HP account verification code",
+                          f"Hello,\n\nYour verification code is {otp}.\n\nHP Account Team")
+
+    def _submit_code(self, ctrl):
+        win = ctrl.window
+        email, password, otp = self._signups.get(win, (None, None, None))
+        code = win.get(auto_id="code")
+        if code is None or code.value.strip() != otp:
+            if win.get(auto_id="code-error") is None:
+                win.add("Text", "code-error", "Invalid code")
+            return
+        self.schedule("page_load", self._finish_signup, win, email, password)
+
+    def _finish_signup(self, win, email, password):
+        self.accounts[email] = password
+        self._signups.pop(win, None)
+        self.close_window(win)
+        self.count("accounts_created")
+
+    # -- HP account: sign-in --------------------------------------
+    def _open_sign_in(self, ctrl):
+        self._close_flyout(ctrl.window)
+        self.schedule("window_open", self._show_sign_in)
+
+    def _show_sign_in(self):
+        win = self.open_window("HP account - Sign in")
+        self.focus = win.add("Edit", "username", "Email or username")
+        win.add("Button", "use-password", "Use password", on_click=self._use_password)
+        win.add("Button", "mobile", "Sign in with mobile number")
+
+    def _use_password(self, ctrl):
+        self.schedule("page_load", self._show_password, ctrl.window)
+
+    def _show_password(self, win):
+        win.remove(win.get(auto_id="use-password"), win.get(auto_id="mobile"))
+        win.add("Edit", "password", "Password")
+        win.add("Button", "sign-in", "Sign in", on_click=self._sign_in)
+
+    def _sign_in(self, ctrl):
+        win = ctrl.window
+        username = win.get(auto_id="username").value
+        password = win.get(auto_id="password").value
+        known = self.accounts.get(username)
+        if known != password and not (known is None and self.config.accept_any_login):
+            win.add("Text", "sign-in-error", "Incorrect password")
+            return
+        self.schedule("page_load", self._finish_sign_in, win, username)
+
+    def _finish_sign_in(self, win, username):
+        self.signed_in = username
+        self.close_window(win)
+        self.count("sign_ins")
+
+    # -- reset ----------------------------------------------------
+    def reset(self):
+        """Close every window and forget pending events (accounts and mail are kept)."""
+        with self.lock:
+            for window in list(self.windows):
+                self.close_window(window)
+            self._pending.clear()
+            self._signups.clear()
+            self.focus = None
+            self.signed_in = None
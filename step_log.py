@@ -0,0 +1,323 @@
+"""
+Structured, concurrency-safe step log shared by all flows.
+
+log_step() keeps its old call signature but, instead of appending tuples to
+a module-level REPORT list, records an event with a wall-clock timestamp, a
+monotonic timestamp, the run id, the worker id and the enclosing step. Each
+thread appends to its own buffer, whose lock is only contended when
+flush_all() drains it from another thread; buffers are flushed in batches to
+an append-only NDJSON file, so memory stays flat no matter how many flows run.
+
+Wrap a function (or block) in step("name") to also get one "step" event per
+call with its duration and overall status. Time spent in waits (record_wait,
+waiting()) and retries (count_retry) inside a step are added to that step's
+event as `wait` and `retries`; profiling.py turns the log into a Chrome trace
+and Prometheus metrics. add_listener() sees every event as it is recorded
+(artifacts.py uses it to capture failures).
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import ContextDecorator, contextmanager
+
+
+DEFAULT_PATH = os.environ.get("STEP_LOG_PATH", "automation_steps.ndjson")
+
+_RUN_ID = contextvars.ContextVar("step_log_run_id", default=None)
+_WORKER_ID = contextvars.ContextVar("step_log_worker_id", default=None)
+_STEP_STACK = contextvars.ContextVar("step_log_step_stack", default=())
+_LISTENERS = ()  # replaced, never mutated, so recording threads iterate without a lock
+_LISTENERS_LOCK = threading.Lock()
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+
+# -------------------------------------------------------------
+#  RECORDER
+# -------------------------------------------------------------
+class _ThreadBuffer:
+    __slots__ = ("thread", "events", "last_t", "lock")
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.events = []
+        self.last_t = None
+        self.lock = threading.Lock()
+
+
+class StepRecorder:
+    """
+    Records step events into per-thread buffers and flushes them to `path`.
+
+    Only the owning thread appends to a buffer; its lock is only contended
+    when flush_all() drains it from another thread. The file lock is taken
+    once per flushed batch.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, run_id=None, batch_size=64, echo=True):
+        self.path = path
+        self.run_id = run_id or new_run_id()
+        self.batch_size = batch_size
+        self.echo = echo
+        self._local = threading.local()
+        self._buffers = []
+        self._registry_lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    # -- context ------------------------------------------------
+    def current_run_id(self):
+        return _RUN_ID.get() or self.run_id
+
+    def start_run(self, run_id=None, worker_id=None):
+        """Start a new run in the current context and return its id."""
+        run_id = run_id or new_run_id()
+        _RUN_ID.set(run_id)
+        if worker_id is not None:
+            _WORKER_ID.set(worker_id)
+        return run_id
+
+    def _buffer(self):
+        buf = getattr(self._local, "buffer", None)
+        if buf is None:
+            buf = self._local.buffer = _ThreadBuffer()
+            with self._registry_lock:
+                self._buffers.append(buf)
+        return buf
+
+    # -- recording ----------------------------------------------
+    def log(self, desc, status="PASS", **fields):
+        """Record a log event; `dt` is the time since this thread's previous event."""
+        buf = self._buffer()
+        now = time.monotonic()
+        stack = _STEP_STACK.get()
+        event = {
+            "kind": "log",
+            "ts": round(time.time(), 6),
+            "t": round(now, 6),
+            "dt": round(now - buf.last_t, 6) if buf.last_t is not None else 0.0,
+            "run": self.current_run_id(),
+            "worker": _WORKER_ID.get() or buf.thread.name,
+            "step": stack[-1].name if stack else None,
+            "desc": desc,
+            "status": status,
+        }
+        if fields:
+            event.update(fields)
+        buf.last_t = now
+        if status == "FAIL":
+            for scope in _open_scopes():
+                scope.failed = True
+        if self.echo:
+            print(f"{desc}: {status}")
+        self._append(buf, event)
+        return event
+
+    def _record_step(self, name, start, end, status, kind="step", **fields):
+        buf = self._buffer()
+        event = {
+            "kind": kind,
+            "ts": round(time.time() - (end - start), 6),
+            "t": round(start, 6),
+            "duration": round(end - start, 6),
+            "run": self.current_run_id(),
+            "worker": _WORKER_ID.get() or buf.thread.name,
+            "step": name,
+            "status": status,
+        }
+        if fields:
+            event.update(fields)
+        self._append(buf, event)
+        return event
+
+    def _append(self, buf, event):
+        for listener in _LISTENERS:
+            try:
+                listener(event)
+            except Exception:
+                pass
+        with buf.lock:
+            buf.events.append(event)
+            full = len(buf.events) >= self.batch_size
+        if full:
+            self._flush_buffer(buf)
+
+    # -- flushing -----------------------------------------------
+    def _flush_buffer(self, buf):
+        # The owner self-flushes at batch_size while flush_all() may drain the
+        # same buffer from another thread: swap the list out under its lock,
+        # and write under it too so two batches of one thread stay in order
+        with buf.lock:
+            events, buf.events = buf.events, []
+            if not events:
+                return
+            data = "".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events)
+            with self._file_lock:
+                with open(self.path, "a", encoding="utf-8") as fh:
+                    fh.write(data)
+
+    def flush(self):
+        """Flush the calling thread's buffer."""
+        self._flush_buffer(self._buffer())
+
+    def flush_all(self):
+        """Flush every thread's buffer and forget threads that have finished."""
+        with self._registry_lock:
+            buffers = list(self._buffers)
+        for buf in buffers:
+            self._flush_buffer(buf)
+        with self._registry_lock:
+            self._buffers = [b for b in self._buffers if b.thread.is_alive() or b.events]
+
+    def events(self, run_id=None, kind=None):
+        """Stream recorded events back from disk (flush first to include buffered ones)."""
+        return iter_events(self.path, run_id=run_id, kind=kind)
+
+
+def iter_events(path, run_id=None, kind=None):
+    """Yield events from an NDJSON step log one at a time."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if run_id is not None and event.get("run") != run_id:
+                continue
+            if kind is not None and event.get("kind") != kind:
+                continue
+            yield event
+
+
+# -------------------------------------------------------------
+#  STEP SCOPES
+# -------------------------------------------------------------
+class StepCancelled(BaseException):
+    """
+    Ends work that was called off, such as a cancelled OTP watch. A
+    BaseException so the stages' `except Exception` handlers let it through;
+    the steps it leaves are recorded as CANCELLED instead of FAIL.
+    """
+
+
+class _StepScope(ContextDecorator):
+    """Context manager / decorator that records one "step" event per use."""
+
+    def __init__(self, name, recorder=None):
+        self.name = name
+        self.recorder = recorder
+        self.failed = False
+        self.waited = 0.0
+        self.retries = 0
+        self._start = None
+        self._token = None
+        self._thread = None
+
+    def _recreate_cm(self):
+        # A fresh scope per decorated call keeps concurrent calls independent
+        return _StepScope(self.name, self.recorder)
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        self._thread = threading.get_ident()
+        self._token = _STEP_STACK.set(_STEP_STACK.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _STEP_STACK.reset(self._token)
+        recorder = self.recorder or get_recorder()
+        if exc_type is not None and issubclass(exc_type, StepCancelled):
+            status = "CANCELLED"
+        else:
+            status = "FAIL" if (self.failed or exc_type is not None) else "PASS"
+        recorder._record_step(self.name, self._start, time.monotonic(), status,
+                              wait=round(self.waited, 6), retries=self.retries)
+        return False
+
+
+def step(name, recorder=None):
+    """Time a function or block as the named step."""
+    return _StepScope(name, recorder)
+
+
+def _open_scopes():
+    # A background thread inherits its parent's step stack through the
+    # copied context; the parent's steps keep only their own thread's time.
+    me = threading.get_ident()
+    return [scope for scope in _STEP_STACK.get() if scope._thread == me]
+
+
+def record_wait(name, start, end, ok=True, timeout=None):
+    """
+    Record a wait from `start` to `end` (monotonic seconds) as a "wait" event
+    and add its duration to every step open in this thread.
+    """
+    scopes = _open_scopes()
+    for scope in scopes:
+        scope.waited += end - start
+    fields = {"parent": scopes[-1].name if scopes else None}
+    if timeout is not None:
+        fields["timeout"] = timeout
+    get_recorder()._record_step(name, start, end, "PASS" if ok else "TIMEOUT", kind="wait", **fields)
+
+
+def count_retry(n=1):
+    """Count a retry against every step open in this thread."""
+    for scope in _open_scopes():
+        scope.retries += n
+
+
+@contextmanager
+def waiting(name):
+    """Time a block (a page load, a fixed sleep) as waiting rather than acting."""
+    start = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_wait(name, start, time.monotonic(), ok)
+
+
+# -------------------------------------------------------------
+#  DEFAULT RECORDER
+# -------------------------------------------------------------
+RECORDER = StepRecorder()
+atexit.register(lambda: RECORDER.flush_all())
+
+
+def get_recorder():
+    return RECORDER
+
+
+def add_listener(listener):
+    """Call `listener(event)` for every event recorded from now on (in the recording thread)."""
+    global _LISTENERS
+    with _LISTENERS_LOCK:
+        if listener not in _LISTENERS:
+            _LISTENERS = _LISTENERS + (listener,)
+
+
+def remove_listener(listener):
+    global _LISTENERS
+    with _LISTENERS_LOCK:
+        _LISTENERS = tuple(x for x in _LISTENERS if x != listener)
+
+
+def set_recorder(recorder):
+    """Swap the default recorder (flushing the old one) and return the old one."""
+    global RECORDER
+    previous = RECORDER
+    previous.flush_all()
+    RECORDER = recorder
+    return previous
+
+
+def log_step(desc, status="PASS"):
+    RECORDER.log(desc, status)
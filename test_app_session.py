@@ -0,0 +1,61 @@
+import subprocess
+import sys
+
+import app_session
+from app_session import get_session, startup_summary
+from flows import FLOWS, run_flow
+from ui_backend import Desktop
+
+
+HEAVY = ("pytest", "selenium", "pywinauto", "pyperclip", "http.client", "imaplib", "zipfile")
+
+
+def test_second_run_attaches_instead_of_relaunching(sim, failures):
+    import test_otpfinal
+    app = sim()
+
+    test_otpfinal.main()
+    test_otpfinal.main()
+
+    assert failures() == []
+    assert app.stats["launch"] == 1 and app.stats["accounts_created"] == 2
+    session = get_session()
+    assert (session.stats["launched"], session.stats["attached"], session.stats["opened"]) == (1, 1, 2)
+    assert set(session.timings) == {"launch", "attach", "open_form"}
+    assert startup_summary().startswith("Startup: ")
+
+
+def test_open_form_is_reused_and_stale_pages_are_closed(sim, failures):
+    import test_otpfinal
+    app = sim()
+    session = get_session()
+    desktop = session.start()
+    assert run_flow(FLOWS["open_create_account"], desktop)
+
+    test_otpfinal.main()  # fills the form that was already open
+    assert session.stats["warm"] == 1 and session.stats["opened"] == 0
+
+    assert session.open_signup(Desktop())
+    assert run_flow(FLOWS["signup_form"], Desktop(), {
+        "first_name": "Ann", "last_name": "Lee", "email": "ann.lee@mailsac.com", "password": "pw"})
+    test_otpfinal.main()  # the OTP page left over from the abandoned signup is closed first
+    assert failures() == []
+    assert session.stats["closed"] == 1 and app.stats["accounts_created"] == 2
+
+
+def test_relaunch_mode_always_launches(sim, monkeypatch):
+    import test_otpfinal
+    monkeypatch.setenv("HP_SMART_SESSION", "relaunch")
+    app_session.set_session(None)
+    sim()
+
+    test_otpfinal.main()
+    test_otpfinal.main()
+    assert get_session().stats["launched"] == 2
+
+
+def test_scripts_import_no_heavy_backends():
+    code = ("import sys, test_otpfinal, new_test, batch_runner; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
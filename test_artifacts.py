@@ -0,0 +1,119 @@
+import json
+import os
+import zipfile
+
+import artifacts
+import step_log
+from artifacts import FailureCapture, driver_source, watch_driver
+
+
+class FakeDriver:
+    current_url = "https://mailsac.com/inbox/ann.lee"
+    page_source = "<html><body>No messages</body></html>"
+
+    def get_screenshot_as_png(self):
+        return b"\x89PNG fake"
+
+
+def read_zip(path):
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+def test_failed_step_dumps_the_ui_once_in_the_background(sim, failures):
+    import test_otpfinal
+    app = sim(failure_rates={"click": 1.0})
+
+    test_otpfinal.main()
+    assert failures()
+
+    [path] = artifacts.install().flush(timeout=10)
+    files = read_zip(path)
+    failure = json.loads(files["failure.json"])
+    assert failure["event"]["status"] == "FAIL"
+    assert set(failure["sources"]) == {"locator", "ui_tree", "screenshot", "drivers"}
+
+    events = json.loads(files["events.json"])
+    assert events[-1] == failure["event"]
+    assert any(e.get("step") == "open_create_account.open_account_flyout" for e in events)
+    [window] = json.loads(files["ui_tree.json"])
+    assert window["title"] == "HP Smart"
+    assert ["Button", "HpcSignedOutIcon", "Manage HP Account"] in window["controls"]
+    assert app.stats.get("accounts_created") is None
+
+
+def test_successful_runs_write_nothing(sim, failures):
+    import test_otpfinal
+    sim()
+
+    test_otpfinal.main()
+
+    capture = artifacts.install()
+    assert failures() == [] and capture.flush() == []
+    assert len(capture.ring) > 10
+    assert not os.path.exists(capture.directory)
+
+
+def test_per_run_cap_gap_and_retention(tmp_path):
+    now = [1_000_000.0]
+    capture = FailureCapture(str(tmp_path), max_bytes=10**9, keep_days=1, max_per_run=2, min_gap=2,
+                             sources={}, clock=lambda: now[0])
+    fail = {"kind": "log", "run": "r1", "step": "submit", "status": "FAIL"}
+
+    capture.on_event(fail)
+    capture.on_event(dict(fail, kind="step"))  # same failure, enclosing step
+    now[0] += 5
+    capture.on_event(fail)
+    now[0] += 5
+    capture.on_event(fail)  # over the per-run cap
+    assert len(capture.flush()) == 2
+
+    for age, path in ((60, capture.written[0]), (30, capture.written[1])):
+        os.utime(path, (now[0] - age, now[0] - age))
+    old = tmp_path / "old.zip"
+    old.write_bytes(b"x" * 10)
+    os.utime(old, (now[0] - 2 * 86400, now[0] - 2 * 86400))
+    capture.max_bytes = sum(os.path.getsize(p) for p in capture.written) - 1
+    removed = capture.prune()
+    assert removed[0] == str(old) and removed[1] == capture.written[0]
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(capture.written[1])]
+    capture.close()
+
+
+def test_the_ui_is_read_at_failure_time_and_only_the_failing_run_is_kept(tmp_path):
+    screen = {"page": "error"}
+    capture = FailureCapture(str(tmp_path), min_gap=0, sources={"ui": lambda: {"ui.json": dict(screen)}})
+
+    capture.on_event({"kind": "log", "run": "r2", "desc": "other run"})
+    capture.on_event({"kind": "log", "run": "r1", "desc": "typed email"})
+    capture.on_event({"kind": "log", "run": "r1", "status": "FAIL"})
+    screen["page"] = "recovered"  # a retry already moved on
+    [path] = capture.flush(timeout=10)
+    capture.close()
+
+    files = read_zip(path)
+    assert json.loads(files["ui.json"]) == {"page": "error"}
+    assert [e.get("desc") for e in json.loads(files["events.json"])] == ["typed email", None]
+
+
+def test_selenium_sessions_in_use_are_included():
+    assert driver_source() == {}
+    with watch_driver(FakeDriver()):
+        files = driver_source()
+    assert files["driver0.html"].startswith("<!-- https://mailsac.com/inbox/ann.lee -->")
+    assert files["driver0.png"] == b"\x89PNG fake"
+    assert driver_source() == {}
+
+
+def test_listeners_see_every_event(tmp_path):
+    seen = []
+    rec = step_log.StepRecorder(str(tmp_path / "steps.ndjson"), echo=False)
+    previous = step_log.set_recorder(rec)
+    step_log.add_listener(seen.append)
+    try:
+        with step_log.step("outer"):
+            step_log.log_step("boom", "FAIL")
+    finally:
+        step_log.remove_listener(seen.append)
+        step_log.set_recorder(previous)
+    assert [(e["kind"], e["status"]) for e in seen] == [("log", "FAIL"), ("step", "FAIL")]
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+
+from batch_runner import StubSignupStages, main, run_batch
+
+
+class TrackingStages(StubSignupStages):
+    """Stub stages that record how many UI stages ran at the same time."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active_ui = 0
+        self.max_active_ui = 0
+        self.max_active_mail = 0
+        self.active_mail = 0
+        self.track_lock = threading.Lock()
+
+    def _ui(self):
+        with self.track_lock:
+            self.active_ui += 1
+            self.max_active_ui = max(self.max_active_ui, self.active_ui)
+        time.sleep(self.ui_latency)
+        with self.track_lock:
+            self.active_ui -= 1
+
+    def submit_form(self, identity):
+        self._ui()
+        return True
+
+    def verify(self, identity, otp):
+        self._ui()
+        return True
+
+    def fetch_otp(self, identity):
+        with self.track_lock:
+            self.active_mail += 1
+            self.max_active_mail = max(self.max_active_mail, self.active_mail)
+        try:
+            return super().fetch_otp(identity)
+        finally:
+            with self.track_lock:
+                self.active_mail -= 1
+
+
+def test_ui_is_serialized_and_mail_runs_in_parallel(tmp_path):
+    stages = TrackingStages(ui_latency=0.005, mail_latency=0.2)
+    out = tmp_path / "results.jsonl"
+
+    summary = run_batch(16, concurrency=8, output=str(out), stages=stages)
+
+    assert summary["passed"] == 16 and summary["failed"] == 0
+    assert stages.max_active_ui == 1
+    assert stages.max_active_mail > 1
+    # 16 serial signups would need 16 * 0.21s; overlapping mail waits beats that comfortably
+    assert summary["elapsed"] < 16 * 0.21 / 2
+
+
+def test_results_stream_to_jsonl(tmp_path):
+    out = tmp_path / "results.jsonl"
+    run_batch(10, concurrency=3, output=str(out),
+              stages=StubSignupStages(ui_latency=0, mail_latency=0, fail_every=5))
+
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(r["index"] for r in records) == list(range(10))
+    assert len({r["mailbox"] for r in records}) == 10
+    failed = [r for r in records if r["status"] == "FAIL"]
+    assert len(failed) == 2 and all(r["stage"] == "fetch_otp" for r in failed)
+    assert all("fetch_otp" in r["timings"] for r in records)
+
+
+def test_stage_exception_is_recorded_not_raised(tmp_path):
+    class Broken(StubSignupStages):
+        def submit_form(self, identity):
+            raise RuntimeError("HP Smart window not found")
+
+    out = tmp_path / "results.jsonl"
+    summary = run_batch(2, concurrency=2, output=str(out), stages=Broken(mail_latency=0))
+
+    assert summary["failed"] == 2
+    record = json.loads(out.read_text().splitlines()[0])
+    assert record["error"] == "HP Smart window not found"
+
+
+def test_cli_stub_mode(tmp_path, capsys):
+    out = tmp_path / "cli.jsonl"
+    summary = main(["-n", "5", "-c", "5", "-o", str(out), "--stub",
+                    "--stub-ui-latency", "0", "--stub-mail-latency", "0"])
+
+    assert summary["passed"] == 5
+    assert json.loads(capsys.readouterr().out)["count"] == 5
@@ -0,0 +1,46 @@
+import json
+
+import bench_flows
+
+
+def test_small_run_covers_every_measurement():
+    result = bench_flows.run(iterations=3, concurrency=(1, 8), count=16)
+
+    assert result["signup"]["failed"] == 0 and result["sign_in"]["failed"] == 0
+    assert result["signup"]["e2e"]["n"] == 3
+    assert {"submit_form", "fetch_otp", "verify"} <= set(result["signup"]["stages"])
+    assert {"launch_hp_smart", "sign_in_hp_account", "click_scan_button",
+            "click_return_home_button"} <= set(result["sign_in"]["stages"])
+    assert set(result["throughput"]) == {"c1", "c8"}
+    assert all(t["failed"] == 0 and t["accounts_per_min"] > 0 for t in result["throughput"].values())
+    assert result["memory"]["peak_kib"] > 0
+    json.dumps(result)
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    baseline = {"signup": {"e2e": {"p50_ms": 10.0, "max_ms": 10.0}, "failed": 0},
+                "throughput": {"c8": {"accounts_per_min": 1000.0}},
+                "memory": {"peak_kib": 2000.0}}
+    same = json.loads(json.dumps(baseline))
+    assert bench_flows.compare(same, baseline) == []
+
+    worse = {"signup": {"e2e": {"p50_ms": 14.0, "max_ms": 99.0}, "failed": 2},
+             "throughput": {"c8": {"accounts_per_min": 600.0}},
+             "memory": {"peak_kib": 2100.0}}
+    flagged = bench_flows.compare(worse, baseline, tolerance=0.3)
+    assert [line.split(":")[0] for line in flagged] == [
+        "signup.e2e.p50_ms", "signup.failed", "throughput.c8.accounts_per_min"]
+
+    better = {"signup": {"e2e": {"p50_ms": 2.0}}, "throughput": {"c8": {"accounts_per_min": 5000.0}}}
+    assert bench_flows.compare(better, baseline) == []
+
+
+def test_cli_saves_and_checks_a_baseline(tmp_path, monkeypatch):
+    monkeypatch.setattr(bench_flows, "run", lambda *a, **k: {"signup": {"e2e": {"p50_ms": 10.0}}})
+    baseline = str(tmp_path / "baseline.json")
+    args = ["--output", str(tmp_path / "out.json"), "--baseline", baseline]
+
+    assert bench_flows.main(args + ["--save-baseline"]) == 0
+    assert bench_flows.main(args) == 0
+    monkeypatch.setattr(bench_flows, "run", lambda *a, **k: {"signup": {"e2e": {"p50_ms": 20.0}}})
+    assert bench_flows.main(args) == 1
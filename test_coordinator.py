@@ -0,0 +1,195 @@
+import json
+import threading
+
+import pytest
+
+import coordinator
+from batch_runner import DesktopSignupStages, StubSignupStages
+from coordinator import Agent, Coordinator, CoordinatorError, WorkQueue, _Connection
+from identity import next_identity
+
+
+def stub_identities(n):
+    stages = StubSignupStages()
+    return [stages.new_identity() for _ in range(n)]
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_expired_leases_are_requeued_and_first_result_wins(fake_clock):
+    finished = []
+    queue = WorkQueue(lease_seconds=10, max_attempts=2, clock=fake_clock, on_result=finished.append)
+    for identity in stub_identities(2):
+        queue.add(identity)
+
+    job_a, token_a = queue.lease("a")
+    fake_clock.now = 8
+    assert queue.heartbeat("a", job_a["id"], token_a)
+    fake_clock.now = 17
+    job_b, token_b = queue.lease("b")
+    assert job_b["id"] == 1  # job 0 is still leased thanks to the heartbeat
+
+    fake_clock.now = 30  # both leases ran out
+    job_c, token_c = queue.lease("c")
+    assert (job_c["id"], job_c["attempt"]) == (0, 2)
+    assert queue.stats["requeued"] == 2
+    assert not queue.heartbeat("a", job_a["id"], token_a)
+
+    assert queue.complete("a", 0, token_a, {"status": "PASS"})  # late, but the work is done
+    assert not queue.complete("c", 0, token_c, {"status": "PASS"})
+    assert queue.stats["duplicates"] == 1
+
+    _, token_d = queue.lease("d")
+    fake_clock.now = 50
+    queue.reap()  # job 1 used up its attempts
+    assert queue.done() and queue.stats["lost"] == 1
+    assert [(r["job"], r["status"], r.get("error")) for r in finished] == [
+        (0, "PASS", None), (1, "FAIL", "lease lost")]
+
+    assert queue.complete("d", 1, token_d, {"status": "PASS"})  # the real result replaces "lease lost"
+    assert not queue.complete("b", 1, token_b, {"status": "PASS"})
+    assert queue.results[1]["status"] == "PASS" and queue.stats["lost"] == 0
+
+
+def test_a_submitted_job_is_given_up_instead_of_requeued(fake_clock):
+    finished = []
+    queue = WorkQueue(lease_seconds=10, max_attempts=3, clock=fake_clock, on_result=finished.append)
+    for identity in stub_identities(2):
+        queue.add(identity)
+
+    job_a, token_a = queue.lease("a")
+    assert queue.submit("a", job_a["id"], token_a)
+    job_b, token_b = queue.lease("b")
+    fake_clock.now = 20  # both heartbeats stopped; only job 1 was not submitted yet
+    assert not queue.submit("b", job_b["id"], token_b)
+
+    assert queue.lease("c")[0]["id"] == 1
+    assert queue.stats["requeued"] == 1
+    assert [(r["job"], r["error"]) for r in finished] == [(0, "lease lost after submit")]
+    assert queue.complete("a", 0, token_a, {"status": "PASS"})
+    with pytest.raises(CoordinatorError, match="never leased"):
+        queue.complete("c", 0, token_b, {"status": "PASS"})
+
+
+class UnreachableCoordinator:
+    def call(self, op, **message):
+        if op == "heartbeat":
+            raise OSError("connection reset")
+        return {"ok": True, "record": message.get("record")}
+
+
+class RevokingCoordinator:
+    def call(self, op, **message):
+        return {"ok": op != "submit", "record": message.get("record")}
+
+
+class CountingStages(StubSignupStages):
+    submitted = 0
+
+    def submit_form(self, identity):
+        self.submitted += 1
+        return super().submit_form(identity)
+
+
+def test_agent_that_cannot_heartbeat_does_not_submit():
+    stages = CountingStages(ui_latency=0, mail_latency=0)
+    ui_lock = threading.Lock()
+    ui_lock.acquire()
+    threading.Timer(0.2, ui_lock.release).start()  # the form is reached after the heartbeat failed
+    job = {"id": 0, "flow": "signup", "identity": stages.new_identity()}
+
+    reply = Agent(None, {"signup": stages}, "cut-off", ui_lock=ui_lock).run_job(
+        UnreachableCoordinator(), job, "token", interval=0.01)
+
+    record = reply["record"]
+    assert (record["status"], record["stage"], record["lease_lost"]) == ("FAIL", "submit_form", True)
+    assert stages.submitted == 0
+
+
+def test_agent_does_not_submit_when_the_coordinator_refuses():
+    stages = CountingStages(ui_latency=0, mail_latency=0)
+    job = {"id": 0, "flow": "signup", "identity": stages.new_identity()}
+
+    reply = Agent(None, {"signup": stages}, "revoked").run_job(RevokingCoordinator(), job, "token", interval=5)
+
+    record = reply["record"]
+    assert (record["status"], record["stage"], record["lease_lost"]) == ("FAIL", "submit_form", True)
+    assert stages.submitted == 0
+
+
+def test_thread_agents_drain_the_queue_over_loopback(tmp_path):
+    queue = WorkQueue(lease_seconds=5)
+    for identity in stub_identities(24):
+        queue.add(identity)
+    server = Coordinator(queue, str(tmp_path / "results.jsonl"), str(tmp_path / "events.ndjson"), idle_poll=0.01)
+    address = server.start()
+    agents = [Agent(address, {"signup": StubSignupStages(ui_latency=0.002, mail_latency=0.01)}, f"agent-{i}")
+              for i in range(4)]
+    threads = [threading.Thread(target=a.run) for a in agents]
+    for t in threads:
+        t.start()
+    try:
+        assert server.wait(timeout=30)
+    finally:
+        for t in threads:
+            t.join()
+        server.stop()
+
+    summary = server.summary()
+    assert (summary["count"], summary["passed"], summary["agents"]) == (24, 24, 4)
+    assert sum(a.completed for a in agents) == 24
+    records = read_jsonl(tmp_path / "results.jsonl")
+    assert sorted(r["job"] for r in records) == list(range(24))
+    assert {r["email"] for r in records} == {job["identity"]["email"] for job in queue.jobs.values()}
+
+
+def test_work_of_a_vanished_agent_is_requeued(tmp_path):
+    queue = WorkQueue(lease_seconds=0.2)
+    for identity in stub_identities(3):
+        queue.add(identity)
+    server = Coordinator(queue, str(tmp_path / "results.jsonl"), str(tmp_path / "events.ndjson"), idle_poll=0.05)
+    address = server.start()
+    try:
+        crashed = _Connection(address)
+        lost_job = crashed.call(op="lease", agent="crashed")["job"]
+        crashed.close()
+
+        agent = Agent(address, {"signup": StubSignupStages(ui_latency=0, mail_latency=0.01)}, "survivor")
+        assert agent.run() == 3
+    finally:
+        server.stop()
+
+    assert queue.stats["requeued"] == 1
+    assert queue.results[lost_job["id"]]["agent"] == "survivor"
+    assert server.summary()["passed"] == 3
+
+
+def test_agent_runs_the_desktop_stages_and_ships_step_events(sim, tmp_path):
+    sim()
+    queue = WorkQueue()
+    for _ in range(2):
+        queue.add(next_identity().as_dict())
+    events_path = str(tmp_path / "events.ndjson")
+    server = Coordinator(queue, str(tmp_path / "results.jsonl"), events_path)
+    address = server.start()
+    try:
+        Agent(address, {"signup": DesktopSignupStages(max_wait=30, poll_interval=0.01)}).run()
+    finally:
+        server.stop()
+
+    records = read_jsonl(tmp_path / "results.jsonl")
+    assert [r["status"] for r in records] == ["PASS", "PASS"]
+    events = read_jsonl(events_path)
+    assert {e["run"] for e in events} == {r["run_id"] for r in records}
+    steps = {e["step"] for e in events if e["kind"] == "step"}
+    assert {"fill_account_form", "complete_web_verification_in_app"} <= steps
+
+
+def test_local_mode_runs_agent_processes(tmp_path, capsys):
+    summary = coordinator.main(["local", "-n", "6", "--agents", "2", "--stub", "--stub-mail-latency", "0.01",
+                                "-o", str(tmp_path / "results.jsonl"), "--events", str(tmp_path / "e.ndjson")])
+    assert (summary["passed"], summary["failed"], summary["agents"]) == (6, 0, 2)
+    assert len(read_jsonl(tmp_path / "results.jsonl")) == 6
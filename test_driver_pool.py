@@ -0,0 +1,238 @@
+import threading
+import time
+
+import pytest
+
+from driver_pool import DriverPool, DriverPoolClosed, is_healthy, reset_session
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    @property
+    def alert(self):
+        if not self.driver.alert_open:
+            raise RuntimeError("no such alert")
+        return self
+
+    def accept(self):
+        self.driver.alert_open = False
+
+    def window(self, handle):
+        self.driver.current = handle
+
+
+class FakeDriver:
+    def __init__(self, n):
+        self.n = n
+        self.window_handles = ["tab-0"]
+        self.current = "tab-0"
+        self.cookies = {}
+        self.url = "about:blank"
+        self.alert_open = False
+        self.alive = True
+        self.quit_calls = 0
+        self.switch_to = FakeSwitchTo(self)
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise ConnectionError("chrome not reachable")
+        return self.url
+
+    def get(self, url):
+        self.url = url
+
+    def close(self):
+        self.window_handles.remove(self.current)
+
+    def delete_all_cookies(self):
+        self.cookies.clear()
+
+    def quit(self):
+        self.quit_calls += 1
+        self.alive = False
+
+
+class FakeFactory:
+    def __init__(self, delay=0.0):
+        self.drivers = []
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self._lock:
+            driver = FakeDriver(len(self.drivers))
+            self.drivers.append(driver)
+            return driver
+
+
+def make_pool(factory, **kwargs):
+    return DriverPool(factory, log=lambda *a: None, **kwargs)
+
+
+def test_sessions_are_reused_and_reset_between_uses():
+    factory = FakeFactory()
+    pool = make_pool(factory, size=1)
+
+    with pool.session() as driver:
+        driver.get("https://mailsac.com/inbox/a")
+        driver.cookies["sid"] = "1"
+        driver.window_handles.append("tab-1")
+        driver.switch_to.window("tab-1")
+        driver.alert_open = True
+    with pool.session() as again:
+        assert again is driver
+
+    assert len(factory.drivers) == 1
+    assert driver.window_handles == ["tab-0"] and driver.current == "tab-0"
+    assert driver.cookies == {} and driver.url == "about:blank" and not driver.alert_open
+    assert pool.stats["created"] == 1 and pool.stats["reused"] == 1
+
+
+def test_sessions_are_recycled_after_max_uses_and_max_age():
+    factory = FakeFactory()
+    now = [0.0]
+    pool = make_pool(factory, size=1, max_uses=2, max_age=100, clock=lambda: now[0])
+
+    for _ in range(4):
+        with pool.session():
+            pass
+    assert len(factory.drivers) == 2
+    assert factory.drivers[0].quit_calls == 1
+
+    now[0] = 500.0
+    with pool.session():
+        pass
+    with pool.session():
+        pass
+    assert len(factory.drivers) == 3
+    assert pool.stats["recycled"] == 3
+
+
+def test_dead_idle_session_is_replaced_on_acquire():
+    factory = FakeFactory()
+    pool = make_pool(factory, size=1)
+    with pool.session() as driver:
+        pass
+    driver.alive = False
+
+    with pool.session() as fresh:
+        assert fresh is not driver
+    assert pool.stats["unhealthy"] == 1
+
+
+def test_error_inside_session_discards_it():
+    factory = FakeFactory()
+    pool = make_pool(factory, size=1)
+
+    with pytest.raises(ValueError):
+        with pool.session() as driver:
+            raise ValueError("stale element")
+    assert driver.quit_calls == 1
+    with pool.session() as fresh:
+        assert fresh is not driver
+    assert pool.stats["broken"] == 1
+
+
+def test_failed_reset_recycles_instead_of_reusing():
+    factory = FakeFactory()
+
+    def bad_reset(driver):
+        raise RuntimeError("tab crashed")
+
+    pool = make_pool(factory, size=1, reset=bad_reset)
+    with pool.session():
+        pass
+    with pool.session():
+        pass
+    assert len(factory.drivers) == 2
+
+
+def test_each_session_serves_one_caller_at_a_time():
+    factory = FakeFactory()
+    pool = make_pool(factory, size=2)
+    in_use = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def check():
+        with pool.session() as driver:
+            with lock:
+                if driver in in_use:
+                    overlaps.append(driver)
+                in_use.add(driver)
+            time.sleep(0.005)
+            with lock:
+                in_use.discard(driver)
+
+    threads = [threading.Thread(target=check) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert overlaps == []
+    assert len(factory.drivers) == 2
+
+
+def test_acquire_times_out_when_every_session_is_busy():
+    pool = make_pool(FakeFactory(), size=1)
+    held = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+    pool.release(held)
+    pool.release(pool.acquire(timeout=0.01))
+
+
+def test_warm_starts_sessions_in_the_background_without_exceeding_size():
+    factory = FakeFactory(delay=0.02)
+    pool = make_pool(factory, size=3)
+
+    pool.warm(wait=True)
+    pool.warm(wait=True)
+    started = time.monotonic()
+    with pool.session():
+        pass
+
+    assert len(factory.drivers) == 3
+    assert time.monotonic() - started < 0.02
+
+
+def test_warm_fills_only_the_free_slots():
+    factory = FakeFactory(delay=0.01)
+    pool = make_pool(factory, size=4)
+    busy = pool.acquire()
+
+    pool.warm(wait=True)
+    assert len(factory.drivers) == 4 and pool._idle.qsize() == 3
+    pool.release(busy)
+    pool.warm(wait=True)
+    assert len(factory.drivers) == 4 and pool._idle.qsize() == 4
+
+
+def test_close_quits_idle_and_released_sessions():
+    factory = FakeFactory()
+    pool = make_pool(factory, size=2)
+    idle = pool.acquire()
+    busy = pool.acquire()
+    pool.release(idle)
+
+    pool.close()
+    assert idle.driver.quit_calls == 1 and busy.driver.quit_calls == 0
+    pool.release(busy)
+    assert busy.driver.quit_calls == 1
+    with pytest.raises(DriverPoolClosed):
+        pool.acquire()
+
+
+def test_default_reset_and_health_check_on_fake_driver():
+    driver = FakeDriver(0)
+    driver.window_handles += ["tab-1", "tab-2"]
+    reset_session(driver)
+    assert driver.window_handles == ["tab-0"]
+    assert is_healthy(driver)
+    driver.quit()
+    assert not is_healthy(driver)
@@ -0,0 +1,301 @@
+import pytest
+
+import flows
+import step_log
+import waits
+from flows import FLOWS, Flow, FlowError, Selector, Step, Wait, compile_flows, run_flow
+from locator import Locator
+
+
+# -------------------------------------------------------------
+#  MINIMAL FAKE UI
+# -------------------------------------------------------------
+class FakeInfo:
+    def __init__(self, ctrl):
+        self.automation_id = ctrl.auto_id
+        self.name = ctrl.title
+        self.control_type = ctrl.control_type
+
+
+class FakeControl:
+    def __init__(self, window, auto_id="", title="", control_type="Button", on_click=None):
+        self.window = window
+        self.auto_id = auto_id
+        self.title = title
+        self.control_type = control_type
+        self.on_click = on_click
+        self.typed = ""
+        self.clicks = 0
+        self.element_info = FakeInfo(self)
+
+    def click_input(self):
+        self.clicks += 1
+        if self.on_click:
+            self.on_click(self)
+
+    def type_keys(self, text, with_spaces=False):
+        self.typed += text
+
+    def is_visible(self):
+        return self in self.window.controls
+
+    def window_text(self):
+        return self.typed if self.control_type == "Edit" else self.title
+
+
+class FakeSpec:
+    """Lazy child_window() spec resolved against the window's current controls."""
+
+    def __init__(self, window, criteria):
+        self.window = window
+        self.criteria = criteria
+
+    def _resolve(self):
+        matches = [c for c in self.window.controls
+                   if all(getattr(c, k) == v for k, v in self.criteria.items() if k != "found_index")]
+        if not matches:
+            raise LookupError(f"no control matching {self.criteria}")
+        return matches[self.criteria.get("found_index", 0)]
+
+    def exists(self, timeout=None):
+        try:
+            self._resolve()
+            return True
+        except LookupError:
+            return False
+
+    def wait(self, wait_for, timeout=None):
+        return self._resolve()
+
+    def click_input(self):
+        self._resolve().click_input()
+
+    def type_keys(self, text, with_spaces=False):
+        self._resolve().type_keys(text, with_spaces)
+
+    def window_text(self):
+        return self._resolve().window_text()
+
+
+class FakeWindow:
+    def __init__(self, title):
+        self.title = title
+        self.controls = []
+        self.focused = 0
+        self.present = True
+
+    def add(self, **kwargs):
+        ctrl = FakeControl(self, **kwargs)
+        self.controls.append(ctrl)
+        return ctrl
+
+    def child_window(self, **criteria):
+        return FakeSpec(self, criteria)
+
+    def descendants(self, control_type=None):
+        return [c for c in self.controls if control_type in (None, c.control_type)]
+
+    def exists(self, timeout=None):
+        return self.present
+
+    def wait(self, wait_for, timeout=None):
+        if not self.present:
+            raise TimeoutError(wait_for)
+
+    def set_focus(self):
+        self.focused += 1
+
+
+class FakeDesktop:
+    def __init__(self, *windows):
+        self.windows = {w.title: w for w in windows}
+
+    def window(self, title_re):
+        return self.windows.get(title_re) or FakeWindow("missing")
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, fake_clock):
+    previous_clock = waits.set_clock(fake_clock)
+    previous_rec = step_log.set_recorder(step_log.StepRecorder(str(tmp_path / "steps.ndjson"), echo=False))
+    yield
+    waits.set_clock(previous_clock)
+    step_log.set_recorder(previous_rec)
+
+
+def logged():
+    rec = step_log.get_recorder()
+    rec.flush_all()
+    return [(e["desc"], e["status"]) for e in rec.events(kind="log")]
+
+
+# -------------------------------------------------------------
+#  VALIDATION
+# -------------------------------------------------------------
+def test_shipped_flows_compile():
+    assert set(FLOWS) == {"open_create_account", "open_sign_in", "signup_form", "verify_otp",
+                          "sign_in", "scan", "return_home"}
+
+
+def test_validation_reports_every_problem():
+    broken = Flow("broken", (
+        Step("click", "click"),
+        Step("type", "type", Selector(auto_id="email", control_type="Editt"), value="{emial}"),
+        Step("type", "tap", Selector()),
+        Step("wait", "wait", wait_after=Wait("window_gone")),
+    ), inputs=("email",))
+
+    with pytest.raises(FlowError) as err:
+        compile_flows([broken])
+    message = str(err.value)
+    for expected in ("needs a target", "unknown control_type 'Editt'", "{emial}",
+                     "duplicate step name", "unknown action 'tap'", "no criteria",
+                     "needs a window pattern"):
+        assert expected in message
+
+
+def test_missing_inputs_fail_fast():
+    with pytest.raises(FlowError, match="missing inputs"):
+        run_flow(FLOWS["signup_form"], FakeDesktop(), {"email": "a@b.c"})
+
+
+# -------------------------------------------------------------
+#  EXECUTOR
+# -------------------------------------------------------------
+def hp_smart():
+    return FakeWindow(".*HP Smart.*")
+
+
+def test_open_create_account_clicks_in_order():
+    main = hp_smart()
+    manage = main.add(auto_id="HpcSignedOutIcon", title="Manage HP Account")
+    create = main.add(auto_id="HpcSignOutFlyout_CreateBtn", title="Create account")
+
+    assert run_flow(FLOWS["open_create_account"], FakeDesktop(main), locator=Locator())
+    assert (manage.clicks, create.clicks, main.focused) == (1, 1, 1)
+    assert ("Clicked Create Account button.", "PASS") in logged()
+
+
+def test_scan_uses_indexed_fallback_and_waits_for_scan_screen():
+    main = hp_smart()
+    scan = main.add(title="Scan documents", on_click=lambda c: main.add(title="Return Home"))
+
+    assert run_flow(FLOWS["scan"], FakeDesktop(main), locator=Locator())
+    assert scan.clicks == 1
+    assert any(desc.startswith("click_scan: primary selector not found") for desc, _ in logged())
+    assert waits.WAIT_LOG[-1].name == "scan.click_scan_done" and waits.WAIT_LOG[-1].ok
+
+
+def test_failed_precondition_exits_before_any_step():
+    main = hp_smart()
+    main.present = False
+    button = main.add(title="Return Home")
+
+    assert not run_flow(FLOWS["return_home"], FakeDesktop(main), locator=Locator())
+    assert button.clicks == 0 and main.focused == 0
+    assert logged()[-1] == ("Precondition for 'return_home' not met, skipping flow.", "FAIL")
+
+
+def test_optional_step_failure_continues_and_required_failure_stops():
+    main = hp_smart()
+    main.add(auto_id="HpcSignedOutIcon", title="Manage HP Account")
+
+    assert run_flow(FLOWS["open_sign_in"], FakeDesktop(main), locator=Locator())
+    assert logged()[-1] == ("Sign In button not found in flyout, assuming browser is already opened.", "INFO")
+
+    assert not run_flow(FLOWS["open_create_account"], FakeDesktop(main), locator=Locator())
+    assert logged()[-1][1] == "FAIL"
+
+
+def test_retries_and_values():
+    account = FakeWindow(".*HP account.*")
+    attempts = []
+
+    def flaky(ctrl):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("element not enabled")
+
+    account.add(auto_id="firstName", control_type="Edit")
+    submit = account.add(auto_id="go", on_click=flaky)
+    flow = Flow("retrying", (
+        Step("type_name", "type", Selector(auto_id="firstName", control_type="Edit"),
+             window=".*HP account.*", value="{first_name}", log="Typed {first_name}"),
+        Step("submit", "click", Selector(auto_id="go", control_type="Button"),
+             window=".*HP account.*", retries=2),
+    ), inputs=("first_name",))
+    compile_flows([flow])
+
+    assert run_flow(flow, FakeDesktop(account), {"first_name": "Ava"}, locator=Locator())
+    assert account.controls[0].typed == "Ava"
+    assert submit.clicks == 3
+    assert ("Typed Ava", "PASS") in logged()
+
+
+class LateLocator(Locator):
+    """The fallback control only shows up after the first lookup."""
+
+    def __init__(self, window):
+        super().__init__()
+        self.lookups = 0
+        self.late = window
+
+    def find_text(self, window, text, control_type=None):
+        self.lookups += 1
+        if self.lookups == 1:
+            self.late.add(title="Next page", control_type="Button")
+            return None
+        return super().find_text(window, text, control_type)
+
+
+def test_a_step_whose_control_is_not_found_yet_is_retried():
+    account = FakeWindow(".*HP account.*")
+    flow = Flow("late", (
+        Step("click_next", "click", Selector(auto_id="next", control_type="Button"),
+             window=".*HP account.*", fallbacks=(Selector(text="Next", control_type="Button"),),
+             timeout=0.1, retries=1),
+    ))
+    compile_flows([flow])
+    locator = LateLocator(account)
+
+    assert run_flow(flow, FakeDesktop(account), locator=locator)
+    assert locator.lookups == 2 and account.controls[0].clicks == 1
+
+
+def test_gone_wait_on_a_fallback_match_waits_for_that_control():
+    main = hp_smart()
+    stays = main.add(title="Scan documents")
+    flow = Flow("scan_once", (
+        Step("click_scan", "click", Selector(title="Scan", control_type="Button"),
+             fallbacks=(Selector(text="Scan", control_type="Button"),),
+             wait_after=Wait("gone", timeout=2)),
+    ))
+    compile_flows([flow])
+
+    assert not run_flow(flow, FakeDesktop(main), locator=Locator())
+    assert stays.clicks == 1 and waits.WAIT_LOG[-1].ok is False
+
+    stays.on_click = lambda c: main.controls.remove(c)
+    assert run_flow(flow, FakeDesktop(main), locator=Locator())
+
+
+def test_per_step_timing_is_recorded():
+    main = hp_smart()
+    main.add(auto_id="HpcSignedOutIcon", title="Manage HP Account")
+    main.add(auto_id="HpcSignOutFlyout_CreateBtn")
+    run_flow(FLOWS["open_create_account"], FakeDesktop(main), locator=Locator())
+
+    rec = step_log.get_recorder()
+    rec.flush_all()
+    names = [e["step"] for e in rec.events(kind="step")]
+    assert names == ["open_create_account.focus_main_window",
+                     "open_create_account.open_account_flyout",
+                     "open_create_account.click_create_account",
+                     "open_create_account"]
+
+
+def test_iter_selectors_covers_fallbacks_and_waits():
+    selectors = [sel for _, _, _, sel in flows.iter_selectors(FLOWS.values())]
+    assert Selector(text="Sign in", control_type="Button") in selectors
+    assert Selector(title="Return Home", control_type="Button") in selectors
+    assert Selector(auto_id="code", control_type="Edit") in selectors
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+import identity
+from identity import (
+    IdentitiesExhausted, IdentityFactory, IdentityFile, UsedMailboxes, pregenerate,
+)
+
+
+def _take(factory, count):
+    return [factory.next() for _ in range(count)]
+
+
+def test_same_seed_same_sequence_and_no_repeats():
+    a = IdentityFactory(seed=7)
+    b = IdentityFactory(seed=7)
+    first = [a.next() for _ in range(50)]
+    assert first == [b.next() for _ in range(50)]
+
+    mailboxes = [i.mailbox for i in first] + [a.next().mailbox for _ in range(100000)]
+    assert len(set(mailboxes)) == len(mailboxes)
+    assert IdentityFactory(seed=8).next() != first[0]
+
+
+def test_identity_record_matches_the_old_shape():
+    record = IdentityFactory(seed=1, domain="example.test").next().as_dict()
+    assert set(record) == {"first_name", "last_name", "email", "mailbox", "password"}
+    assert record["email"] == record["mailbox"] + "@example.test"
+    assert record["mailbox"].startswith(f"{record['first_name'].lower()}.{record['last_name'].lower()}.")
+    assert record["mailbox"].endswith("test")
+    assert record["password"] == identity.DEFAULT_PASSWORD
+
+
+def test_used_filter_persists_and_skips_other_runs(tmp_path):
+    path = str(tmp_path / "used.bloom")
+    used = UsedMailboxes(path, capacity=1000)
+    handed_out = [i.mailbox for i in _take(IdentityFactory(seed=3, used=used), 20)]
+    used.close()
+
+    reopened = UsedMailboxes(path, capacity=10)
+    assert len(reopened) == 20
+    assert all(m in reopened for m in handed_out)
+    assert "nobody.here.000000test" not in reopened
+    rerun = IdentityFactory(seed=3, used=reopened)
+    assert rerun.next().mailbox not in handed_out
+    assert rerun.skipped == 20
+    reopened.close()
+
+
+def test_factory_is_thread_safe():
+    factory = IdentityFactory(seed=11)
+    results = []
+    lock = threading.Lock()
+
+    def work():
+        batch = _take(factory, 2000)
+        with lock:
+            results.extend(batch)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({i.mailbox for i in results}) == 16000
+
+
+def test_pregenerated_file_is_taken_in_order_and_resumes(tmp_path):
+    path = str(tmp_path / "identities.bin")
+    factory = IdentityFactory(seed=5, domain="example.test")
+    assert pregenerate(path, 1000, factory) == 1000
+    expected = _take(IdentityFactory(seed=5, domain="example.test"), 1000)
+
+    ids = IdentityFile(path)
+    assert len(ids) == 1000 and ids[999] == expected[999]
+    assert [ids.take() for _ in range(10)] == expected[:10]
+    ids.close()
+
+    ids = IdentityFile(path)
+    assert ids.remaining() == 990
+    taken = []
+    threads = [threading.Thread(target=lambda: taken.extend(ids.take() for _ in range(110)))
+               for _ in range(9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(i.mailbox for i in taken) == sorted(i.mailbox for i in expected[10:])
+    with pytest.raises(IdentitiesExhausted):
+        ids.take()
+    ids.close()
+
+
+def test_pregenerate_marks_only_the_written_mailboxes_used(tmp_path):
+    used = UsedMailboxes(str(tmp_path / "used.bloom"), capacity=1000)
+    path = str(tmp_path / "identities.bin")
+    assert pregenerate(path, 50, IdentityFactory(seed=4, used=used)) == 50
+
+    assert len(used) == 50
+    ids = IdentityFile(path)
+    assert all(ids[n].mailbox in used for n in range(50))
+    ids.close()
+    used.close()
+
+
+def test_shared_source_reads_the_environment(tmp_path, monkeypatch):
+    path = str(tmp_path / "identities.bin")
+    pregenerate(path, 3, IdentityFactory(seed=2))
+    monkeypatch.setattr(identity, "_SOURCE", None)
+    monkeypatch.setenv("IDENTITY_FILE", path)
+    try:
+        assert identity.next_identity() == IdentityFactory(seed=2).next()
+    finally:
+        identity.get_identity_source().close()
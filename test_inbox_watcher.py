@@ -0,0 +1,160 @@
+import threading
+import time
+
+from inbox_watcher import (ImapCatchAllSource, InboxMessage, InboxWatcher, MailsacDomainSource,
+                           WatchedInboxProvider)
+from otp_providers import ImapProvider, MailsacApiProvider
+
+
+class FakeSource:
+    """In-memory bulk listing; counts how often it is polled."""
+
+    def __init__(self):
+        self.messages = []
+        self.polls = 0
+        self.reads = 0
+        self.lock = threading.Lock()
+
+    def deliver(self, address, msg_id, text):
+        with self.lock:
+            self.messages.append(InboxMessage(address, msg_id, text=text))
+
+    def poll(self):
+        with self.lock:
+            self.polls += 1
+            return list(self.messages)
+
+    def read(self, message):
+        self.reads += 1
+        return message.text
+
+
+def quiet(*args):
+    pass
+
+
+def test_one_loop_serves_many_mailboxes():
+    source = FakeSource()
+    watcher = InboxWatcher(source, interval=0.02, log=quiet)
+    futures = {f"user{i}@example.com": watcher.watch(f"user{i}@example.com", timeout=5)
+               for i in range(200)}
+
+    for i, address in enumerate(futures):
+        source.deliver(address, f"m{i}", f"Your verification code is {i:06d}.")
+    results = {address: f.result(timeout=5) for address, f in futures.items()}
+
+    assert results == {f"user{i}@example.com": f"{i:06d}" for i in range(200)}
+    # A handful of bulk polls instead of hundreds of per-mailbox ones
+    assert source.polls < 20
+    assert source.reads == 200
+
+
+def test_messages_for_other_or_unknown_recipients_are_not_read():
+    source = FakeSource()
+    source.deliver("stranger@example.com", "x1", "Code 111111")
+    watcher = InboxWatcher(source, interval=0.01, log=quiet)
+
+    future = watcher.watch("Ann@Example.com", timeout=5)
+    source.deliver("ann@example.com", "a1", "Welcome!")
+    source.deliver("ann@example.com", "a2", "Your code is 222222")
+
+    assert future.result(timeout=5) == "222222"
+    assert source.reads == 2
+
+
+def test_unanswered_watch_resolves_to_none_and_loop_stops():
+    source = FakeSource()
+    watcher = InboxWatcher(source, interval=0.01, log=quiet)
+
+    assert watcher.watch("nobody@example.com", timeout=0.05).result(timeout=2) is None
+    polls = source.polls
+    time.sleep(0.05)
+    assert source.polls == polls
+    assert watcher.stats["expired"] == 1 and watcher.pending() == 0
+
+
+def test_read_ids_are_bounded_while_the_watcher_stays_busy():
+    source = FakeSource()
+    watcher = InboxWatcher(source, interval=0.01, log=quiet, seen_limit=20)
+    busy = watcher.watch("busy@example.com", timeout=5)  # keeps the loop and its read ids alive
+
+    for i in range(60):
+        address = f"user{i}@example.com"
+        future = watcher.watch(address, timeout=5)
+        source.deliver(address, f"m{i}", f"Your verification code is {i:06d}.")
+        assert future.result(timeout=5) == f"{i:06d}"
+    assert len(watcher._seen) == 20
+
+    source.deliver("busy@example.com", "b1", "Your code is 999999")
+    assert busy.result(timeout=5) == "999999"
+
+
+def test_poll_errors_are_logged_and_polling_continues():
+    source = FakeSource()
+    calls = []
+    real_poll = source.poll
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("reset by peer")
+        return real_poll()
+
+    source.poll = flaky
+    logged = []
+    watcher = InboxWatcher(source, interval=0.01, log=lambda *a: logged.append(a))
+    source.deliver("ann@example.com", "a1", "Code 333333")
+
+    assert watcher.watch("ann@example.com", timeout=5).result(timeout=5) == "333333"
+    assert watcher.stats["errors"] == 1
+    assert "reset by peer" in logged[0][0]
+
+
+def test_close_releases_waiters():
+    watcher = InboxWatcher(FakeSource(), interval=0.01, log=quiet)
+    future = watcher.watch("ann@example.com", timeout=60)
+    watcher.close()
+    assert future.result(timeout=1) is None
+    assert watcher.watch("late@example.com").result(timeout=1) is None
+
+
+# -------------------------------------------------------------
+#  BULK SOURCES AGAINST LOCAL FAKE SERVERS
+# -------------------------------------------------------------
+def test_mailsac_domain_source_lists_the_whole_domain_in_one_call(mailsac_stub):
+    for i in range(20):
+        mailsac_stub.add(f"user{i}@otp.example.com", f"m{i}", f"Your code is {i:06d}", visible_after=2)
+    mailsac_stub.add("other@mailsac.com", "o1", "Code 999999")
+    api = MailsacApiProvider("k", base_url=mailsac_stub.url)
+    provider = WatchedInboxProvider(
+        InboxWatcher(MailsacDomainSource(api, "otp.example.com"), interval=0.02, log=quiet),
+        domain="otp.example.com")
+
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(
+        i, provider.fetch_otp(f"user{i}", max_wait=5))) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: f"{i:06d}" for i in range(20)}
+    assert mailsac_stub.listings < 10
+    provider.close()
+    api.close()
+
+
+def test_imap_catch_all_source_reads_only_new_uids(imap_stub, otp_email):
+    server = imap_stub([otp_email("old@otp.example.com", "100000")])
+    imap = ImapProvider("127.0.0.1", "user", "secret", port=server.server_address[1], use_ssl=False)
+    source = ImapCatchAllSource(imap)
+
+    first = source.poll()
+    assert [(m.recipient, m.id) for m in first] == [("old@otp.example.com", "imap:1")]
+    assert source.poll() == []
+
+    server.messages.append(otp_email("ann@otp.example.com", "424242"))
+    watcher = InboxWatcher(source, interval=0.02, log=quiet)
+    assert watcher.watch("ann@otp.example.com", timeout=5).result(timeout=5) == "424242"
+    assert source.last_uid == 2
+    imap.close()
@@ -0,0 +1,104 @@
+import sqlite3
+
+from batch_runner import StubSignupStages, run_batch
+from ledger import Ledger, reached
+
+
+def identity(n):
+    mailbox = f"user.{n}.test"
+    return {"first_name": "Ann", "last_name": f"Lee{n}", "email": f"{mailbox}@mailsac.com",
+            "mailbox": mailbox, "password": "pw"}
+
+
+class FlakyStages(StubSignupStages):
+    """Stub stages that count calls and fail verification until told otherwise."""
+
+    def __init__(self):
+        super().__init__(ui_latency=0, mail_latency=0)
+        self.calls = {"submit_form": 0, "fetch_otp": 0, "verify": 0}
+        self.verify_ok = False
+
+    def submit_form(self, identity):
+        self.calls["submit_form"] += 1
+        return True
+
+    def fetch_otp(self, identity):
+        self.calls["fetch_otp"] += 1
+        return super().fetch_otp(identity)
+
+    def verify(self, identity, otp):
+        self.calls["verify"] += 1
+        return self.verify_ok
+
+
+def test_stages_persist_in_a_wal_database(tmp_path):
+    path = str(tmp_path / "ledger.sqlite")
+    ledger = Ledger(path)
+    assert ledger.journal_mode == "wal"
+    ledger.begin(identity(1), run_id="r1")
+    ledger.advance("user.1.test", "submit_form")
+    ledger.advance("user.1.test", "fetch_otp", otp="123456")
+    ledger.close()
+
+    reopened = Ledger(path)
+    row = reopened.get("user.1.test")
+    assert (row["stage"], row["otp"], row["status"], row["attempts"]) == ("fetch_otp", "123456", "OPEN", 1)
+    assert row["identity"] == identity(1)
+    reopened.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM accounts").fetchone() == (1,)
+
+
+def test_resumable_skips_passed_and_exhausted_accounts(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite"))
+    for n in range(3):
+        ledger.begin(identity(n))
+    ledger.finish("user.0.test", "PASS")
+    ledger.finish("user.1.test", "FAIL", "timeout")
+    for _ in range(2):
+        ledger.begin(identity(2))
+
+    assert [r["mailbox"] for r in ledger.resumable()] == ["user.1.test"]
+    assert [r["mailbox"] for r in ledger.resumable(max_attempts=4)] == ["user.1.test", "user.2.test"]
+    assert ledger.counts() == {("identity", "PASS"): 1, ("identity", "FAIL"): 1, ("identity", "OPEN"): 1}
+    assert reached("fetch_otp", "submit_form") and not reached("identity", "submit_form")
+    assert not reached(None, "identity")
+
+
+def test_batch_resume_skips_completed_stages(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.sqlite"))
+    stages = FlakyStages()
+    out = str(tmp_path / "results.jsonl")
+
+    first = run_batch(4, concurrency=2, output=out, stages=stages, ledger=ledger)
+    assert first["failed"] == 4
+    assert {r["stage"] for r in ledger.resumable()} == {"fetch_otp"}
+
+    stages.verify_ok = True
+    second = run_batch(1, concurrency=2, output=out, stages=stages, ledger=ledger, resume=True)
+    assert second["resumed"] == 4 and second["passed"] == 5
+    assert stages.calls == {"submit_form": 5, "fetch_otp": 5, "verify": 9}
+    assert ledger.resumable() == []
+    assert ledger.counts() == {("verify", "PASS"): 5}
+
+
+def test_signup_script_resumes_after_the_otp_wait_ran_out(sim, monkeypatch, tmp_path, failures):
+    import ledger as ledger_module
+    import test_otpfinal
+    app = sim(latencies={"mail_delivery": 0.5})
+    monkeypatch.setenv("RUN_LEDGER", str(tmp_path / "ledger.sqlite"))
+    monkeypatch.setattr(ledger_module, "_LEDGER", None)
+
+    monkeypatch.setattr(test_otpfinal, "OTP_WATCH_MAX_WAIT", 0.05)
+    test_otpfinal.main()
+    assert "accounts_created" not in app.stats
+    [row] = ledger_module.get_ledger().resumable()
+    assert (row["stage"], row["status"]) == ("submit_form", "FAIL")
+
+    monkeypatch.setattr(test_otpfinal, "OTP_WATCH_MAX_WAIT", 30)
+    test_otpfinal.main()
+    assert app.stats["accounts_created"] == 1
+    assert len(app.mail.messages(row["email"])) == 1
+    assert ledger_module.get_ledger().get(row["mailbox"])["status"] == "PASS"
+    assert sorted(failures()) == ["OTP not found in email.", "OTP was not retrieved. Skipping verification."]
+    ledger_module.get_ledger().close()
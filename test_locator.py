@@ -0,0 +1,86 @@
+from bench_locator import FakeTree, naive_find_text, run
+from locator import ControlIndex, Locator
+
+
+class FakeDesktop:
+    def __init__(self):
+        self.lookups = 0
+
+    def window(self, title_re):
+        self.lookups += 1
+        return FakeTree(20)
+
+
+def test_index_lookups_match_the_naive_scan():
+    tree = FakeTree(500)
+    index = ControlIndex(tree.descendants())
+
+    for text in ("Scan", "Return Home", "Sign in"):
+        assert index.find_text(text, control_type="Button") is naive_find_text(tree, text, "Button")
+    assert index.find(auto_id="ctl_7").auto_id == "ctl_7"
+    assert index.find(auto_id="ctl_7", control_type="Button") is None
+    assert len(index.find_all(control_type="Edit")) == 100
+    assert index.find_text("does not exist") is None
+
+
+def test_index_is_built_once_and_reads_each_property_once():
+    tree = FakeTree(1000)
+    locator = Locator(index_ttl=None)
+
+    for _ in range(20):
+        assert locator.find_text(tree, "Return Home", control_type="Button") is not None
+    assert tree.walks == 1
+    assert tree.reads == 3 * 1000
+    assert locator.stats["index_builds"] == 1
+
+
+def test_stale_hit_rebuilds_index():
+    tree = FakeTree(100)
+    locator = Locator(index_ttl=None)
+    old = locator.find_text(tree, "Scan", control_type="Button")
+
+    old.alive = False
+    replacement = tree.controls[-3] = type(old)(tree, "scan2", "Scan", "Button")
+    assert locator.find_text(tree, "Scan", control_type="Button") is replacement
+    assert locator.stats["stale"] == 1 and tree.walks == 2
+
+
+def test_miss_in_old_index_rebuilds_but_fresh_miss_does_not():
+    tree = FakeTree(50)
+    locator = Locator(index_ttl=None)
+
+    assert locator.find(tree, auto_id="sign-up-submit") is None
+    assert tree.walks == 1
+    tree.controls.append(type(tree.controls[0])(tree, "sign-up-submit", "Create", "Button"))
+    assert locator.find(tree, auto_id="sign-up-submit") is not None
+    assert tree.walks == 2
+
+
+def test_index_ttl_expires():
+    now = [0.0]
+    tree = FakeTree(10)
+    locator = Locator(index_ttl=5, clock=lambda: now[0])
+
+    locator.index(tree)
+    now[0] = 4.9
+    locator.index(tree)
+    now[0] = 5.1
+    locator.index(tree)
+    assert tree.walks == 2
+
+
+def test_window_spec_is_cached_per_desktop_until_stale():
+    desktop = FakeDesktop()
+    locator = Locator()
+
+    first = locator.window(desktop, ".*HP Smart.*")
+    assert locator.window(desktop, ".*HP Smart.*") is first
+    assert desktop.lookups == 1
+    assert locator.window(FakeDesktop(), ".*HP Smart.*") is not first
+
+
+def test_benchmark_10k_nodes():
+    result = run(nodes=10000, lookups=30, cost=0)
+    assert result["indexed_walks"] == 1
+    assert result["naive_walks"] == 30
+    assert result["indexed_property_reads"] < result["naive_property_reads"]
@@ -0,0 +1,94 @@
+from email.message import EmailMessage
+
+import bench_otp_extract
+from otp_extract import classify, extract, extract_batch, find_code, iter_mbox, message_text
+
+
+def raw_message(body, to="ann@mailsac.com", sender="HP <no-reply@hp.com>",
+                subject="Your HP account verification code", html=None,
+                date="Wed, 01 Jan 2025 00:00:00 +0000"):
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg["Date"] = date
+    if body is not None:
+        msg.set_content(body)
+    if html is not None:
+        if body is None:
+            msg.set_content(html, subtype="html")
+        else:
+            msg.add_alternative(html, subtype="html")
+    return msg.as_bytes()
+
+
+def test_code_is_anchored_to_its_keyword_not_the_first_number():
+    text = "Request 482913 received.\nYour verification code is 123456.\nCall 1-800-555123."
+    assert find_code(text) == "123456"
+    assert find_code("Code: 654321") == "654321"
+    assert find_code("Your order 123456 has shipped") is None
+    assert find_code("code 1234567") is None
+
+
+def test_html_only_message_ignores_css_colours():
+    html = ("<html><head><style>a { color: #112233; }</style></head><body>"
+            "<p style='color:#445566'>Use this code:</p><div>\n 778899 \n</div></body></html>")
+    match = extract(raw_message(None, html=html))
+    assert match.code == "778899"
+    assert match.template == "hp_otp"
+
+
+def test_plain_part_is_preferred_over_html():
+    match = extract(raw_message("Your code is 111111", html="<p>Your code is <b>222222</b></p>"))
+    assert match.code == "111111"
+
+
+def test_sender_and_subject_must_match_a_template():
+    assert extract(raw_message("Your code is 123456", sender="Deals <news@shop.example.com>")) is None
+    assert extract(raw_message("Your code is 123456", subject="Welcome to HP Smart")) is None
+    assert classify("no-reply@email.hp.com", "Verify your email") is not None
+    assert classify("no-reply@nothp.com", "Verify your email") is None
+
+
+def test_encoded_headers_and_transfer_encodings():
+    msg = EmailMessage()
+    msg["From"] = "=?utf-8?q?HP_Konto?= <konto@hp.com>"
+    msg["To"] = "Ann Lee <Ann.Lee@mailsac.com>"
+    msg["Subject"] = "Ihr HP-Konto: Bestätigungs-Code"
+    msg.set_content("Ihr Bestätigungscode: Code 246810 — gültig für 10 Minuten", cte="quoted-printable")
+    match = extract(msg.as_bytes())
+    assert match.code == "246810"
+    assert match.recipients == ("ann.lee@mailsac.com",)
+    assert match.sender == "konto@hp.com"
+
+
+def test_batch_keeps_newest_code_per_recipient():
+    raws = [
+        raw_message("Your code is 100001", to="ann@mailsac.com", date="Wed, 01 Jan 2025 00:00:00 +0000"),
+        raw_message("Your code is 100002", to="ann@mailsac.com", date="Wed, 01 Jan 2025 00:05:00 +0000"),
+        raw_message("Order 999999 shipped, code 999999", to="ann@mailsac.com",
+                    sender="news@shop.example.com", subject="Order code", date="Wed, 01 Jan 2025 00:09:00 +0000"),
+        raw_message("Your code is 200001", to="bob@mailsac.com"),
+    ]
+    newest = extract_batch(raws)
+    assert {to: m.code for to, m in newest.items()} == {"ann@mailsac.com": "100002", "bob@mailsac.com": "200001"}
+    assert list(extract_batch(raws, recipient="BOB@mailsac.com")) == ["bob@mailsac.com"]
+
+
+def test_mbox_dump_round_trip(tmp_path):
+    path = tmp_path / "inbox.mbox"
+    body = "From the HP team:\nYour code is 135790"
+    path.write_bytes(b"From a Wed Jan  1 00:00:00 2025\n" + raw_message(body).replace(b"\nFrom ", b"\n>From ")
+                     + b"\nFrom b Wed Jan  1 00:00:00 2025\n" + raw_message("Your code is 975310", to="bob@x.com"))
+
+    raws = list(iter_mbox(path))
+    assert len(raws) == 2
+    assert "From the HP team" in message_text(raws[0])
+    assert [m.code for m in map(extract, raws)] == ["135790", "975310"]
+
+
+def test_benchmark_corpus_has_no_wrong_codes():
+    result = bench_otp_extract.run(messages=1000)
+    assert result["extract_wrong_codes"] == 0
+    assert result["naive_wrong_codes"] > 0
+    assert result["extract_msgs_per_s"] > result["naive_msgs_per_s"]
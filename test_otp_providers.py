@@ -0,0 +1,127 @@
+import threading
+
+import pytest
+
+from otp_providers import ImapProvider, MailsacApiProvider, SeleniumProvider, get_otp_provider
+
+
+def test_api_provider_returns_newest_otp(mailsac_stub):
+    mailsac_stub.add("ann.lee.abcdtest@mailsac.com", "m1", "Code 111111", "2025-01-01T00:00:00Z")
+    mailsac_stub.add("ann.lee.abcdtest@mailsac.com", "m2", "Your code is 222222", "2025-01-01T00:05:00Z")
+    provider = MailsacApiProvider("k", base_url=mailsac_stub.url)
+
+    assert provider.fetch_otp("ann.lee.abcdtest", max_wait=2, poll_interval=0.05) == "222222"
+    provider.close()
+
+
+def test_api_provider_stops_polling_on_arrival_and_reuses_connection(mailsac_stub):
+    mailsac_stub.add("bob.ray.wxyztest@mailsac.com", "m1", "Your code is 654321", visible_after=3)
+    provider = MailsacApiProvider("k", base_url=mailsac_stub.url, pool_size=2)
+
+    assert provider.fetch_otp("bob.ray.wxyztest", max_wait=5, poll_interval=0.05) == "654321"
+    assert mailsac_stub.listings == 4
+    assert provider.pool.created == 1
+    assert len(mailsac_stub.connections) == 1
+    provider.close()
+
+
+def test_api_provider_times_out_on_empty_inbox(mailsac_stub):
+    provider = MailsacApiProvider("k", base_url=mailsac_stub.url)
+    assert provider.fetch_otp("nobody", max_wait=0.3, poll_interval=0.05) is None
+    provider.close()
+
+
+def test_api_provider_surfaces_auth_errors(mailsac_stub):
+    provider = MailsacApiProvider("wrong", base_url=mailsac_stub.url)
+    with pytest.raises(RuntimeError, match="HTTP 401"):
+        provider.check_once("ann")
+    provider.close()
+
+
+@pytest.fixture
+def imap_server(imap_stub, otp_email):
+    return imap_stub([
+        otp_email("other@mailsac.com", "999999"),
+        otp_email("ann.lee.abcdtest@mailsac.com", "123456"),
+    ])
+
+
+def test_imap_provider_matches_recipient(imap_server):
+    port = imap_server.server_address[1]
+    provider = ImapProvider("127.0.0.1", "user", "secret", port=port, use_ssl=False)
+
+    assert provider.fetch_otp("ann.lee.abcdtest", max_wait=2, poll_interval=0.05) == "123456"
+    assert provider.fetch_otp("other", max_wait=2, poll_interval=0.05) == "999999"
+    assert imap_server.logins == 1  # second lookup reused the pooled session
+    provider.close()
+
+
+def test_imap_provider_waits_for_late_message(imap_server, otp_email):
+    port = imap_server.server_address[1]
+    provider = ImapProvider("127.0.0.1", "user", "secret", port=port, use_ssl=False)
+
+    threading.Timer(0.2, imap_server.messages.append,
+                    [otp_email("late.one.qqqqtest@mailsac.com", "777777")]).start()
+    assert provider.fetch_otp("late.one.qqqqtest", max_wait=3, poll_interval=0.05) == "777777"
+    provider.close()
+
+
+def test_factory_falls_back_to_selenium(monkeypatch):
+    monkeypatch.delenv("OTP_PROVIDER", raising=False)
+    monkeypatch.delenv("MAILSAC_API_KEY", raising=False)
+    assert get_otp_provider().name == "selenium"
+
+
+# -------------------------------------------------------------
+#  SELENIUM SCRAPER
+# -------------------------------------------------------------
+class FakeElement:
+    def __init__(self, driver, name, text=""):
+        self.driver = driver
+        self.name = name
+        self.text = text
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        self.driver.calls.append(("click", self.name))
+
+    def send_keys(self, keys):
+        self.driver.calls.append(("send_keys", self.name, keys))
+
+
+class FakeMailsacDriver:
+    """Only serves the Mailsac page elements once a Mailsac URL was opened."""
+
+    def __init__(self):
+        self.calls = []
+        self.url = "about:blank"
+
+    def get(self, url):
+        self.calls.append(("get", url))
+        self.url = url
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+        self.calls.append(("find", value))
+        if "mailsac.com" not in self.url:
+            raise NoSuchElementException(value)
+        if value == "#emailBody":
+            return FakeElement(self, "body", "Your verification code is 246810.")
+        return FakeElement(self, value)
+
+
+def test_selenium_scraper_opens_the_inbox_before_reading_the_body():
+    pytest.importorskip("selenium")
+    driver = FakeMailsacDriver()
+
+    otp = SeleniumProvider(log=lambda *a: None)._scrape(driver, "ann.lee", max_wait=1, poll_interval=0.05)
+
+    assert otp == "246810"
+    opened = driver.calls.index(("get", "https://mailsac.com"))
+    assert ("send_keys", "//input[@placeholder='mailbox']", "ann.lee") in driver.calls[opened:]
+    assert driver.calls.index(("find", "#emailBody")) > opened
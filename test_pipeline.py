@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from otp_providers import OtpProvider
+from pipeline import StageTimeline, start_otp_watch
+from step_log import add_listener, get_recorder, remove_listener
+from waits import wait_until
+
+
+
+def test_overlap_between_stages(fake_clock):
+    timeline = StageTimeline(clock=fake_clock)
+    timeline.add("otp_watch", 0.0, 9.0)
+    timeline.add("launch_hp_smart", 0.5, 4.0)
+    timeline.add("fill_account_form", 4.0, 10.0)
+
+    assert timeline.overlap("otp_watch", "launch_hp_smart") == pytest.approx(3.5)
+    assert timeline.overlap("otp_watch", "fill_account_form") == pytest.approx(5.0)
+    assert "otp_watch overlapped 8.50s" in timeline.summary()
+
+
+def test_stage_context_manager_records_on_error(fake_clock):
+    timeline = StageTimeline(clock=fake_clock)
+    with pytest.raises(RuntimeError):
+        with timeline.stage("launch_hp_smart"):
+            fake_clock.now = 2.0
+            raise RuntimeError("window not found")
+
+    assert timeline.spans() == [("launch_hp_smart", 0.0, 2.0)]
+
+
+def test_otp_watch_runs_while_form_is_filled():
+    timeline = StageTimeline()
+
+    def slow_fetch(mailbox, max_wait):
+        time.sleep(0.2)
+        return f"otp-for-{mailbox}"
+
+    future = start_otp_watch(slow_fetch, "ann.lee.abcdtest", timeline, max_wait=30)
+    with timeline.stage("fill_account_form"):
+        time.sleep(0.15)
+    with timeline.stage("await_otp"):
+        otp = future.result(timeout=2)
+
+    assert otp == "otp-for-ann.lee.abcdtest"
+    assert timeline.overlap("otp_watch", "fill_account_form") > 0.1
+    assert timeline.duration("await_otp") < 0.15
+
+
+def test_otp_watch_propagates_errors():
+    def broken(mailbox):
+        raise ConnectionError("mailsac unreachable")
+
+    timeline = StageTimeline()
+    future = start_otp_watch(broken, "x", timeline)
+    with pytest.raises(ConnectionError):
+        future.result(timeout=2)
+    assert len(timeline.spans("otp_watch")) == 1
+
+
+class EmptyInbox(OtpProvider):
+    name = "empty"
+
+    def __init__(self):
+        super().__init__(log=lambda *a: None)
+        self.polls = 0
+
+    def check_once(self, mailbox):
+        self.polls += 1
+        return None
+
+
+def test_cancelled_watch_stops_polling_without_logging_a_failure():
+    import test_otpfinal
+    run_id = get_recorder().start_run()
+    events = []
+    add_listener(events.append)
+    try:
+        inbox = EmptyInbox()
+        timeline = StageTimeline()
+        watch = start_otp_watch(test_otpfinal.fetch_otp_from_mailsac, "never.submitted", timeline,
+                                max_wait=30, poll_interval=0.05, provider=inbox)
+        assert wait_until(lambda: inbox.polls >= 2, timeout=2)
+        assert watch.cancel()
+        with pytest.raises(CancelledError):
+            watch.result(timeout=0)
+        # The poll ends promptly instead of running out its 30s budget
+        assert wait_until(lambda: timeline.spans("otp_watch"), timeout=2)
+        polls = inbox.polls
+        time.sleep(0.2)
+        assert inbox.polls == polls
+    finally:
+        remove_listener(events.append)
+
+    mine = [e for e in events if e["run"] == run_id]
+    assert not [e for e in mine if e["status"] == "FAIL"]
+    assert {(e["step"], e["status"]) for e in mine if e["kind"] == "step"} == {("fetch_otp_from_mailsac", "CANCELLED")}
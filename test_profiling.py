@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+
+import pytest
+
+import step_log
+from profiling import chrome_trace, prometheus_text, step_profiles, write_metrics, write_trace
+from step_log import StepRecorder, count_retry, iter_events, step, waiting
+from waits import wait_until
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    rec = StepRecorder(path=str(tmp_path / "steps.ndjson"), echo=False)
+    previous = step_log.set_recorder(rec)
+    yield rec
+    step_log.set_recorder(previous)
+
+
+def read(rec):
+    rec.flush_all()
+    return list(iter_events(rec.path))
+
+
+def test_waits_and_retries_are_charged_to_the_enclosing_steps(recorder):
+    ready = time.monotonic() + 0.05
+
+    with step("fill_account_form"):
+        with step("fill_account_form.type_email"):
+            wait_until(lambda: time.monotonic() >= ready, timeout=1, name="email_ready", interval=0.01)
+            count_retry()
+        time.sleep(0.03)  # acting
+        with waiting("page_load"):
+            time.sleep(0.02)
+
+    steps = {e["step"]: e for e in read(recorder) if e["kind"] == "step"}
+    inner, outer = steps["fill_account_form.type_email"], steps["fill_account_form"]
+    assert 0.04 <= inner["wait"] <= inner["duration"]
+    assert outer["wait"] >= inner["wait"] + 0.02
+    assert outer["duration"] - outer["wait"] >= 0.03
+    assert inner["retries"] == outer["retries"] == 1
+    waits = [e for e in read(recorder) if e["kind"] == "wait"]
+    assert [(w["step"], w["parent"], w["status"]) for w in waits] == [
+        ("email_ready", "fill_account_form.type_email", "PASS"), ("page_load", "fill_account_form", "PASS")]
+
+
+def test_background_thread_waits_stay_out_of_the_parent_step(recorder):
+    import contextvars
+
+    with step("main"):
+        ctx = contextvars.copy_context()
+
+        def background():
+            with step("otp_watch"):
+                with waiting("inbox_poll"):
+                    time.sleep(0.03)
+
+        t = threading.Thread(target=ctx.run, args=(background,))
+        t.start()
+        t.join()
+
+    steps = {e["step"]: e for e in read(recorder) if e["kind"] == "step"}
+    assert steps["main"]["wait"] == 0
+    assert steps["otp_watch"]["wait"] >= 0.03
+
+
+def fake_events():
+    return [
+        {"kind": "log", "t": 10.0, "run": "r1", "worker": "w1", "step": "launch", "desc": "Sent keys", "status": "PASS"},
+        {"kind": "wait", "t": 10.1, "duration": 0.5, "run": "r1", "worker": "w1", "step": "window_open",
+         "status": "PASS", "parent": "launch"},
+        {"kind": "step", "t": 10.0, "duration": 2.0, "wait": 0.5, "retries": 0, "run": "r1",
+         "worker": "w1", "step": "launch", "status": "PASS"},
+        {"kind": "step", "t": 12.0, "duration": 0.2, "wait": 0.0, "retries": 2, "run": "r1",
+         "worker": "w2", "step": 'click "Scan"', "status": "FAIL"},
+        {"kind": "step", "t": 20.0, "duration": 3.0, "wait": 2.5, "retries": 1, "run": "r2",
+         "worker": "w1", "step": "launch", "status": "PASS"},
+    ]
+
+
+def test_chrome_trace_has_tracks_slices_and_instants():
+    trace = chrome_trace(fake_events())
+    events = trace["traceEvents"]
+    names = {(e["name"], e["args"]["name"]) for e in events if e["ph"] == "M"}
+    assert ("process_name", "run r1") in names and ("process_name", "run r2") in names
+    assert ("thread_name", "w2") in names
+
+    slices = [e for e in events if e["ph"] == "X"]
+    launch = next(e for e in slices if e["name"] == "launch")
+    assert (launch["ts"], launch["dur"]) == (10_000_000.0, 2_000_000.0)
+    assert launch["args"] == {"status": "PASS", "wait_s": 0.5, "action_s": 1.5, "retries": 0}
+    assert next(e for e in slices if e["name"] == "window_open")["cat"] == "wait"
+    assert [e["name"] for e in events if e["ph"] == "i"] == ["Sent keys"]
+    json.dumps(trace)
+
+
+def test_prometheus_text_exposition():
+    text = prometheus_text(fake_events())
+    lines = text.splitlines()
+    assert "# TYPE hp_automation_step_duration_seconds histogram" in lines
+    assert 'hp_automation_step_duration_seconds_bucket{step="launch",le="2.5"} 1' in lines
+    assert 'hp_automation_step_duration_seconds_bucket{step="launch",le="+Inf"} 2' in lines
+    assert 'hp_automation_step_duration_seconds_count{step="launch"} 2' in lines
+    assert 'hp_automation_step_wait_seconds_total{step="launch"} 3.000000' in lines
+    assert 'hp_automation_step_action_seconds_total{step="launch"} 2.000000' in lines
+    assert 'hp_automation_step_retries_total{step="click \\"Scan\\""} 2' in lines
+    assert 'hp_automation_step_runs_total{step="click \\"Scan\\"",status="FAIL"} 1' in lines
+    assert 'hp_automation_wait_seconds_total{wait="window_open"} 0.500000' in lines
+
+    steps, _ = step_profiles(fake_events())
+    assert steps["launch"].as_dict() == {"calls": 2, "failed": 0, "wall": 5.0, "wait": 3.0,
+                                         "action": 2.0, "retries": 1}
+
+
+def test_signup_script_writes_trace_and_metrics(sim, tmp_path):
+    import test_otpfinal
+    sim(latencies={"page_load": 0.02})
+
+    test_otpfinal.main()
+
+    run_id = step_log.get_recorder().current_run_id()
+    trace = json.loads((tmp_path / "reports" / f"run_{run_id}.trace.json").read_text())
+    slices = {e["name"] for e in trace["traceEvents"] if e["ph"] == "X"}
+    assert {"launch_hp_smart", "fill_account_form", "fetch_otp_from_mailsac",
+            "complete_web_verification_in_app"} <= slices
+    metrics = (tmp_path / "reports" / "metrics.prom").read_text()
+    assert 'hp_automation_step_wait_seconds_total{step="fill_account_form"}' in metrics
+
+
+def test_write_helpers_filter_by_run(recorder, tmp_path):
+    recorder.start_run("a")
+    with step("one"):
+        pass
+    recorder.start_run("b")
+    with step("two"):
+        pass
+    recorder.flush_all()
+
+    write_trace(recorder.path, str(tmp_path / "out" / "a.json"), run_id="a")
+    write_metrics(recorder.path, str(tmp_path / "out" / "all.prom"))
+    names = {e["name"] for e in json.loads((tmp_path / "out" / "a.json").read_text())["traceEvents"]}
+    assert "one" in names and "two" not in names
+    assert 'step="two"' in (tmp_path / "out" / "all.prom").read_text()
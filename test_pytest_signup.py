@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+
+from pytest_signup import merge_worker_logs, worker_log_path
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_pytest(tmp_path, *args, **env):
+    """Run the script tests in a child pytest against the sim, from `tmp_path`."""
+    child_env = dict(os.environ, HP_SMART_BACKEND="sim", STEP_LOG_PATH=str(tmp_path / "steps.ndjson"),
+                     ARTIFACTS="0", TIMEOUT_POLICY="off", **env)
+    child_env.pop("OTP_PROVIDER", None)
+    child_env.pop("MAILSAC_API_KEY", None)
+    return subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", *args],
+                          cwd=tmp_path, env=child_env, capture_output=True, text=True, timeout=120)
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_stage_fixtures_run_once_per_identity(tmp_path):
+    out = run_pytest(tmp_path, os.path.join(HERE, "test_otpfinal.py"), "--identities", "3", "-rA")
+
+    assert out.returncode == 0, out.stdout + out.stderr
+    assert "3 passed" in out.stdout and "test_hp_account_automation[id2]" in out.stdout
+    events = read_events(tmp_path / "steps.ndjson")
+    assert len({e["run"] for e in events if e["step"] == "complete_web_verification_in_app"}) == 3
+    assert (tmp_path / "reports" / "automation_report.html").exists()
+
+
+def test_fail_steps_fail_the_test(tmp_path):
+    out = run_pytest(tmp_path, os.path.join(HERE, "new_test.py"), HP_SMART_SIM_FAILURES="click=1")
+
+    assert out.returncode == 1
+    assert "1 failed" in out.stdout and "Steps logged FAIL:" in out.stdout
+
+
+def test_xdist_worker_logs_are_merged(tmp_path):
+    out = run_pytest(tmp_path, os.path.join(HERE, "test_otpfinal.py"), "--identities", "2",
+                     PYTEST_XDIST_WORKER="gw1")
+    worker_log = worker_log_path(str(tmp_path / "steps.ndjson"), "gw1")
+    assert out.returncode == 0, out.stdout + out.stderr
+    assert os.path.exists(worker_log) and not (tmp_path / "steps.ndjson").exists()
+
+    (tmp_path / "steps.ndjson").write_text(json.dumps({"kind": "log", "run": "main"}) + "\n")
+    assert merge_worker_logs(str(tmp_path / "steps.ndjson")) == [worker_log]
+    events = read_events(tmp_path / "steps.ndjson")
+    assert events[0]["run"] == "main" and len({e["run"] for e in events}) == 3
+    assert not os.path.exists(worker_log)
+
+
+def test_fail_steps_of_other_runs_do_not_fail_the_test(tmp_path):
+    (tmp_path / "test_runs.py").write_text(
+        "import threading\n"
+        "from step_log import get_recorder, log_step\n"
+        "\n"
+        "def other_run():\n"
+        "    get_recorder().start_run()\n"
+        "    log_step('leaked watch failed', 'FAIL')\n"
+        "\n"
+        "def test_other_run_is_ignored(signup_flow):\n"
+        "    thread = threading.Thread(target=other_run)\n"
+        "    thread.start()\n"
+        "    thread.join()\n"
+        "\n"
+        "def test_own_run_fails(signup_flow):\n"
+        "    log_step('own step failed', 'FAIL')\n")
+    out = run_pytest(tmp_path, "test_runs.py", "-p", "pytest_signup", "-rA", PYTHONPATH=HERE)
+
+    assert "1 failed, 1 passed" in out.stdout, out.stdout + out.stderr
+    assert "PASSED test_runs.py::test_other_run_is_ignored" in out.stdout
+    assert "FAILED test_runs.py::test_own_run_fails" in out.stdout
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+import app_session
+import identity
+import resilience
+import ui_backend
+from locator import LOCATOR
+from record_replay import CassetteMiss, RecordingBackend, ReplayBackend, Replayer, load
+from text_input import TEXT_ENTRY
+
+
+SLOW = {"launch": 0.05, "window_open": 0.05, "page_load": 0.02, "mail_delivery": 0.3}
+
+
+@pytest.fixture
+def fresh_identities():
+    previous = identity.set_identity_source(None)
+    yield
+    identity.set_identity_source(previous)
+
+
+def fresh_process():
+    """Forget what the previous run learned, as a new process would."""
+    identity.set_identity_source(None)
+    LOCATOR.invalidate()
+    TEXT_ENTRY.forget()
+    resilience.reset_breakers()
+    app_session.set_session(None)
+
+
+def record(sim, failures, monkeypatch, tmp_path, **config):
+    import test_otpfinal
+    app = sim(**config)
+    fresh_process()
+    backend = RecordingBackend(ui_backend.get_backend())
+    ui_backend.set_backend(backend)
+    monkeypatch.setenv("HP_SMART_RECORD", str(tmp_path / "cassette.json"))
+    started = time.perf_counter()
+    test_otpfinal.main()
+    elapsed = time.perf_counter() - started
+    monkeypatch.delenv("HP_SMART_RECORD")
+    assert failures() == [] and app.stats["accounts_created"] == 1
+    return load(backend.recorder.save(str(tmp_path / "cassette.json"))), elapsed
+
+
+def replay(monkeypatch, cassette, speed=0):
+    import test_otpfinal
+    fresh_process()
+    backend = ReplayBackend(cassette, speed=speed)
+    ui_backend.set_backend(backend)
+    monkeypatch.setenv("HP_SMART_BACKEND", "replay")
+    started = time.perf_counter()
+    test_otpfinal.main()
+    return backend, time.perf_counter() - started
+
+
+def test_recorded_run_replays_without_the_app(sim, monkeypatch, tmp_path, fresh_identities, failures):
+    cassette, _ = record(sim, failures, monkeypatch, tmp_path)
+    assert {e["key"].split(".")[0] for e in cassette["events"]} >= {"desktop", "keyboard", "mail"}
+    mailbox = cassette["identities"][0]["mailbox"]
+
+    backend, _ = replay(monkeypatch, cassette)
+    assert failures() == []
+    assert backend.replayer.stats["misses"] == 0
+    assert identity.get_identity_source().records == []
+    assert any(e["key"] == f'mail.fetch_otp[["{mailbox}"], {{}}]' for e in cassette["events"])
+
+
+def test_replay_compresses_recorded_latency(sim, monkeypatch, tmp_path, fresh_identities, failures):
+    cassette, recorded = record(sim, failures, monkeypatch, tmp_path, latencies=SLOW)
+    assert cassette["duration"] >= 0.3
+
+    _, instant = replay(monkeypatch, cassette, speed=0)
+    _, fast = replay(monkeypatch, cassette, speed=4)
+    assert failures() == []
+    assert instant < recorded / 5
+    assert cassette["duration"] / 4 * 0.8 <= fast < cassette["duration"] / 2
+
+
+def test_queries_see_the_state_as_of_the_next_action():
+    def event(seq, key, kind, t, **outcome):
+        return dict(outcome, seq=seq, key=key, kind=kind, t=t, dt=0.01)
+
+    replayer = Replayer({"identities": [], "events": [
+        event(0, "w.exists[[], {}]", "query", 0.0, value=False),
+        event(1, "w.exists[[], {}]", "query", 0.5, value=True),
+        event(2, "w.click_input[[], {}]", "action", 1.0, value=None),
+        event(3, "w.exists[[], {}]", "query", 1.5, value=False),
+    ]})
+
+    assert replayer.call("w", "exists") is True  # never past the pending click
+    replayer.call("w", "click_input")
+    assert replayer.call("w", "exists") is False
+    with pytest.raises(CassetteMiss):
+        replayer.call("w", "click_input")
+    with pytest.raises(CassetteMiss):
+        replayer.call("w", "type_keys", ("changed flow",))
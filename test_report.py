@@ -0,0 +1,105 @@
+import json
+import tracemalloc
+
+import pytest
+
+import report
+from report import LatencyHistogram, aggregate, write_report
+
+
+def write_log(path, runs, steps_per_run, fail_run=None):
+    with open(path, "w") as fh:
+        for r in range(runs):
+            t = r * 100.0
+            for i in range(steps_per_run):
+                duration = 0.1 * (i % 10 + 1) + (5.0 if r == 3 else 0.0)
+                status = "FAIL" if (r == fail_run and i == 0) else "PASS"
+                fh.write(json.dumps({"kind": "log", "t": t, "dt": 0.01, "run": f"run-{r}",
+                                     "worker": "w0", "step": f"step_{i % 10}",
+                                     "desc": f"<b>step {i}</b> & more", "status": status}) + "\n")
+                fh.write(json.dumps({"kind": "step", "t": t, "duration": duration, "run": f"run-{r}",
+                                     "worker": "w0", "step": f"step_{i % 10}", "status": status}) + "\n")
+                t += duration
+
+
+def test_histogram_quantiles_are_close():
+    hist = LatencyHistogram()
+    for i in range(1, 1001):
+        hist.add(i / 100.0)
+    assert hist.quantile(0.5) == pytest.approx(5.0, rel=0.05)
+    assert hist.quantile(0.99) == pytest.approx(9.9, rel=0.05)
+    assert hist.quantile(1.0) == pytest.approx(10.0, rel=0.05)
+
+
+def test_aggregate_steps_and_runs(tmp_path):
+    log = tmp_path / "steps.ndjson"
+    write_log(log, runs=5, steps_per_run=20, fail_run=2)
+
+    steps, runs = aggregate(str(log))
+    assert set(steps) == {f"step_{i}" for i in range(10)}
+    assert steps["step_0"].failed == 1 and steps["step_0"].passed == 9
+    assert runs["run-2"].failed == 1  # the log line, not the step event it failed
+    slowest = max(runs, key=lambda r: runs[r].end - runs[r].start)
+    assert slowest == "run-3"
+
+
+def test_report_reads_the_log_once(tmp_path, monkeypatch):
+    log = tmp_path / "steps.ndjson"
+    write_log(log, runs=3, steps_per_run=4)
+    reads = []
+    iter_events = report.iter_events
+
+    def counting(*args, **kwargs):
+        reads.append(args)
+        return iter_events(*args, **kwargs)
+
+    monkeypatch.setattr(report, "iter_events", counting)
+    html = open(write_report(str(log), str(tmp_path / "report.html"))).read()
+    assert len(reads) == 1
+    assert html.index("<h3>Steps</h3>") < html.index("step 3")
+
+
+def test_report_escapes_and_keeps_all_runs(tmp_path):
+    log = tmp_path / "steps.ndjson"
+    write_log(log, runs=3, steps_per_run=2)
+    out = write_report(str(log), str(tmp_path / "out" / "report.html"))
+
+    html = open(out).read()
+    assert "&lt;b&gt;step 0&lt;/b&gt; &amp; more" in html
+    assert "<b>step" not in html
+    for r in range(3):
+        assert f"run-{r}" in html
+
+    single = open(write_report(str(log), str(tmp_path / "one.html"), run_id="run-1")).read()
+    assert "run-1" in single and "run-2" not in single
+
+
+def test_report_memory_is_constant(tmp_path):
+    small, large = tmp_path / "small.ndjson", tmp_path / "large.ndjson"
+    # tracemalloc makes parsing slow, so compare 2k against 20k steps; the
+    # peak must not grow with the number of events
+    write_log(small, runs=10, steps_per_run=200)
+    write_log(large, runs=10, steps_per_run=2000)
+
+    peaks = []
+    for log in (small, large):
+        tracemalloc.start()
+        write_report(str(log), str(tmp_path / "report.html"))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    assert peaks[1] < 1024 * 1024
+    assert peaks[1] < peaks[0] * 1.5
+
+
+def test_a_failure_in_nested_steps_counts_once(tmp_path):
+    log = tmp_path / "steps.ndjson"
+    with open(log, "w") as fh:
+        fh.write(json.dumps({"kind": "log", "t": 0.5, "run": "r", "step": "inner",
+                             "desc": "Step 'inner' failed", "status": "FAIL"}) + "\n")
+        for name in ("inner", "signup_form", "fill_account_form"):
+            fh.write(json.dumps({"kind": "step", "t": 0.0, "duration": 1.0, "run": "r",
+                                 "step": name, "status": "FAIL"}) + "\n")
+
+    _, runs = aggregate(str(log))
+    assert runs["r"].failed == 1 and runs["r"].steps == 3
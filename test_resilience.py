@@ -0,0 +1,140 @@
+import random
+import time
+
+import pytest
+
+import resilience
+from batch_runner import DesktopSignupStages, run_batch
+from otp_providers import OtpProvider
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, RetryPolicy
+
+
+def test_retries_back_off_with_jitter_within_the_budget():
+    slept = []
+    policy = RetryPolicy(attempts=4, base=1, cap=3, budget_ratio=0, min_retries=4,
+                         rng=random.Random(1), sleep=slept.append)
+    results = iter([None, False, "ok"])
+    assert policy.run(lambda: next(results), name="flaky") == "ok"
+    assert len(slept) == 2 and 0 <= slept[0] <= 1 and 0 <= slept[1] <= 2
+
+    def broken():
+        raise OSError("down")
+
+    with pytest.raises(OSError):
+        policy.run(broken)
+    assert len(slept) == 4  # two more retries, then the budget of 4 is spent
+    assert policy.run(lambda: None) is None and len(slept) == 4
+
+    done = RetryPolicy(attempts=3, sleep=slept.append)
+    assert done.run(lambda: False, already_done=lambda: "submitted") == "submitted"
+    assert done.retries == 1
+
+
+def test_breaker_opens_on_error_rate_and_recovers_through_one_trial(fake_clock):
+    breaker = CircuitBreaker("mailsac", window=10, failure_rate=0.5, min_calls=4, cooldown=30,
+                             clock=fake_clock.monotonic)
+    for ok in (True, False, True, False):
+        breaker.before()
+        breaker.record(ok)
+    assert breaker.state == OPEN and breaker.stats["opened"] == 1
+    with pytest.raises(CircuitOpen):
+        breaker.before()
+
+    fake_clock.now = 31
+    assert breaker.state == HALF_OPEN
+    trial = breaker.allow()
+    assert trial and not breaker.allow()  # one trial at a time
+    breaker.record(False, trial)
+    assert breaker.state == OPEN and breaker.stats["opened"] == 2
+
+    fake_clock.now = 62
+    with breaker.guard():
+        pass
+    assert breaker.state == CLOSED and len(breaker.outcomes) == 0
+
+    paused = CircuitBreaker("hp_smart", min_calls=1, cooldown=5, on_open="pause",
+                            clock=fake_clock.monotonic, sleep=fake_clock.sleep)
+    paused.record(False)
+    paused.before()  # sleeps out the cooldown instead of raising
+    assert fake_clock.now == pytest.approx(67)
+
+
+def test_trial_ended_by_another_breaker_is_given_back(fake_clock):
+    breaker = CircuitBreaker("hp_smart", min_calls=1, cooldown=5, clock=fake_clock.monotonic)
+    breaker.record(False)
+    fake_clock.now = 6
+
+    def inner_open():
+        raise CircuitOpen("circuit mailsac is open")
+
+    with pytest.raises(CircuitOpen):
+        RetryPolicy(attempts=1).run(inner_open, breaker=breaker)
+    with pytest.raises(CircuitOpen):
+        with breaker.guard():
+            inner_open()
+    assert breaker.state == HALF_OPEN and breaker.allow()
+
+
+def test_only_the_trial_decides_a_half_open_breaker(fake_clock):
+    breaker = CircuitBreaker("mailsac", min_calls=1, cooldown=5, clock=fake_clock.monotonic)
+    slow = breaker.before()  # started while the breaker was still closed
+    breaker.record(False)
+    fake_clock.now = 6
+    trial = breaker.allow()
+
+    breaker.record(True, slow)
+    breaker.cancel(slow)
+    breaker.cancel()
+    assert breaker.state == HALF_OPEN and not breaker.allow()
+    breaker.record(True, trial)
+    assert breaker.state == CLOSED
+
+
+def test_otp_retries_share_one_wait_budget(monkeypatch):
+    import test_otpfinal
+    resilience.reset_breakers()
+    monkeypatch.setattr(RetryPolicy, "delay", lambda self, attempt: 0.1)
+    budgets = []
+
+    class FlakyInbox(OtpProvider):
+        name = "flaky"
+
+        def fetch_otp(self, mailbox, max_wait=30, poll_interval=3):
+            budgets.append(max_wait)
+            if len(budgets) == 1:
+                time.sleep(0.2)
+                raise ConnectionError("mailsac dropped the connection")
+            return "123456"
+
+    assert test_otpfinal.fetch_otp_from_mailsac("ann.lee", max_wait=30, provider=FlakyInbox()) == "123456"
+    assert budgets[0] == pytest.approx(30, abs=0.05) and budgets[1] <= 30 - 0.3
+
+
+def test_mailsac_outage_fails_the_batch_fast(sim, monkeypatch, tmp_path, failures):
+    monkeypatch.setenv("CIRCUIT_MIN_CALLS", "3")
+    app = sim(failure_rates={"mail_api": 1.0})
+
+    summary = run_batch(3, concurrency=1, output=str(tmp_path / "results.jsonl"),
+                        stages=DesktopSignupStages(max_wait=20, poll_interval=0.01))
+
+    assert (summary["passed"], summary["failed"]) == (0, 3)
+    assert summary["elapsed"] < 10
+    breaker = resilience.get_breaker("mailsac")
+    assert breaker.state == OPEN and breaker.stats["rejected"] >= 3
+    assert app.stats["failed_mail_api"] == 3
+    assert sum("circuit mailsac is open" in f for f in failures()) == 3
+
+
+def test_a_late_submit_is_not_repeated(sim, monkeypatch, failures):
+    import test_otpfinal
+    app = sim()
+    submits = []
+    real_submit, real_fill = app._submit_signup, test_otpfinal.fill_account_form
+    monkeypatch.setattr(app, "_submit_signup", lambda ctrl: submits.append(ctrl) or real_submit(ctrl))
+    # The form went through, but the attempt reports a failure (e.g. its wait timed out)
+    monkeypatch.setattr(test_otpfinal, "fill_account_form", lambda *a: real_fill(*a) and False)
+
+    test_otpfinal.main()
+
+    assert failures() == []
+    assert len(submits) == 1 and app.stats["accounts_created"] == 1
@@ -0,0 +1,108 @@
+from dataclasses import replace
+
+import app_session
+import ui_backend
+from batch_runner import DesktopSignupStages, run_batch
+from flows import FLOWS, run_flow
+from sim_ui import SimApp, SimConfig, SimDesktop
+
+
+# -------------------------------------------------------------
+#  SCRIPTS END TO END
+# -------------------------------------------------------------
+def test_signup_script_runs_against_the_sim(sim, failures):
+    import test_otpfinal
+    app = sim()
+
+    test_otpfinal.main()
+
+    assert failures() == []
+    assert app.stats["accounts_created"] == 1
+    assert list(app.accounts.values()) == [test_otpfinal.DEFAULT_PASSWORD]
+    assert [w.title for w in app.windows] == ["HP Smart"]
+
+
+def test_sign_in_scan_script_runs_against_the_sim(sim, failures):
+    import new_test
+    app = sim()
+
+    new_test.main()
+
+    assert failures() == []
+    assert app.signed_in == "billu123@mailsac.com"
+    assert app.main_window().get(title="Scan") is not None
+    assert app.main_window().get(title="Return Home") is None
+
+
+def test_flows_wait_through_simulated_latency(sim, failures):
+    import test_otpfinal
+    app = sim(latencies={"window_open": 0.05, "page_load": 0.05, "mail_delivery": 0.1})
+
+    test_otpfinal.main()
+
+    assert failures() == []
+    assert app.stats["accounts_created"] == 1
+
+
+def test_step_fails_when_its_post_condition_never_holds(sim, failures):
+    app = sim()
+    desktop = app_session.get_session().start()
+    assert run_flow(FLOWS["open_create_account"], desktop)
+    form = FLOWS["signup_form"]
+    submit = form.steps[-1]
+    quick = replace(form, steps=form.steps[:-1] + (
+        replace(submit, wait_after=replace(submit.wait_after, timeout=0.2)),))
+
+    # An empty password keeps the form up, so the OTP screen never shows
+    assert not run_flow(quick, desktop, {"first_name": "Ann", "last_name": "Lee",
+                                         "email": "ann.lee@mailsac.com", "password": ""})
+    assert any("submit_signup" in f and "Timed out" in f for f in failures())
+    assert app.stats.get("accounts_created", 0) == 0
+
+
+def test_injected_failures_are_logged_not_raised(sim, failures):
+    app = sim(failure_rates={"click": 1.0})
+    ui_backend.keyboard.send_keys("{VK_LWIN}HP Smart{ENTER}")
+
+    assert not run_flow(FLOWS["open_create_account"], ui_backend.Desktop())
+    assert failures() and app.stats["failed_click"] >= 1
+
+
+def test_batch_runner_on_the_sim(sim, tmp_path):
+    app = sim()
+
+    summary = run_batch(40, concurrency=8, output=str(tmp_path / "out.jsonl"),
+                        stages=DesktopSignupStages(max_wait=5, poll_interval=0.01))
+
+    assert summary["passed"] == 40
+    assert app.stats["accounts_created"] == 40
+
+
+# -------------------------------------------------------------
+#  SIM DETAILS
+# -------------------------------------------------------------
+def test_keys_clipboard_and_found_index():
+    app = SimApp()
+    desktop = SimDesktop(app)
+    app.send_keys("{VK_LWIN}HP Smart{ENTER}")
+    desktop.window(title_re=".*HP Smart.*").child_window(auto_id="HpcSignedOutIcon").click_input()
+    desktop.window(title_re=".*HP Smart.*").child_window(auto_id="HpcSignOutFlyout_SignInBtn").click_input()
+
+    account = desktop.window(title_re=".*HP account.*")
+    username = account.child_window(control_type="Edit", found_index=0)
+    app.send_keys("old@x.com^a{BACKSPACE}new@y.com{BACKSPACE}m")
+    assert username.window_text() == "new@y.com"
+    app.clipboard = "+pasted"
+    username.type_keys("^v")
+    assert username.get_value() == "new@y.com+pasted"
+    assert not account.child_window(control_type="Edit", found_index=1).exists(timeout=0)
+
+
+def test_pending_transitions_become_visible_after_their_latency():
+    app = SimApp(SimConfig(latencies={"launch": 0.05}))
+    spec = SimDesktop(app).window(title_re=".*HP Smart.*")
+    app.send_keys("{VK_LWIN}HP Smart{ENTER}")
+
+    assert not spec.exists(timeout=0)
+    spec.wait("exists visible", timeout=2)
+    assert spec.child_window(title="Scan", control_type="Button").exists(timeout=0)
@@ -0,0 +1,147 @@
+import contextvars
+import json
+import threading
+
+import pytest
+
+import step_log
+from step_log import StepRecorder, iter_events, step
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    rec = StepRecorder(path=str(tmp_path / "steps.ndjson"), batch_size=4, echo=False)
+    previous = step_log.set_recorder(rec)
+    yield rec
+    step_log.set_recorder(previous)
+
+
+def read(rec):
+    rec.flush_all()
+    return list(iter_events(rec.path))
+
+
+def test_log_step_keeps_signature_and_adds_context(recorder):
+    run_id = recorder.start_run(worker_id="w1")
+    step_log.log_step("Sent keys to launch HP Smart app.")
+    step_log.log_step("No browser alert present, continuing normally", "INFO")
+
+    events = read(recorder)
+    assert [(e["desc"], e["status"]) for e in events] == [
+        ("Sent keys to launch HP Smart app.", "PASS"),
+        ("No browser alert present, continuing normally", "INFO"),
+    ]
+    assert {e["run"] for e in events} == {run_id}
+    assert {e["worker"] for e in events} == {"w1"}
+    assert events[1]["t"] >= events[0]["t"] and events[1]["dt"] >= 0
+
+
+def test_step_decorator_records_duration_and_status(recorder):
+    @step("fill_account_form")
+    def fill(ok):
+        step_log.log_step("Focused HP Account browser window.")
+        if not ok:
+            step_log.log_step("Error filling account form: boom", "FAIL")
+
+    fill(True)
+    fill(False)
+
+    steps = [e for e in read(recorder) if e["kind"] == "step"]
+    assert [(e["step"], e["status"]) for e in steps] == [
+        ("fill_account_form", "PASS"), ("fill_account_form", "FAIL"),
+    ]
+    assert all(e["duration"] >= 0 for e in steps)
+    logs = [e for e in read(recorder) if e["kind"] == "log"]
+    assert {e["step"] for e in logs} == {"fill_account_form"}
+
+
+def test_step_fails_on_exception(recorder):
+    with pytest.raises(ValueError):
+        with step("launch_hp_smart"):
+            raise ValueError("no window")
+    assert read(recorder)[-1]["status"] == "FAIL"
+
+
+def test_buffers_flush_in_batches(recorder):
+    for i in range(3):
+        step_log.log_step(f"step {i}")
+    assert list(iter_events(recorder.path)) == []
+    step_log.log_step("step 3")
+    assert len(list(iter_events(recorder.path))) == 4
+
+
+def test_flush_all_while_the_owner_logs_writes_each_event_once(recorder):
+    done = threading.Event()
+
+    def log():
+        for i in range(5000):
+            step_log.log_step(f"event {i}")
+        done.set()
+
+    owner = threading.Thread(target=log)
+    owner.start()
+    while not done.is_set():
+        recorder.flush_all()
+    owner.join()
+
+    assert [e["desc"] for e in read(recorder)] == [f"event {i}" for i in range(5000)]
+
+
+def test_parallel_runs_are_kept_apart(recorder):
+    def flow(n):
+        run_id = recorder.start_run(run_id=f"run-{n}", worker_id=f"worker-{n}")
+        with step("launch_hp_smart"):
+            for i in range(25):
+                step_log.log_step(f"{run_id} event {i}")
+
+    threads = [threading.Thread(target=flow, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    events = read(recorder)
+    assert len(events) == 8 * 26
+    for n in range(8):
+        mine = list(iter_events(recorder.path, run_id=f"run-{n}"))
+        assert len(mine) == 26
+        assert all(e["worker"] == f"worker-{n}" for e in mine)
+        assert all(e["desc"].startswith(f"run-{n} ") for e in mine if e["kind"] == "log")
+    # Finished threads are dropped from the buffer registry
+    assert len(recorder._buffers) <= 1
+
+
+def test_a_failure_in_a_background_thread_does_not_fail_the_parent_step(recorder):
+    with step("submit_form"):
+        ctx = contextvars.copy_context()
+        worker = threading.Thread(target=ctx.run, args=(step_log.log_step, "watch failed", "FAIL"))
+        worker.start()
+        worker.join()
+
+    [done] = [e for e in read(recorder) if e["kind"] == "step"]
+    assert done["status"] == "PASS"
+
+
+def test_listeners_can_unsubscribe_while_an_event_is_delivered(recorder):
+    seen = []
+
+    def once(event):
+        step_log.remove_listener(once)
+
+    step_log.add_listener(once)
+    step_log.add_listener(seen.append)
+    try:
+        step_log.log_step("first")
+        step_log.log_step("second")
+    finally:
+        step_log.remove_listener(seen.append)
+    assert [e["desc"] for e in seen] == ["first", "second"]
+
+
+def test_ndjson_is_one_object_per_line(recorder):
+    step_log.log_step('quote " and newline \n inside')
+    recorder.flush_all()
+    with open(recorder.path) as fh:
+        lines = fh.read().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["desc"].startswith("quote")
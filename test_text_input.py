@@ -0,0 +1,142 @@
+import re
+
+import pytest
+
+import text_input
+from step_log import get_recorder
+from text_input import TextEntry, TextInputError, escape_keys, input_summary
+
+
+class Clipboard:
+    def __init__(self):
+        self.text = ""
+
+    def copy(self, text):
+        self.text = text
+
+    def paste(self):
+        return self.text
+
+
+class Edit:
+    """Edit control double that applies type_keys the way a real field would (roughly)."""
+
+    def __init__(self, clipboard, value="", value_pattern=True, readable=True, drop=0):
+        self.clipboard = clipboard
+        self.value = value
+        self.readable = readable
+        self.drop = drop  # characters lost per keystroke batch
+        self.calls = []
+        if not value_pattern:
+            self.set_edit_text = None
+
+    def set_edit_text(self, text):
+        self.calls.append(("value", text))
+        self.value = text
+
+    def click_input(self):
+        self.calls.append(("click",))
+
+    def type_keys(self, keys, with_spaces=False):
+        self.calls.append(("keys", keys))
+        if keys == "^a^v":
+            self.value = self.clipboard.text
+        elif keys == "^a{BACKSPACE}":
+            self.value = ""
+        else:
+            text = re.sub(r"\{(.)\}", r"\1", keys)
+            self.value += text[:len(text) - self.drop]
+
+    def get_value(self):
+        if not self.readable:
+            raise RuntimeError("value is protected")
+        return self.value
+
+
+@pytest.fixture(autouse=True)
+def fresh_log():
+    text_input.reset_input_log()
+    text_input.TEXT_ENTRY.forget()
+    yield
+    text_input.reset_input_log()
+
+
+def test_value_pattern_sets_text_in_one_call():
+    clipboard = Clipboard()
+    ctrl = Edit(clipboard, value="old")
+    record = TextEntry(clipboard=clipboard).enter(ctrl, "ava.lee@mailsac.com", name="email")
+    assert ctrl.calls == [("value", "ava.lee@mailsac.com")]
+    assert (record.strategy, record.verified, record.failed) == ("value", True, ())
+
+
+def test_falls_back_to_paste_then_escaped_keys():
+    clipboard = Clipboard()
+    entry = TextEntry(clipboard=clipboard)
+
+    no_pattern = Edit(clipboard, value_pattern=False)
+    record = entry.enter(no_pattern, "Secure+Pass(1)", name="password")
+    assert record.strategy == "paste" and no_pattern.value == "Secure+Pass(1)"
+    assert no_pattern.calls == [("click",), ("keys", "^a^v")]
+
+    keys_only = Edit(clipboard, value_pattern=False)
+    record = entry.enter(keys_only, "a+b{c}", strategies=("keys",))
+    assert keys_only.calls == [("keys", "a{+}b{{}c{}}")]
+    assert record.strategy == "keys" and keys_only.value == "a+b{c}"
+    assert escape_keys("^%~[x]") == "{^}{%}{~}{[}x{]}"
+
+
+def test_mismatch_falls_through_and_the_winner_is_remembered():
+    clipboard = Clipboard()
+    entry = TextEntry(strategies=("keys", "paste"), clipboard=clipboard)
+    ctrl = Edit(clipboard, value_pattern=False, drop=1)
+
+    first = entry.enter(ctrl, "Ava", name="first_name", key="account|firstName")
+    assert first.strategy == "paste" and first.failed == ("keys: read back 2 of 3 characters",)
+
+    ctrl.calls.clear()
+    second = entry.enter(ctrl, "Lee", name="first_name", key="account|firstName")
+    assert second.strategy == "paste" and second.failed == ()
+    assert ctrl.calls[0] == ("click",)
+
+
+def test_unreadable_fields_count_as_unverified():
+    clipboard = Clipboard()
+    record = TextEntry(clipboard=clipboard).enter(Edit(clipboard, readable=False), "pw", name="password")
+    assert (record.strategy, record.verified) == ("value", None)
+    assert input_summary().endswith("fallbacks 0 | unverified 1")
+
+
+def test_raises_when_no_strategy_sticks():
+    clipboard = Clipboard()
+    ctrl = Edit(clipboard, value_pattern=False, drop=1)
+    ctrl.click_input = None
+    with pytest.raises(TextInputError, match="Could not enter email: value: .*paste: .*keys: read back"):
+        TextEntry(clipboard=clipboard).enter(ctrl, "x@y", name="email")
+    with pytest.raises(ValueError):
+        TextEntry(strategies=("value", "morse"))
+
+
+def test_signup_fills_through_the_value_pattern_and_pastes_the_otp(sim, failures):
+    import test_otpfinal
+    app = sim()
+
+    test_otpfinal.main()
+
+    assert app.stats["accounts_created"] == 1
+    assert failures() == []
+    strategies = {r.name: r.strategy for r in text_input.INPUT_LOG}
+    assert strategies.pop("paste_otp") == "paste"
+    assert set(strategies.values()) == {"value"}
+    assert input_summary().startswith(f"Inputs: {len(text_input.INPUT_LOG)} | paste 1 ")
+
+
+def test_input_summary_covers_only_the_current_run():
+    first = get_recorder().start_run()
+    clipboard = Clipboard()
+    TextEntry(clipboard=clipboard).enter(Edit(clipboard), "ann")
+    get_recorder().start_run()
+    TextEntry(clipboard=clipboard).enter(Edit(clipboard), "lee")
+    TextEntry(clipboard=clipboard).enter(Edit(clipboard), "ava")
+
+    assert input_summary().startswith("Inputs: 2 | value 2 ")
+    assert input_summary(first).startswith("Inputs: 1 | value 1 ")
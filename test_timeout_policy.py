@@ -0,0 +1,106 @@
+import pytest
+
+import step_log
+import timeout_policy
+from step_log import StepRecorder, iter_events
+from timeout_policy import TimeoutPolicy, percentile, set_policy
+from waits import wait_until
+
+
+@pytest.fixture
+def policy():
+    """Install a policy for one test and restore the process-wide one afterwards."""
+    previous = set_policy(TimeoutPolicy())
+
+    def install(p):
+        set_policy(p)
+        return p
+
+    yield install
+    set_policy(previous)
+
+
+def wait_event(name, duration, status="PASS", timeout=15):
+    return {"kind": "wait", "step": name, "duration": duration, "status": status, "timeout": timeout}
+
+
+def test_learns_p99_times_factor_within_floor_and_ceiling(tmp_path):
+    events = [wait_event("submit_signup_done", 0.01 * n) for n in range(1, 101)]
+    events += [wait_event("submit_signup_done", 15.0, "TIMEOUT")]
+    events += [wait_event("window_open", 0.001) for _ in range(30)]
+    events += [wait_event("otp", 80.0, timeout=90) for _ in range(30)]
+    events += [wait_event("rare", 2.0) for _ in range(5)]
+    events += [{"kind": "step", "step": "submit_signup_done", "duration": 99.0, "status": "PASS"}]
+
+    p = TimeoutPolicy.learn(events, factor=3, floor=0.5, ceiling=120, min_samples=20)
+    assert p.timeouts == {"submit_signup_done": 2.97, "window_open": 0.5, "otp": 120}
+    assert p.timeout("rare", 15) == 15
+    assert p.stats["submit_signup_done"] == {"samples": 100, "timeouts": 1, "configured": 15,
+                                             "p50": 0.5, "p99": 0.99}
+    assert percentile([1, 2, 3], 50) == 2 and percentile([7], 99) == 7
+
+    loaded = TimeoutPolicy.load(p.save(str(tmp_path / "policy.json")))
+    assert (loaded.timeouts, loaded.stats, loaded.floor) == (p.timeouts, p.stats, 0.5)
+
+
+def test_named_waits_use_the_learned_timeout(policy, tmp_path, fake_clock):
+    rec = StepRecorder(path=str(tmp_path / "steps.ndjson"), echo=False)
+    previous = step_log.set_recorder(rec)
+    policy(TimeoutPolicy({"dialog_open": 2.0}))
+    try:
+        assert wait_until(lambda: False, timeout=30, name="dialog_open", clock=fake_clock) is None
+        assert fake_clock.now == pytest.approx(2.0)
+        fake_clock.now = 0.0
+        wait_until(lambda: False, timeout=3, clock=fake_clock)  # unnamed: never tuned
+        assert fake_clock.now == pytest.approx(3.0)
+    finally:
+        step_log.set_recorder(previous)
+    rec.flush_all()
+    assert [(e["step"], e["timeout"]) for e in iter_events(rec.path, kind="wait")] == [
+        ("dialog_open", 2.0), ("<lambda>", 3)]
+
+
+def test_policy_learned_from_sim_runs_makes_a_broken_run_fail_fast(sim, policy, monkeypatch, tmp_path, failures):
+    import test_otpfinal
+    for _ in range(3):
+        sim()
+        test_otpfinal.main()
+    assert failures() == []
+
+    monkeypatch.setenv("TIMEOUT_POLICY", str(tmp_path / "policy.json"))
+    timeout_policy.main(["--log", step_log.get_recorder().path, "-o", str(tmp_path / "policy.json"),
+                         "--floor", "0.2", "--min-samples", "3"])
+    set_policy(None)
+    learned = timeout_policy.get_policy()
+    assert learned.timeout("signup_form.submit_signup_done", 15) == 0.2
+    assert "open_create_account.focus_main_window" in learned.timeouts
+    assert "focus_main_window" not in learned.timeouts
+
+    app = sim()
+    monkeypatch.setattr(app, "_submit_signup", lambda ctrl: None)  # the OTP page never opens
+    test_otpfinal.main()
+
+    waits = [e for e in step_log.get_recorder().events(kind="wait")
+             if e["step"] == "signup_form.submit_signup_done"]
+    assert (waits[-1]["status"], waits[-1]["timeout"]) == ("TIMEOUT", 0.2)
+    assert waits[-1]["duration"] < 1
+
+
+def test_otp_poll_keeps_the_callers_max_wait(policy, tmp_path):
+    from otp_providers import OtpProvider
+
+    class EmptyInbox(OtpProvider):
+        name = "empty"
+
+        def check_once(self, mailbox):
+            return None
+
+    rec = StepRecorder(path=str(tmp_path / "steps.ndjson"), echo=False)
+    previous = step_log.set_recorder(rec)
+    policy(TimeoutPolicy({"empty_otp": 0.01}))
+    try:
+        assert EmptyInbox(log=lambda *a: None).fetch_otp("ann.lee", max_wait=0.2, poll_interval=0.05) is None
+    finally:
+        step_log.set_recorder(previous)
+    rec.flush_all()
+    assert [(e["step"], e["timeout"]) for e in iter_events(rec.path, kind="wait")] == [("empty_otp", 0.2)]
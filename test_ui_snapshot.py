@@ -0,0 +1,96 @@
+import copy
+import time
+
+import pytest
+
+import batch_runner
+import flows
+import ui_snapshot
+from locator import HP_ACCOUNT_TITLE, HP_SMART_TITLE
+
+
+@pytest.fixture
+def full_snapshot(sim, monkeypatch):
+    """Snapshot of every page the signup and sign-in scripts visit on the sim."""
+    import new_test
+    import test_otpfinal
+    snapshot = ui_snapshot.new_snapshot(label="sim")
+    run_step = flows.run_step
+
+    def capturing(s, desktop, *args, **kwargs):
+        ui_snapshot.add_captures(snapshot, ui_snapshot.capture(desktop))
+        try:
+            return run_step(s, desktop, *args, **kwargs)
+        finally:
+            ui_snapshot.add_captures(snapshot, ui_snapshot.capture(desktop))
+
+    monkeypatch.setattr(flows, "run_step", capturing)
+    sim()
+    test_otpfinal.main()
+    sim()
+    new_test.main()
+    monkeypatch.setattr(flows, "run_step", run_step)
+    return snapshot
+
+
+def rename(snapshot, auto_id, new_id):
+    changed = copy.deepcopy(snapshot)
+    for w in changed["windows"]:
+        for control in w["controls"]:
+            if control[1] == auto_id:
+                control[1] = new_id
+    return changed
+
+
+def test_every_flow_selector_resolves_in_the_sim_snapshot(full_snapshot):
+    patterns = {w["pattern"] for w in full_snapshot["windows"]}
+    assert patterns == {HP_SMART_TITLE, HP_ACCOUNT_TITLE}
+
+    started = time.perf_counter()
+    results = ui_snapshot.check_selectors(full_snapshot)
+    assert time.perf_counter() - started < 0.5
+    assert len(results) == sum(1 for _ in flows.iter_selectors(flows.FLOWS.values()))
+    assert all(r["found"] for r in results)
+    assert ui_snapshot.problems(results) == []
+
+
+def test_renamed_controls_are_reported_and_diffed(full_snapshot, tmp_path):
+    new = rename(full_snapshot, "sign-up-submit", "signup-submit-v2")
+
+    assert ui_snapshot.problems(ui_snapshot.check_selectors(new)) == [
+        "signup_form.submit_signup: target (auto_id='sign-up-submit', control_type='Button') "
+        "not found in '.*HP account.*'"]
+
+    changes = ui_snapshot.diff(full_snapshot, new)
+    assert changes["removed"] == {HP_ACCOUNT_TITLE: [["Button", "sign-up-submit", "Create"]]}
+    assert changes["added"] == {HP_ACCOUNT_TITLE: [["Button", "signup-submit-v2", "Create"]]}
+    assert changes["broken"] == ["signup_form.submit_signup: target (auto_id='sign-up-submit', control_type='Button')"]
+
+    old_path = ui_snapshot.save(full_snapshot, str(tmp_path / "old.json"))
+    new_path = ui_snapshot.save(new, str(tmp_path / "new.json"))
+    assert ui_snapshot.main(["check", old_path]) == 0
+    assert ui_snapshot.main(["check", new_path]) == 1
+    assert ui_snapshot.main(["diff", old_path, new_path]) == 1
+
+
+def test_windows_that_were_not_captured_are_unchecked(sim):
+    app = sim()
+    app.launch("HP Smart")
+    snapshot = ui_snapshot.new_snapshot()
+    assert ui_snapshot.watch(snapshot, 0, interval=0) == 1
+
+    results = ui_snapshot.check_selectors(snapshot)
+    found = {(r["flow"], r["step"]): r["found"] for r in results if r["role"] == "target"}
+    assert found[("open_create_account", "open_account_flyout")] is True
+    assert found[("open_create_account", "click_create_account")] is False  # flyout not open
+    assert {r["found"] for r in results if r["window"] == HP_ACCOUNT_TITLE} == {None}
+
+
+def test_batch_preflight_refuses_to_start_with_broken_selectors(full_snapshot, tmp_path, capsys):
+    path = ui_snapshot.save(rename(full_snapshot, "HpcSignOutFlyout_CreateBtn", "CreateAccountBtn"),
+                            str(tmp_path / "snap.json"))
+    with pytest.raises(SystemExit) as exit_info:
+        batch_runner.main(["-n", "1", "--stub", "--preflight", path, "-o", str(tmp_path / "out.jsonl")])
+    assert exit_info.value.code == 1
+    assert "open_create_account.click_create_account" in capsys.readouterr().err
+    assert not (tmp_path / "out.jsonl").exists()
@@ -0,0 +1,145 @@
+import pytest
+
+import waits
+from step_log import get_recorder
+from waits import (
+    WaitTimeout, any_of, control_exists, control_gone, wait_ready, wait_until,
+    window_exists, window_title_changes,
+)
+
+
+# -------------------------------------------------------------
+#  FAKES (fake control tree on conftest's fake clock, no Windows needed)
+# -------------------------------------------------------------
+class FakeControl:
+    """Control that appears at `appears_at` and disappears at `gone_at` (fake clock time)."""
+
+    def __init__(self, clock, appears_at=0.0, gone_at=None, title=""):
+        self.clock = clock
+        self.appears_at = appears_at
+        self.gone_at = gone_at
+        self.title = title
+
+    def exists(self, timeout=None):
+        if self.clock.now < self.appears_at:
+            return False
+        return self.gone_at is None or self.clock.now < self.gone_at
+
+    def window_text(self):
+        return self.title
+
+    def wait(self, wait_for, timeout=None):
+        if not self.exists():
+            raise TimeoutError(wait_for)
+        return self
+
+
+class FakeDesktop:
+    def __init__(self, windows):
+        self.windows = windows
+
+    def window(self, title_re):
+        return self.windows[title_re]
+
+
+@pytest.fixture
+def clock(fake_clock):
+    previous = waits.set_clock(fake_clock)
+    waits.reset_wait_log()
+    yield fake_clock
+    waits.set_clock(previous)
+    waits.reset_wait_log()
+
+
+def test_returns_as_soon_as_control_appears(clock):
+    ctrl = FakeControl(clock, appears_at=0.3)
+
+    assert wait_until(control_exists(ctrl), timeout=6, name="otp_screen", replaces=6)
+    record = waits.WAIT_LOG[-1]
+    assert record.ok and record.name == "otp_screen"
+    assert 0.3 <= record.elapsed < 0.5
+    assert record.saved > 5.5
+
+
+def test_backoff_grows_and_is_capped(clock):
+    ctrl = FakeControl(clock, appears_at=100)
+
+    wait_until(control_exists(ctrl), timeout=5, interval=0.1, backoff=2, max_interval=0.5)
+    assert clock.sleeps[:4] == [0.1, 0.2, 0.4, 0.5]
+    assert max(clock.sleeps) == 0.5
+
+
+def test_deadline_is_respected(clock):
+    ctrl = FakeControl(clock, appears_at=100)
+
+    assert wait_until(control_exists(ctrl), timeout=2) is None
+    assert clock.now == pytest.approx(2.0)
+    assert not waits.WAIT_LOG[-1].ok
+
+    with pytest.raises(WaitTimeout):
+        wait_until(control_exists(ctrl), timeout=1, raise_on_timeout=True)
+
+
+def test_condition_errors_count_as_not_ready(clock):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RuntimeError("ElementNotFound")
+        return "message"
+
+    assert wait_until(flaky, timeout=5) == "message"
+    assert waits.WAIT_LOG[-1].polls == 3
+
+
+def test_control_gone_and_title_change(clock):
+    otp_box = FakeControl(clock, gone_at=0.2)
+    win = FakeControl(clock, title="HP account - Sign in")
+
+    assert wait_until(control_gone(otp_box), timeout=4)
+    assert not wait_until(window_title_changes(win, "HP account - Sign in"), timeout=0.5)
+    win.title = "HP Smart"
+    assert wait_until(window_title_changes(win, "HP account - Sign in"), timeout=0.5)
+
+
+def test_window_exists_and_any_of(clock):
+    desktop = FakeDesktop({".*HP account.*": FakeControl(clock, appears_at=1.0)})
+    scan_btn = FakeControl(clock, gone_at=5.0)
+    return_home = FakeControl(clock, appears_at=0.5)
+
+    assert wait_until(window_exists(desktop, ".*HP account.*"), timeout=3)
+    assert 1.0 <= clock.now < 1.5
+    assert wait_until(any_of(control_gone(scan_btn), control_exists(return_home)), timeout=3)
+
+
+def test_wait_ready_records_and_reraises(clock):
+    ready = FakeControl(clock)
+    missing = FakeControl(clock, appears_at=10)
+
+    wait_ready(ready, timeout=5, name="manage_account_button")
+    with pytest.raises(TimeoutError):
+        wait_ready(missing, timeout=5, name="create_account_button")
+    assert [(r.name, r.ok) for r in waits.WAIT_LOG] == [
+        ("manage_account_button", True), ("create_account_button", False),
+    ]
+
+
+def test_wait_summary_reports_saved_time(clock):
+    wait_until(control_exists(FakeControl(clock, appears_at=1)), timeout=10, replaces=5)
+    wait_until(control_exists(FakeControl(clock, appears_at=100)), timeout=2, replaces=6)
+
+    summary = waits.wait_summary()
+    assert "Waits: 2" in summary
+    assert "fixed sleeps replaced 11.0s" in summary
+    assert "timeouts 1" in summary
+
+
+def test_wait_summary_covers_only_the_current_run(clock):
+    first = get_recorder().start_run()
+    wait_until(control_exists(FakeControl(clock, appears_at=1)), timeout=10, replaces=5)
+    get_recorder().start_run()
+    wait_until(control_exists(FakeControl(clock, appears_at=100)), timeout=2, replaces=6)
+
+    assert waits.wait_summary().startswith("Waits: 1 | waited 2.0s")
+    assert waits.wait_summary(first).startswith("Waits: 1 | waited 1.")
@@ -0,0 +1,192 @@
+"""
+Text entry for Edit controls.
+
+The flows used to type every value one synthetic key event per character
+(type_keys / keyboard.send_keys), which is slow for long strings and drops
+characters when the machine is loaded. enter_text() tries the strategies
+fastest first and verifies each by reading the value back:
+
+  value   set the text in one call through the UIA ValuePattern
+          (set_edit_text), no focus or keyboard involved
+  paste   one clipboard copy plus Ctrl+A, Ctrl+V
+  keys    keystrokes, with pywinauto's special characters escaped
+
+The first strategy that verifies on a control is remembered for that
+control, so later inputs go straight to it. A control whose value cannot be
+read back (password fields usually refuse) counts as verified. Every input
+is recorded in INPUT_LOG with its run id (the latest INPUT_LOG_LIMIT are
+kept); input_summary() reports how long the current run's inputs took.
+TEXT_INPUT_STRATEGIES=paste,keys changes the default order.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import ui_backend
+from step_log import get_recorder
+from waits import wait_until
+
+
+STRATEGIES = tuple(s for s in os.environ.get("TEXT_INPUT_STRATEGIES", "value,paste,keys").split(",") if s)
+INPUT_LOG_LIMIT = 10000
+INPUT_LOG = deque(maxlen=INPUT_LOG_LIMIT)
+_INPUT_LOG_LOCK = threading.Lock()
+
+# Characters pywinauto's send_keys treats as modifiers or groups
+_SPECIAL_KEYS = re.compile(r"([+^%~(){}\[\]])")
+_UNREADABLE = object()
+
+
+class TextInputError(RuntimeError):
+    """No strategy managed to set (and verify) the value."""
+
+
+class InputRecord:
+    """How one value was entered: strategy, time taken and strategies that failed first."""
+
+    __slots__ = ("name", "strategy", "elapsed", "verified", "failed", "run")
+
+    def __init__(self, name, strategy, elapsed, verified, failed, run=None):
+        self.name = name
+        self.strategy = strategy
+        self.elapsed = elapsed
+        self.verified = verified
+        self.failed = failed
+        self.run = run
+
+    def as_dict(self):
+        return {"name": self.name, "strategy": self.strategy, "elapsed": round(self.elapsed, 4),
+                "verified": self.verified, "failed": list(self.failed), "run": self.run}
+
+    def __repr__(self):
+        return f"InputRecord({self.name!r}, {self.strategy!r}, elapsed={self.elapsed:.4f})"
+
+
+def reset_input_log():
+    with _INPUT_LOG_LOCK:
+        INPUT_LOG.clear()
+
+
+def input_summary(run_id=None):
+    """One-line summary of the current run's inputs (or `run_id`'s), suitable for log_step()."""
+    run_id = run_id or get_recorder().current_run_id()
+    with _INPUT_LOG_LOCK:
+        records = [r for r in INPUT_LOG if r.run == run_id]
+    by_strategy = {}
+    for r in records:
+        by_strategy.setdefault(r.strategy, []).append(r.elapsed)
+    parts = [f"{name} {len(times)} ({sum(times) / len(times) * 1000:.1f} ms avg)"
+             for name, times in sorted(by_strategy.items())]
+    fallbacks = sum(1 for r in records if r.failed)
+    unverified = sum(1 for r in records if r.verified is None)
+    return (f"Inputs: {len(records)} | {' | '.join(parts) or 'none'} | "
+            f"fallbacks {fallbacks} | unverified {unverified}")
+
+
+# -------------------------------------------------------------
+#  STRATEGIES
+# -------------------------------------------------------------
+def escape_keys(text):
+    """Escape `text` so send_keys/type_keys types it literally."""
+    return _SPECIAL_KEYS.sub(r"{\1}", text)
+
+
+def read_value(ctrl):
+    """The control's current text, or _UNREADABLE when it cannot be read."""
+    try:
+        getter = getattr(ctrl, "get_value", None) or ctrl.window_text
+        return getter()
+    except Exception:
+        return _UNREADABLE
+
+
+def _set_value(ctrl, text, clipboard):
+    ctrl.set_edit_text(text)
+
+
+def _paste(ctrl, text, clipboard):
+    clipboard.copy(text)
+    if not wait_until(lambda: clipboard.paste() == text, timeout=2, name="clipboard_ready", replaces=1):
+        raise TextInputError("clipboard did not take the value")
+    ctrl.click_input()
+    ctrl.type_keys("^a^v")
+
+
+def _keys(ctrl, text, clipboard):
+    current = read_value(ctrl)
+    if current is _UNREADABLE or current:
+        ctrl.type_keys("^a{BACKSPACE}")
+    ctrl.type_keys(escape_keys(text), with_spaces=True)
+
+
+STRATEGY_FUNCTIONS = {"value": _set_value, "paste": _paste, "keys": _keys}
+
+
+# -------------------------------------------------------------
+#  ENTRY
+# -------------------------------------------------------------
+class TextEntry:
+    """Strategy chooser with a per-control memory of what worked."""
+
+    def __init__(self, strategies=STRATEGIES, clipboard=None, clock=time.monotonic):
+        unknown = [s for s in strategies if s not in STRATEGY_FUNCTIONS]
+        if unknown:
+            raise ValueError(f"Unknown text input strategies {unknown}, expected {sorted(STRATEGY_FUNCTIONS)}")
+        self.strategies = tuple(strategies)
+        self.clipboard = clipboard
+        self.clock = clock
+        self._preferred = {}
+        self._lock = threading.Lock()
+
+    def forget(self):
+        """Drop the remembered per-control strategies."""
+        with self._lock:
+            self._preferred.clear()
+
+    def _order(self, key, strategies):
+        with self._lock:
+            preferred = self._preferred.get(key)
+        if preferred in strategies:
+            return (preferred,) + tuple(s for s in strategies if s != preferred)
+        return strategies
+
+    def enter(self, ctrl, text, name=None, key=None, strategies=None):
+        """
+        Set `ctrl`'s text to `text` and return its InputRecord. `key`
+        identifies the control across calls (a selector description);
+        without it the strategy choice is not remembered.
+        """
+        strategies = tuple(strategies or self.strategies)
+        clipboard = self.clipboard or ui_backend.clipboard
+        failed = []
+        start = self.clock()
+        for strategy in self._order(key, strategies):
+            try:
+                STRATEGY_FUNCTIONS[strategy](ctrl, text, clipboard)
+            except Exception as e:
+                failed.append(f"{strategy}: {e}")
+                continue
+            value = read_value(ctrl)
+            if value is not _UNREADABLE and value != text:
+                failed.append(f"{strategy}: read back {len(value or '')} of {len(text)} characters")
+                continue
+            if key is not None:
+                with self._lock:
+                    self._preferred[key] = strategy
+            record = InputRecord(name, strategy, self.clock() - start,
+                                 None if value is _UNREADABLE else True, tuple(failed),
+                                 get_recorder().current_run_id())
+            with _INPUT_LOG_LOCK:
+                INPUT_LOG.append(record)
+            return record
+        raise TextInputError(f"Could not enter {name or 'text'}: " + "; ".join(failed))
+
+
+TEXT_ENTRY = TextEntry()
+
+
+def enter_text(ctrl, text, name=None, key=None, strategies=None):
+    """Enter `text` into `ctrl` with the shared TextEntry (see TextEntry.enter)."""
+    return TEXT_ENTRY.enter(ctrl, text, name=name, key=key, strategies=strategies)
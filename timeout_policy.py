@@ -0,0 +1,171 @@
+"""
+Timeouts learned from recorded runs.
+
+The waits used to run with hard-coded timeouts (30 s for windows, 15 s for
+buttons, 90 s for the OTP), which are far too long to notice a real failure
+on a fast machine and too short on a loaded one. Every named wait is already
+recorded in the step log with its duration, so the timeout of a wait can be
+derived from how long it took when it succeeded:
+
+    timeout = p99 of successful durations * factor, clamped to [floor, ceiling]
+
+Names with fewer than `min_samples` successes keep their hard-coded timeout.
+wait_until() and wait_ready() look the policy up for every wait that is
+given an explicit name (flow steps as "<flow>.<step>", the sign-in browser
+window), so the flows pick it up without changes. The OTP poll is recorded
+but keeps the caller's max_wait.
+
+    python timeout_policy.py [--log automation_steps.ndjson ...] [-o timeout_policy.json]
+                             [--factor 3] [--floor 1] [--ceiling 180] [--min-samples 20]
+
+TIMEOUT_POLICY points at the policy file (default timeout_policy.json; the
+hard-coded timeouts are used while it does not exist); TIMEOUT_POLICY=off
+disables it.
+"""
+import argparse
+import json
+import os
+import threading
+
+from step_log import DEFAULT_PATH, iter_events
+
+
+DEFAULT_POLICY_PATH = "timeout_policy.json"
+DEFAULT_FACTOR = 3.0
+DEFAULT_FLOOR = 1.0
+DEFAULT_CEILING = 180.0
+DEFAULT_MIN_SAMPLES = 20
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class TimeoutPolicy:
+    """Per-wait-name timeouts; names it does not know keep their default."""
+
+    def __init__(self, timeouts=None, stats=None, factor=DEFAULT_FACTOR, floor=DEFAULT_FLOOR,
+                 ceiling=DEFAULT_CEILING, min_samples=DEFAULT_MIN_SAMPLES):
+        self.timeouts = dict(timeouts or {})
+        self.stats = dict(stats or {})
+        self.factor = factor
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+
+    def __len__(self):
+        return len(self.timeouts)
+
+    def timeout(self, name, default):
+        return self.timeouts.get(name, default)
+
+    @classmethod
+    def learn(cls, events, factor=DEFAULT_FACTOR, floor=DEFAULT_FLOOR, ceiling=DEFAULT_CEILING,
+              min_samples=DEFAULT_MIN_SAMPLES):
+        """Build a policy from the "wait" events in `events` (timed-out waits are not samples)."""
+        durations, timeouts, configured = {}, {}, {}
+        for event in events:
+            if event.get("kind") != "wait":
+                continue
+            name = event["step"]
+            if event.get("timeout") is not None:
+                configured[name] = event["timeout"]
+            if event.get("status") == "PASS":
+                durations.setdefault(name, []).append(event.get("duration", 0.0))
+            else:
+                timeouts[name] = timeouts.get(name, 0) + 1
+
+        learned, stats = {}, {}
+        for name in sorted(set(durations) | set(timeouts)):
+            samples = sorted(durations.get(name, ()))
+            entry = {"samples": len(samples), "timeouts": timeouts.get(name, 0),
+                     "configured": configured.get(name)}
+            if samples:
+                p99 = percentile(samples, 99)
+                entry.update(p50=round(percentile(samples, 50), 4), p99=round(p99, 4))
+                if len(samples) >= min_samples:
+                    learned[name] = round(min(ceiling, max(floor, p99 * factor)), 3)
+            stats[name] = entry
+        return cls(learned, stats, factor, floor, ceiling, min_samples)
+
+    def as_dict(self):
+        return {"factor": self.factor, "floor": self.floor, "ceiling": self.ceiling,
+                "min_samples": self.min_samples, "timeouts": self.timeouts, "stats": self.stats}
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(self.as_dict(), fh, indent=2, sort_keys=True)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data.get("timeouts"), data.get("stats"), data.get("factor", DEFAULT_FACTOR),
+                   data.get("floor", DEFAULT_FLOOR), data.get("ceiling", DEFAULT_CEILING),
+                   data.get("min_samples", DEFAULT_MIN_SAMPLES))
+
+
+# -------------------------------------------------------------
+#  PROCESS-WIDE POLICY
+# -------------------------------------------------------------
+_POLICY = None
+_POLICY_LOCK = threading.Lock()
+
+
+def get_policy():
+    """The policy from TIMEOUT_POLICY, loaded once; empty when the file is missing or disabled."""
+    global _POLICY
+    with _POLICY_LOCK:
+        if _POLICY is None:
+            path = os.environ.get("TIMEOUT_POLICY", DEFAULT_POLICY_PATH)
+            if path and path != "off" and os.path.exists(path):
+                _POLICY = TimeoutPolicy.load(path)
+            else:
+                _POLICY = TimeoutPolicy()
+        return _POLICY
+
+
+def set_policy(policy):
+    """Install `policy` (None reloads from TIMEOUT_POLICY on next use) and return the old one."""
+    global _POLICY
+    with _POLICY_LOCK:
+        previous = _POLICY
+        _POLICY = policy
+    return previous
+
+
+def tuned_timeout(name, default):
+    """The learned timeout for the wait called `name`, or `default`."""
+    return get_policy().timeout(name, default)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Learn wait timeouts from recorded step logs.")
+    parser.add_argument("--log", action="append", help=f"NDJSON step log (default {DEFAULT_PATH})")
+    parser.add_argument("-o", "--output", default=DEFAULT_POLICY_PATH)
+    parser.add_argument("--factor", type=float, default=DEFAULT_FACTOR, help="multiplier on p99")
+    parser.add_argument("--floor", type=float, default=DEFAULT_FLOOR, help="shortest timeout (s)")
+    parser.add_argument("--ceiling", type=float, default=DEFAULT_CEILING, help="longest timeout (s)")
+    parser.add_argument("--min-samples", type=int, default=DEFAULT_MIN_SAMPLES,
+                        help="successful waits needed before a name is tuned")
+    args = parser.parse_args(argv)
+
+    def events():
+        for path in args.log or [DEFAULT_PATH]:
+            yield from iter_events(path, kind="wait")
+
+    policy = TimeoutPolicy.learn(events(), args.factor, args.floor, args.ceiling, args.min_samples)
+    policy.save(args.output)
+    for name, entry in policy.stats.items():
+        tuned = policy.timeouts.get(name)
+        print(f"{name:45s} n={entry['samples']:<6d} p99={entry.get('p99', '-')!s:8s} "
+              f"{entry['configured']!s:>6s} -> {tuned if tuned is not None else 'unchanged'}")
+    print(f"{len(policy)} of {len(policy.stats)} waits tuned, written to {args.output}")
+    return policy
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+UI backend selection.
+
+The scripts and flows talk to the desktop through this module instead of
+importing pywinauto directly:
+
+    from ui_backend import Desktop, keyboard, clipboard
+
+HP_SMART_BACKEND picks the implementation:
+
+    uia  (default)  pywinauto UIA + pyperclip, the real HP Smart on Windows
+    sim             sim_ui.SimApp, an in-memory HP Smart for headless runs
+    replay          a cassette recorded from an earlier run (record_replay.py)
+
+All expose the same desktop.window(...).child_window(...) API, so the flow
+definitions and script functions run unchanged on any of them. With
+HP_SMART_RECORD=cassette.json the chosen backend is wrapped in a recorder
+that writes that cassette when the process exits.
+"""
+import os
+import threading
+
+
+# -------------------------------------------------------------
+#  BACKENDS
+# -------------------------------------------------------------
+class UiaBackend:
+    """The real desktop through pywinauto's UIA backend (imported on first use)."""
+
+    name = "uia"
+
+    def __init__(self):
+        self._desktop = None
+
+    def desktop(self):
+        if self._desktop is None:
+            from pywinauto import Desktop as PywinautoDesktop
+            self._desktop = PywinautoDesktop(backend="uia")
+        return self._desktop
+
+    def send_keys(self, keys, **kwargs):
+        from pywinauto import keyboard as pywinauto_keyboard
+        pywinauto_keyboard.send_keys(keys, **kwargs)
+
+    def copy(self, text):
+        import pyperclip
+        pyperclip.copy(text)
+
+    def paste(self):
+        import pyperclip
+        return pyperclip.paste()
+
+
+class SimBackend:
+    """The simulated HP Smart from sim_ui.py."""
+
+    name = "sim"
+
+    def __init__(self, app=None):
+        from sim_ui import SimApp, SimConfig, SimDesktop
+        self.app = app or SimApp(SimConfig.from_env())
+        self._desktop = SimDesktop(self.app)
+
+    def desktop(self):
+        return self._desktop
+
+    def send_keys(self, keys, **kwargs):
+        self.app.send_keys(keys)
+
+    def copy(self, text):
+        self.app.clipboard = text
+
+    def paste(self):
+        return self.app.clipboard
+
+
+def _replay_backend():
+    from record_replay import ReplayBackend
+    return ReplayBackend.from_env()
+
+
+BACKENDS = {"uia": UiaBackend, "sim": SimBackend, "replay": _replay_backend}
+
+_BACKEND = None
+_LOCK = threading.Lock()
+
+
+def backend_name():
+    return os.environ.get("HP_SMART_BACKEND", "uia").lower()
+
+
+def get_backend():
+    """The active backend, created from HP_SMART_BACKEND on first use."""
+    global _BACKEND
+    with _LOCK:
+        if _BACKEND is None:
+            name = backend_name()
+            if name not in BACKENDS:
+                raise ValueError(f"Unknown HP_SMART_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+            _BACKEND = BACKENDS[name]()
+            record = os.environ.get("HP_SMART_RECORD")
+            if record:
+                from record_replay import RecordingBackend
+                _BACKEND = RecordingBackend(_BACKEND, record)
+        return _BACKEND
+
+
+def set_backend(backend):
+    """Install `backend` (None resets to HP_SMART_BACKEND); returns the previous one."""
+    global _BACKEND
+    with _LOCK:
+        previous, _BACKEND = _BACKEND, backend
+    return previous
+
+
+# -------------------------------------------------------------
+#  SCRIPT-FACING API
+# -------------------------------------------------------------
+def Desktop(backend="uia"):
+    """Drop-in for pywinauto.Desktop(backend="uia"); returns the active backend's desktop."""
+    return get_backend().desktop()
+
+
+class _Keyboard:
+    def send_keys(self, keys, **kwargs):
+        get_backend().send_keys(keys, **kwargs)
+
+
+class _Clipboard:
+    def copy(self, text):
+        get_backend().copy(text)
+
+    def paste(self):
+        return get_backend().paste()
+
+
+keyboard = _Keyboard()
+clipboard = _Clipboard()
@@ -0,0 +1,267 @@
+"""
+UI tree snapshots and offline selector checks.
+
+A renamed automation id in a new HP Smart build used to show up only as a
+15-30 s wait timeout in the middle of a run, followed by a descendants()
+fallback scan. This module captures the HP Smart and HP account window trees
+into a JSON snapshot (auto_id, title and control_type of every control, in
+tree order) and checks every selector the flows use against it without
+touching the UI, in milliseconds:
+
+    python ui_snapshot.py capture -o hp_smart.json [--append] [--label 5.4.1]
+    python ui_snapshot.py capture -o hp_smart.json --watch 120
+    python ui_snapshot.py check hp_smart.json
+    python ui_snapshot.py diff old.json new.json
+
+The HP account window shows a different page at each stage, so a snapshot
+holds several captures. --append adds the page on screen to an existing
+snapshot; --watch keeps capturing every new page while a signup runs.
+batch_runner.py --preflight SNAPSHOT refuses to start a batch whose flows
+would not find their controls.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import ui_backend
+from flows import FLOWS, iter_selectors
+from locator import HP_ACCOUNT_TITLE, HP_SMART_TITLE, ControlIndex
+
+
+FORMAT_VERSION = 1
+PATTERNS = (HP_SMART_TITLE, HP_ACCOUNT_TITLE)
+
+
+# -------------------------------------------------------------
+#  CAPTURE
+# -------------------------------------------------------------
+def _read(ctrl):
+    info = ctrl.element_info
+    return [info.control_type or "", info.automation_id or "", (info.name or "").strip()]
+
+
+def capture_window(window, pattern):
+    """One capture: the window's title and its descendants as [control_type, auto_id, title]."""
+    return {"pattern": pattern, "title": window.window_text(),
+            "controls": [_read(ctrl) for ctrl in window.descendants()]}
+
+
+def new_snapshot(label=None):
+    return {"version": FORMAT_VERSION, "label": label, "captured": time.time(), "windows": []}
+
+
+def add_captures(snapshot, captures):
+    """Add captures not already in `snapshot`; return how many were new."""
+    seen = {(w["pattern"], json.dumps(w["controls"])) for w in snapshot["windows"]}
+    added = 0
+    for c in captures:
+        key = (c["pattern"], json.dumps(c["controls"]))
+        if key not in seen:
+            seen.add(key)
+            snapshot["windows"].append(c)
+            added += 1
+    return added
+
+
+def capture(desktop=None, patterns=PATTERNS):
+    """Capture every open top-level window whose title matches one of `patterns`."""
+    desktop = desktop or ui_backend.Desktop()
+    captures = []
+    for window in desktop.windows():
+        try:
+            title = window.window_text()
+        except Exception:
+            continue
+        pattern = next((p for p in patterns if re.match(p, title)), None)
+        if pattern is not None:
+            try:
+                captures.append(capture_window(window, pattern))
+            except Exception:
+                continue  # closed while we were reading it
+    return captures
+
+
+def watch(snapshot, duration, desktop=None, interval=0.25, patterns=PATTERNS, clock=time.monotonic):
+    """Keep adding new captures to `snapshot` for `duration` seconds; return how many were added."""
+    deadline = clock() + duration
+    added = 0
+    while True:
+        added += add_captures(snapshot, capture(desktop, patterns))
+        if clock() >= deadline:
+            return added
+        time.sleep(interval)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as fh:
+        snapshot = json.load(fh)
+    if snapshot.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported snapshot version {snapshot.get('version')!r}")
+    return snapshot
+
+
+def save(snapshot, path):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(snapshot, fh, indent=1)
+    return path
+
+
+# -------------------------------------------------------------
+#  OFFLINE SELECTOR CHECK
+# -------------------------------------------------------------
+class _Info:
+    """Captured control that looks enough like a wrapper for ControlIndex."""
+
+    __slots__ = ("control_type", "automation_id", "name")
+
+    def __init__(self, control_type, auto_id, title):
+        self.control_type = control_type
+        self.automation_id = auto_id
+        self.name = title
+
+    @property
+    def element_info(self):
+        return self
+
+
+def _indexes(snapshot):
+    return [(w["title"], ControlIndex([_Info(*c) for c in w["controls"]], built_at=0))
+            for w in snapshot["windows"]]
+
+
+def _matches(index, sel):
+    """Same rules as at run time: child_window() criteria, or find_text() for text selectors."""
+    if sel.text:
+        return index.find_text(sel.text, control_type=sel.control_type) is not None
+    found = index.find_all(auto_id=sel.auto_id, title=sel.title, control_type=sel.control_type)
+    return len(found) > (sel.found_index or 0)
+
+
+def check_selectors(snapshot, flows=None):
+    """
+    One result per selector the flows use: {"flow", "step", "role", "window",
+    "selector", "found"}. `found` is None when no captured window matches the
+    step's window pattern, so the selector could not be checked.
+    """
+    indexes = _indexes(snapshot)
+    results = []
+    for flow, s, window, sel in iter_selectors(flows if flows is not None else FLOWS.values()):
+        if sel is s.target:
+            role = "target"
+        elif any(sel is fb for fb in s.fallbacks):
+            role = "fallback"
+        else:
+            role = "wait"
+        candidates = [index for title, index in indexes if re.match(window, title)]
+        found = any(_matches(index, sel) for index in candidates) if candidates else None
+        results.append({"flow": flow.name, "step": s.name, "role": role, "window": window,
+                        "selector": sel.describe(), "found": found})
+    return results
+
+
+def problems(results):
+    """Messages for targets and wait selectors that no capture contains; unused fallbacks are not problems."""
+    rescued = {(r["flow"], r["step"]) for r in results if r["role"] == "fallback" and r["found"]}
+    messages = []
+    for r in results:
+        if r["found"] is not False or r["role"] == "fallback":
+            continue
+        message = f"{r['flow']}.{r['step']}: {r['role']} ({r['selector']}) not found in {r['window']!r}"
+        if r["role"] == "target" and (r["flow"], r["step"]) in rescued:
+            message += " (a fallback matches, after the primary wait times out)"
+        messages.append(message)
+    return messages
+
+
+def preflight(path, flows=None):
+    """Problems with the flows' selectors against the snapshot at `path` (empty when all resolve)."""
+    return problems(check_selectors(load(path), flows))
+
+
+# -------------------------------------------------------------
+#  DIFF
+# -------------------------------------------------------------
+def _controls_by_pattern(snapshot):
+    """{pattern: Counter of controls}, taking the largest count any one capture has."""
+    by_pattern = {}
+    for w in snapshot["windows"]:
+        controls = Counter(tuple(c) for c in w["controls"])
+        by_pattern[w["pattern"]] = by_pattern.get(w["pattern"], Counter()) | controls
+    return by_pattern
+
+
+def diff(old, new, flows=None):
+    """Controls added/removed per window pattern, and selectors that resolve in `old` but not in `new`."""
+    before, after = _controls_by_pattern(old), _controls_by_pattern(new)
+    result = {"added": {}, "removed": {}, "broken": []}
+    for pattern in sorted(set(before) | set(after)):
+        old_controls, new_controls = before.get(pattern, Counter()), after.get(pattern, Counter())
+        added = sorted((new_controls - old_controls).elements())
+        removed = sorted((old_controls - new_controls).elements())
+        if added:
+            result["added"][pattern] = [list(c) for c in added]
+        if removed:
+            result["removed"][pattern] = [list(c) for c in removed]
+    old_found = {(r["flow"], r["step"], r["selector"]): r["found"] for r in check_selectors(old, flows)}
+    for r in check_selectors(new, flows):
+        if old_found.get((r["flow"], r["step"], r["selector"])) and r["found"] is False:
+            result["broken"].append(f"{r['flow']}.{r['step']}: {r['role']} ({r['selector']})")
+    return result
+
+
+# -------------------------------------------------------------
+#  CLI
+# -------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Capture, check and diff HP Smart UI tree snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cap = commands.add_parser("capture", help="capture the open HP Smart / HP account windows")
+    cap.add_argument("-o", "--output", default="ui_snapshot.json")
+    cap.add_argument("--append", action="store_true", help="add to an existing snapshot")
+    cap.add_argument("--label", help="app version or build the snapshot was taken from")
+    cap.add_argument("--watch", type=float, default=0, help="keep capturing new pages for N seconds")
+    chk = commands.add_parser("check", help="check every flow selector against a snapshot")
+    chk.add_argument("snapshot")
+    chk.add_argument("-v", "--verbose", action="store_true", help="list every selector")
+    dif = commands.add_parser("diff", help="compare two snapshots")
+    dif.add_argument("old")
+    dif.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "capture":
+        snapshot = load(args.output) if args.append and os.path.exists(args.output) else new_snapshot()
+        snapshot["label"] = args.label or snapshot.get("label")
+        if args.watch:
+            added = watch(snapshot, args.watch)
+        else:
+            added = add_captures(snapshot, capture())
+        save(snapshot, args.output)
+        print(f"{added} new capture(s), {len(snapshot['windows'])} in {args.output}")
+        return 0
+
+    if args.command == "check":
+        started = time.perf_counter()
+        results = check_selectors(load(args.snapshot))
+        messages = problems(results)
+        if args.verbose:
+            for r in results:
+                status = {True: "ok", False: "MISSING", None: "unchecked"}[r["found"]]
+                print(f"{status:9s} {r['flow']}.{r['step']} {r['role']} ({r['selector']})")
+        for message in messages:
+            print(f"BROKEN {message}")
+        unchecked = sum(r["found"] is None for r in results)
+        print(f"{len(results)} selectors, {len(messages)} broken, {unchecked} unchecked "
+              f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+        return 1 if messages else 0
+
+    result = diff(load(args.old), load(args.new))
+    print(json.dumps(result, indent=2))
+    return 1 if result["broken"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
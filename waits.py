@@ -0,0 +1,280 @@
+"""
+Event-driven waits for the HP Smart automation.
+
+Instead of sleeping a fixed number of seconds after every click, the flows
+poll a condition (a control exists, a window title changes, the inbox has a
+message) with adaptive backoff until it holds or a deadline passes.
+
+Every wait is recorded in WAIT_LOG together with the fixed sleep it replaced
+and the run it belongs to, so a run can report how much dead time it got
+back, and in the step log as waiting time of the enclosing step. WAIT_LOG
+only keeps the latest WAIT_LOG_LIMIT waits; the step log keeps them all. Waits given an explicit name use the
+timeout learned for that name (timeout_policy.py) instead of the one passed.
+Background work can be called off with cancel_waits_on(): its waits then
+raise StepCancelled instead of running out.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+
+from step_log import StepCancelled, get_recorder, record_wait
+from timeout_policy import tuned_timeout
+
+
+WAIT_LOG_LIMIT = 10000
+WAIT_LOG = deque(maxlen=WAIT_LOG_LIMIT)
+_WAIT_LOG_LOCK = threading.Lock()
+_CANCEL = contextvars.ContextVar("waits_cancel", default=None)
+
+
+class WaitTimeout(TimeoutError):
+    """Raised by wait_until(..., raise_on_timeout=True) when the deadline passes."""
+
+
+# -------------------------------------------------------------
+#  CLOCK
+# -------------------------------------------------------------
+class SystemClock:
+    """Real monotonic clock. Tests swap in a fake one via set_clock()."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+_CLOCK = SystemClock()
+
+
+def set_clock(clock):
+    """Install a clock (anything with monotonic() and sleep()) and return the old one."""
+    global _CLOCK
+    previous = _CLOCK
+    _CLOCK = clock
+    return previous
+
+
+def get_clock():
+    return _CLOCK
+
+
+# -------------------------------------------------------------
+#  CANCELLATION
+# -------------------------------------------------------------
+def cancel_waits_on(event):
+    """Make every later wait in the current context raise StepCancelled once `event` is set."""
+    _CANCEL.set(event)
+
+
+def check_cancelled():
+    """Raise StepCancelled if the current context's cancel event is set."""
+    event = _CANCEL.get()
+    if event is not None and event.is_set():
+        raise StepCancelled("wait cancelled")
+
+
+def _sleep(clock, seconds):
+    event = _CANCEL.get()
+    if event is not None and isinstance(clock, SystemClock):
+        event.wait(seconds)
+    else:
+        clock.sleep(seconds)
+
+
+# -------------------------------------------------------------
+#  WAIT RECORDS
+# -------------------------------------------------------------
+class WaitRecord:
+    """Outcome of a single wait: how long it really took and what it replaced."""
+
+    __slots__ = ("name", "elapsed", "timeout", "replaces", "polls", "ok", "run")
+
+    def __init__(self, name, elapsed, timeout, replaces, polls, ok, run=None):
+        self.name = name
+        self.elapsed = elapsed
+        self.timeout = timeout
+        self.replaces = replaces
+        self.polls = polls
+        self.ok = ok
+        self.run = run
+
+    @property
+    def saved(self):
+        """Seconds won back compared to the fixed sleep this wait replaced."""
+        if self.replaces is None:
+            return 0.0
+        return self.replaces - self.elapsed
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "elapsed": round(self.elapsed, 4),
+            "timeout": self.timeout,
+            "replaces": self.replaces,
+            "polls": self.polls,
+            "ok": self.ok,
+            "run": self.run,
+        }
+
+    def __repr__(self):
+        return (f"WaitRecord({self.name!r}, elapsed={self.elapsed:.3f}, "
+                f"ok={self.ok}, polls={self.polls})")
+
+
+def _record(record, start):
+    record.run = get_recorder().current_run_id()
+    with _WAIT_LOG_LOCK:
+        WAIT_LOG.append(record)
+    record_wait(record.name, start, start + record.elapsed, record.ok, record.timeout)
+    return record
+
+
+def reset_wait_log():
+    with _WAIT_LOG_LOCK:
+        WAIT_LOG.clear()
+
+
+def wait_summary(run_id=None):
+    """One-line summary of the current run's waits (or `run_id`'s), suitable for log_step()."""
+    run_id = run_id or get_recorder().current_run_id()
+    with _WAIT_LOG_LOCK:
+        records = [r for r in WAIT_LOG if r.run == run_id]
+    waited = sum(r.elapsed for r in records)
+    replaced = sum(r.replaces for r in records if r.replaces is not None)
+    saved = sum(r.saved for r in records)
+    timeouts = sum(1 for r in records if not r.ok)
+    return (f"Waits: {len(records)} | waited {waited:.1f}s | "
+            f"fixed sleeps replaced {replaced:.1f}s | saved {saved:.1f}s | "
+            f"timeouts {timeouts}")
+
+
+# -------------------------------------------------------------
+#  CORE POLLING LOOP
+# -------------------------------------------------------------
+def wait_until(condition, timeout=10, name=None, replaces=None,
+               interval=0.05, max_interval=1.0, backoff=1.5,
+               raise_on_timeout=False, tune=True, clock=None):
+    """
+    Poll `condition()` until it returns a truthy value or `timeout` expires.
+
+    The poll interval starts at `interval` and grows by `backoff` up to
+    `max_interval`, so fast transitions are picked up within tens of
+    milliseconds while slow ones do not hammer the UIA tree. Exceptions
+    raised by the condition count as "not yet". A cancelled context (see
+    cancel_waits_on) ends the wait with StepCancelled.
+
+    Returns the condition's truthy value, or None on timeout (unless
+    `raise_on_timeout` is set). `replaces` is the fixed sleep this wait
+    stands in for; it is only used for the time-saved summary. A timeout
+    learned for an explicit `name` (timeout_policy.py) takes the place of
+    `timeout` unless `tune` is off, for budgets the caller chose itself.
+    """
+    clock = clock or _CLOCK
+    if name is not None and tune:
+        timeout = tuned_timeout(name, timeout)
+    name = name or getattr(condition, "__name__", "condition")
+    start = clock.monotonic()
+    deadline = start + timeout
+    polls = 0
+    delay = interval
+
+    while True:
+        check_cancelled()
+        polls += 1
+        try:
+            result = condition()
+        except Exception:
+            result = None
+        now = clock.monotonic()
+        if result:
+            _record(WaitRecord(name, now - start, timeout, replaces, polls, True), start)
+            return result
+        if now >= deadline:
+            break
+        _sleep(clock, min(delay, deadline - now))
+        delay = min(delay * backoff, max_interval)
+
+    _record(WaitRecord(name, clock.monotonic() - start, timeout, replaces, polls, False), start)
+    if raise_on_timeout:
+        raise WaitTimeout(f"Timed out after {timeout}s waiting for {name}")
+    return None
+
+
+def wait_ready(spec, wait_for="visible enabled ready", timeout=30, name=None, clock=None):
+    """
+    Run pywinauto's own `spec.wait(...)` and record how long it really took.
+
+    pywinauto already polls internally; this only adds the bookkeeping so
+    these waits show up next to the wait_until() ones.
+    """
+    clock = clock or _CLOCK
+    if name is not None:
+        timeout = tuned_timeout(name, timeout)
+    name = name or wait_for
+    start = clock.monotonic()
+    try:
+        result = spec.wait(wait_for, timeout=timeout)
+    except Exception:
+        _record(WaitRecord(name, clock.monotonic() - start, timeout, None, 1, False), start)
+        raise
+    _record(WaitRecord(name, clock.monotonic() - start, timeout, None, 1, True), start)
+    return result
+
+
+# -------------------------------------------------------------
+#  CONDITIONS
+# -------------------------------------------------------------
+def _exists_now(spec):
+    try:
+        return bool(spec.exists(timeout=0))
+    except Exception:
+        return False
+
+
+def control_exists(spec):
+    """Condition: the control described by a pywinauto spec is present."""
+    def condition():
+        return _exists_now(spec)
+    condition.__name__ = "control_exists"
+    return condition
+
+
+def control_gone(spec):
+    """Condition: the control described by a pywinauto spec has disappeared."""
+    def condition():
+        return not _exists_now(spec)
+    condition.__name__ = "control_gone"
+    return condition
+
+
+def window_exists(desktop, title_re):
+    """Condition: a top-level window whose title matches `title_re` is present."""
+    def condition():
+        return _exists_now(desktop.window(title_re=title_re))
+    condition.__name__ = "window_exists"
+    return condition
+
+
+def window_title_changes(window, old_title):
+    """Condition: `window.window_text()` no longer equals `old_title`."""
+    def condition():
+        return window.window_text() != old_title
+    condition.__name__ = "window_title_changes"
+    return condition
+
+
+def any_of(*conditions):
+    """Condition: the first truthy result of any of `conditions`."""
+    def condition():
+        for cond in conditions:
+            try:
+                result = cond()
+            except Exception:
+                result = None
+            if result:
+                return result
+        return None
+    condition.__name__ = "any_of"
+    return condition